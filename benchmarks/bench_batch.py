@@ -0,0 +1,122 @@
+"""
+Batch mode throughput: batched router generation and concurrent CLI tasks.
+
+1. Routing: a random-weight Llama over a byte vocabulary (a real transformers model, so
+   padded batched forward passes run for real) answers the router prompt for `--queries`
+   queries through `route_batch`, one chat at a time vs `--batch-size` per forward pass.
+2. CLI tasks: `run_batch` end to end over a scripted Gemini backend with per-call latency and
+   a fake shell with per-command latency; every query becomes a CLI task, run one at a time
+   vs `--jobs` at once.
+
+Reports queries/s and tokens/s for each configuration.
+
+    python -m benchmarks.bench_batch [--queries 16] [--batch-size 8] [--tokens 32] [--jobs 4]
+"""
+import os
+
+# Headless, no quota sleeps, every task asked of the model. Must be set before pulse modules read their config.
+os.environ.setdefault("PULSE_TTS_BACKEND", "null")
+os.environ.setdefault("GEMINI_RPM", "1000000")
+os.environ.setdefault("GEMINI_TPM", "1000000000")
+os.environ.setdefault("PULSE_TRAJECTORY_CACHE", "0")
+
+import argparse
+import contextlib
+import io
+import json
+import tempfile
+import time
+
+from benchmarks.fakes import FakeGenAI, FakeShellSession, TinyLlamaPipeline
+from pulse_brain.batch_runner import route_batch, run_batch
+from pulse_brain.gemini_session import get_gemini_pool
+from pulse_brain.local_engine import get_local_engine
+from pulse_config.config import CLI_AGENT_SYSTEM_PROMPT, GEMINI_MODEL_ID, ROUTER_SYSTEM_PROMPT
+
+AGENT_STEPS = 2
+
+def router_histories(count):
+    return [
+        [{"role": "system", "content": ROUTER_SYSTEM_PROMPT}, {"role": "user", "content": f"query {number}: list the files"}]
+        for number in range(count)
+    ]
+
+def bench_routing(args):
+    pipeline = TinyLlamaPipeline(args.hidden, args.layers)
+    terminators = [pipeline.tokenizer.eos_token_id]
+    get_local_engine(pipeline).warm_up(ROUTER_SYSTEM_PROMPT)
+    # Greedy, so both configurations generate the same replies.
+    generation_kwargs = {"max_new_tokens": args.tokens, "do_sample": False}
+    histories = router_histories(args.queries)
+    route_batch(histories[:2], pipeline, terminators, "local", 2, generation_kwargs)  # warm-up
+    rows = {}
+    for name, batch_size in (("one at a time", 1), (f"batches of {args.batch_size}", args.batch_size)):
+        started = time.perf_counter()
+        responses, tokens = route_batch(histories, pipeline, terminators, "local", batch_size, generation_kwargs)
+        rows[name] = (time.perf_counter() - started, tokens, responses)
+    single, batched = rows.values()
+    assert single[2] == batched[2], "batched replies differ from one-at-a-time replies"
+    return rows
+
+def scripted_reply(system, contents):
+    if system != CLI_AGENT_SYSTEM_PROMPT:
+        query = contents[-1]["parts"][0]
+        return f"[TOOL: cli_agent, task: {query}]"
+    steps = sum(1 for content in contents if content["role"] == "model")
+    if steps >= AGENT_STEPS:
+        return json.dumps({"thought": "Done.", "action": "finish", "arguments": {}})
+    return json.dumps({"thought": f"Step {steps + 1}.", "action": "execute_shell_command",
+                       "arguments": {"command": f"ls step_{steps + 1}"}})
+
+def bench_tasks(args):
+    genai = FakeGenAI(replies=scripted_reply, latency=args.llm_latency)
+    model = genai.GenerativeModel(GEMINI_MODEL_ID)
+    get_gemini_pool(model, genai_module=genai)
+    shell = FakeShellSession(latency=args.shell_latency)
+    queries = [{"id": number + 1, "query": f"task {number + 1}: list the files"} for number in range(args.queries)]
+    rows = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, jobs in (("one at a time", 1), (f"{args.jobs} at once", args.jobs)):
+            output_path = os.path.join(tmp, "results.jsonl")
+            with contextlib.redirect_stdout(io.StringIO()):
+                stats = run_batch(queries, model, None, "gemini", output_path, ROUTER_SYSTEM_PROMPT,
+                                  batch_size=args.batch_size, max_jobs=jobs, shell_session=shell)
+            with open(output_path) as f:
+                records = [json.loads(line) for line in f]
+            assert [record["id"] for record in records] == [item["id"] for item in queries]
+            assert stats["done"] == len(queries), stats
+            rows[name] = stats
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--tokens", type=int, default=32, help="max new router tokens per query")
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--hidden", type=int, default=512)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="simulated seconds per Gemini call")
+    parser.add_argument("--shell-latency", type=float, default=0.1, help="simulated seconds per shell command")
+    args = parser.parse_args()
+
+    routing = bench_routing(args)
+    print(f"Routing {args.queries} queries, up to {args.tokens} tokens each "
+          f"(random tiny Llama, hidden {args.hidden}, {args.layers} layers)\n")
+    print(f"{'router':<22}{'wall s':>8}{'queries/s':>11}{'tokens/s':>10}")
+    for name, (wall, tokens, _) in routing.items():
+        print(f"{name:<22}{wall:>8.2f}{args.queries / wall:>11.1f}{tokens / wall:>10.1f}")
+    single, batched = routing.values()
+    print(f"batching: {single[0] / batched[0]:.2f}x router throughput, identical replies\n")
+
+    tasks = bench_tasks(args)
+    print(f"{args.queries} CLI tasks, {AGENT_STEPS} commands each, {args.llm_latency * 1000:.0f} ms per LLM call, "
+          f"{args.shell_latency * 1000:.0f} ms per command\n")
+    print(f"{'tasks':<22}{'wall s':>8}{'queries/s':>11}")
+    for name, stats in tasks.items():
+        print(f"{name:<22}{stats['wall']:>8.2f}{stats['queries'] / stats['wall']:>11.2f}")
+    single, concurrent = tasks.values()
+    print(f"concurrency: {single['wall'] / concurrent['wall']:.2f}x task throughput")
+
+if __name__ == "__main__":
+    main()
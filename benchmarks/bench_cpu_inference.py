@@ -0,0 +1,149 @@
+"""
+bf16 vs int8 CPU inference for the local model: load time, prefill latency, decode tokens/s
+and resident memory. Each engine runs in its own subprocess so memory numbers don't mix.
+"int8 (cached)" is a second int8 start that reads the quantized copy written by the first.
+
+    python -m benchmarks.bench_cpu_inference                       # LOCAL_MODEL_ID (must be downloaded)
+    python -m benchmarks.bench_cpu_inference --tiny                # random ~100M-param Llama, offline
+    python -m benchmarks.bench_cpu_inference --model PATH --tokens 64 --threads 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+def memory_mb():
+    """
+    Resident memory of this process in MB from /proc (Linux): RSS, peak RSS, and RSS split into
+    private (anonymous) pages and file pages (memory-mapped weights, shared via the page cache).
+    """
+    values = {}
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("VmRSS", "VmHWM", "RssAnon", "RssFile"):
+                    values[key] = int(rest.split()[0]) / 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        values = {"VmRSS": peak, "VmHWM": peak, "RssAnon": peak}
+    return {
+        "rss": values.get("VmRSS", 0.0), "peak": values.get("VmHWM", 0.0),
+        "private": values.get("RssAnon", 0.0), "mapped": values.get("RssFile", 0.0),
+    }
+
+def decode_speed(model, prompt_tokens, new_tokens, vocab_size):
+    """Greedy generation with a KV cache, like LocalEngine: (prefill seconds, decode tokens/s)."""
+    import torch
+    from transformers import DynamicCache
+
+    generator = torch.Generator().manual_seed(0)
+    input_ids = torch.randint(0, vocab_size, (1, prompt_tokens), generator=generator)
+    cache = DynamicCache(config=model.config)
+    with torch.no_grad():
+        started = time.perf_counter()
+        logits = model(input_ids=input_ids, past_key_values=cache, use_cache=True).logits[0, -1]
+        prefill = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(new_tokens):
+            next_id = torch.argmax(logits).view(1, 1)
+            logits = model(input_ids=next_id, past_key_values=cache, use_cache=True).logits[0, -1]
+        decode = time.perf_counter() - started
+    return prefill, new_tokens / decode
+
+def worker(engine, model_id, cache_dir, threads, prompt_tokens, new_tokens):
+    import torch
+    from transformers import AutoModelForCausalLM
+    from pulse_brain.cpu_inference import load_int8_model, tune_threads
+
+    warnings.filterwarnings("ignore")
+    before = memory_mb()
+    started = time.perf_counter()
+    if engine == "bf16":
+        threads = tune_threads(threads)
+        model = AutoModelForCausalLM.from_pretrained(model_id, dtype=torch.bfloat16).eval()
+    else:
+        model = load_int8_model(model_id, cache_dir, threads)
+        threads = torch.get_num_threads()
+    load = time.perf_counter() - started
+    prefill, tokens_per_s = decode_speed(model, prompt_tokens, new_tokens, model.config.vocab_size)
+    after = memory_mb()
+    return {
+        "load_s": load, "prefill_ms": prefill * 1000, "tokens_per_s": tokens_per_s,
+        "model_mb": after["rss"] - before["rss"], "private_mb": after["private"] - before["private"],
+        "mapped_mb": after["mapped"] - before["mapped"], "peak_rss_mb": after["peak"], "threads": threads,
+    }
+
+def make_tiny_model(path):
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    config = LlamaConfig(
+        hidden_size=1024, intermediate_size=2816, num_hidden_layers=8, num_attention_heads=16,
+        num_key_value_heads=4, vocab_size=32000, tie_word_embeddings=True,
+    )
+    torch.manual_seed(0)
+    LlamaForCausalLM(config).to(torch.bfloat16).save_pretrained(path)
+
+def run_worker(engine, args, model_id, cache_dir):
+    command = [
+        sys.executable, "-m", "benchmarks.bench_cpu_inference", "--worker", engine, "--model", model_id,
+        "--cache-dir", cache_dir, "--tokens", str(args.tokens), "--prompt-tokens", str(args.prompt_tokens),
+    ]
+    if args.threads:
+        command += ["--threads", str(args.threads)]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    from pulse_config.config import LOCAL_MODEL_ID
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=LOCAL_MODEL_ID)
+    parser.add_argument("--tiny", action="store_true", help="benchmark a random small Llama (no download)")
+    parser.add_argument("--tokens", type=int, default=32, help="tokens to decode")
+    parser.add_argument("--prompt-tokens", type=int, default=128)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--worker", choices=["bf16", "int8"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = worker(args.worker, args.model, args.cache_dir, args.threads, args.prompt_tokens, args.tokens)
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_id = args.model
+        if args.tiny:
+            model_id = os.path.join(tmp, "tiny-llama")
+            make_tiny_model(model_id)
+        cache_dir = os.path.join(tmp, "int8-cache")
+        results = {
+            "bf16": run_worker("bf16", args, model_id, cache_dir),
+            "int8": run_worker("int8", args, model_id, cache_dir),
+            "int8 (cached)": run_worker("int8", args, model_id, cache_dir),
+        }
+
+    print(f"{model_id if not args.tiny else 'random tiny Llama'}: {args.prompt_tokens}-token prompt, "
+          f"{args.tokens} decoded tokens, {results['int8']['threads']} threads\n")
+    print(f"{'engine':<15}{'load s':>8}{'prefill ms':>12}{'tokens/s':>10}{'model MB':>10}"
+          f"{'private':>9}{'mapped':>8}{'peak MB':>9}")
+    for name, r in results.items():
+        print(f"{name:<15}{r['load_s']:>8.2f}{r['prefill_ms']:>12.1f}{r['tokens_per_s']:>10.1f}"
+              f"{r['model_mb']:>10.0f}{r['private_mb']:>9.0f}{r['mapped_mb']:>8.0f}{r['peak_rss_mb']:>9.0f}")
+    print("(model MB: RSS added by loading and running the model, measured after decoding since safetensors\n"
+          " weights are paged in lazily; split into private memory and memory-mapped file pages.\n"
+          " peak MB is the whole process, including the Python/torch runtime)")
+    bf16, int8 = results["bf16"], results["int8 (cached)"]
+    print(f"\nint8: {int8['tokens_per_s'] / bf16['tokens_per_s']:.2f}x decode speed, "
+          f"{int8['model_mb'] / bf16['model_mb']:.2f}x model memory vs bf16; "
+          f"cached start {results['int8']['load_s'] / int8['load_s']:.1f}x faster than quantizing")
+
+if __name__ == "__main__":
+    main()
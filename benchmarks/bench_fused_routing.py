@@ -0,0 +1,161 @@
+"""
+Two-pass routing (router tag, then the CLI agent's first action) vs fused routing (tag and
+first action from one generation), over the real router/dispatcher/agent code with scripted
+backends that simulate generation latency.
+
+Reports LLM calls per task, time from query to the first shell command and total task time
+for both backends, plus the Gemini rate-limit wait for a burst of tasks at GEMINI_RPM. Local
+runs are repeated with instant commands and with `--shell-latency` per command: fused routing
+prefills its first action into the agent's cache while that command runs, so with instant
+commands the prefill is fully on the critical path.
+
+    python -m benchmarks.bench_fused_routing [--tasks 5] [--gemini-latency 0.3] [--token-latency 0.01]
+                                             [--shell-latency 0.2]
+"""
+import os
+
+os.environ.setdefault("PULSE_TTS_BACKEND", "null")
+os.environ.setdefault("GEMINI_RPM", "1000000")
+os.environ.setdefault("GEMINI_TPM", "1000000000")
+# Every task is asked of the model; replaying cached plans would skip the steps being measured.
+os.environ.setdefault("PULSE_TRAJECTORY_CACHE", "0")
+
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_turn import AGENT_STEPS, scripted_reply
+from benchmarks.fakes import FakeGenAI, FakePipeline, FakeShellSession
+from cli_agent import stream_router_response
+from pulse_brain.gemini_session import get_gemini_pool
+from pulse_brain.llm_interface import tool_dispatcher
+from pulse_brain.rate_limiter import RateLimiter
+from pulse_config import tracing
+from pulse_config.config import (
+    CLI_AGENT_SYSTEM_PROMPT, FUSED_ROUTER_SYSTEM_PROMPT, GEMINI_MODEL_ID, ROUTER_SYSTEM_PROMPT,
+)
+
+TASKS = [
+    "create a folder called reports and list it",
+    "show me the git log of this repo",
+    "check how much disk space is free",
+]
+
+def fused_reply(history):
+    """scripted_reply, plus the fused router prompt: tag and the first action together."""
+    if history[0]["content"] != FUSED_ROUTER_SYSTEM_PROMPT:
+        return scripted_reply(history)
+    route = scripted_reply([{"role": "system", "content": ROUTER_SYSTEM_PROMPT}] + history[1:])
+    if not route.startswith("[TOOL:"):
+        return route
+    first = scripted_reply([
+        {"role": "system", "content": CLI_AGENT_SYSTEM_PROMPT},
+        {"role": "user", "content": f"START_TASK: {history[-1]['content']}"},
+    ])
+    action = json.loads(first.strip().strip("`").removeprefix("json"))
+    return f"{route}\n{json.dumps(action)}"
+
+def make_backend(name, gemini_latency, token_latency, prefill_latency):
+    if name == "local":
+        pipeline = FakePipeline(fused_reply, token_latency=token_latency, prefill_latency=prefill_latency)
+        return pipeline, [pipeline.tokenizer.eos_token_id]
+    genai = FakeGenAI(replies=lambda system, contents: fused_reply(
+        [{"role": "system", "content": system or ""}]
+        + [{"role": "assistant" if c["role"] == "model" else "user", "content": c["parts"][0]} for c in contents]
+    ), latency=gemini_latency)
+    model = genai.GenerativeModel(GEMINI_MODEL_ID)
+    get_gemini_pool(model, genai_module=genai)
+    return model, None
+
+def run(backend, fused, tasks, gemini_latency, token_latency, prefill_latency, shell_latency=0.0):
+    model, terminators = make_backend(backend, gemini_latency, token_latency, prefill_latency)
+    router_prompt = FUSED_ROUTER_SYSTEM_PROMPT if fused else ROUTER_SYSTEM_PROMPT
+    first_command, total, calls = [], [], []
+    tracer = tracing.get_tracer()
+
+    for i in range(tasks):
+        query = TASKS[i % len(TASKS)]
+        started = time.perf_counter()
+        seen = []
+        # The output callback runs once the simulated command is over; record when it started.
+        shell = FakeShellSession(
+            outputs=lambda command: seen.append(time.perf_counter() - shell_latency) or f"output of {command}",
+            latency=shell_latency,
+        )
+        generations_before = tracer.histograms["llm.generate"].count if "llm.generate" in tracer.histograms else 0
+
+        history = [{"role": "system", "content": router_prompt}, {"role": "user", "content": query}]
+        response, _ = stream_router_response(history, model, terminators, backend)
+        tool_dispatcher(response, model, terminators, model_type=backend, shell_session=shell)
+
+        total.append(time.perf_counter() - started)
+        first_command.append(seen[0] - started)
+        calls.append(tracer.histograms["llm.generate"].count - generations_before)
+    return {
+        "calls": statistics.mean(calls),
+        "first_command": statistics.median(first_command),
+        "total": statistics.median(total),
+    }
+
+def rate_limited_wait(calls_per_task, tasks, rpm):
+    """Total time a burst of `tasks` spends waiting on the shared limiter, on a simulated clock."""
+    now = [0.0]
+    limiter = RateLimiter(rpm, clock=lambda: now[0], sleep=lambda seconds: now.__setitem__(0, now[0] + seconds))
+    for _ in range(round(calls_per_task * tasks)):
+        limiter.acquire()
+    return limiter.total_wait
+
+def signed(saved, better, worse):
+    """'120 ms sooner' for a saving, '40 ms later' for a loss."""
+    return f"{abs(saved) * 1000:.0f} ms {better if saved >= 0 else worse}"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=5)
+    parser.add_argument("--gemini-latency", type=float, default=0.3, help="simulated seconds per Gemini call")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="simulated seconds per generated local token")
+    parser.add_argument("--prefill-latency", type=float, default=0.001, help="simulated seconds per local prompt token")
+    parser.add_argument("--shell-latency", type=float, default=0.2, help="simulated seconds per shell command")
+    parser.add_argument("--rpm", type=int, default=5, help="Gemini requests per minute for the rate-limit estimate")
+    args = parser.parse_args()
+
+    tracing.enable()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                for backend, shell_latency in (("local", 0.0), ("local", args.shell_latency), ("gemini", 0.0)):
+                    for fused in (False, True):
+                        results[backend, shell_latency, fused] = run(
+                            backend, fused, args.tasks, args.gemini_latency, args.token_latency,
+                            args.prefill_latency, shell_latency,
+                        )
+        finally:
+            os.chdir(cwd)
+
+    print(f"{args.tasks} CLI tasks of {AGENT_STEPS} shell steps each\n")
+    print(f"{'backend':<8}{'command':>9}  {'routing':<10}{'LLM calls':>10}{'1st command':>13}{'task total':>12}")
+    for (backend, shell_latency, fused), r in results.items():
+        print(f"{backend:<8}{shell_latency * 1000:>6.0f} ms  {'fused' if fused else 'two-pass':<10}{r['calls']:>10.1f}"
+              f"{r['first_command'] * 1000:>10.0f} ms{r['total'] * 1000:>9.0f} ms")
+    print()
+    for backend, shell_latency in (("local", 0.0), ("local", args.shell_latency), ("gemini", 0.0)):
+        two, one = results[backend, shell_latency, False], results[backend, shell_latency, True]
+        print(f"{backend}, {shell_latency * 1000:.0f} ms commands: fused routing reaches the first command "
+              f"{signed(two['first_command'] - one['first_command'], 'sooner', 'later')} and finishes the task "
+              f"{signed(two['total'] - one['total'], 'sooner', 'later')}")
+
+    two_calls, one_calls = results["gemini", 0.0, False]["calls"], results["gemini", 0.0, True]["calls"]
+    two_wait = rate_limited_wait(two_calls, args.tasks, args.rpm)
+    one_wait = rate_limited_wait(one_calls, args.tasks, args.rpm)
+    print(f"\nGemini at {args.rpm} RPM, burst of {args.tasks} tasks: {two_wait:.0f} s of rate-limit waits two-pass, "
+          f"{one_wait:.0f} s fused ({two_wait - one_wait:.0f} s saved)")
+
+if __name__ == "__main__":
+    main()
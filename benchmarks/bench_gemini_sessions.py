@@ -0,0 +1,40 @@
+"""
+Counts Gemini model constructions, request calls and message conversions for a simulated
+10-step CLI agent loop, using the fake Gemini client.
+
+    python -m benchmarks.bench_gemini_sessions
+"""
+import json
+
+from benchmarks.fakes import FakeGenAI
+from pulse_brain.gemini_session import GeminiSessionPool
+from pulse_config.config import CLI_AGENT_SYSTEM_PROMPT, GEMINI_MODEL_ID
+
+STEPS = 10
+
+def main():
+    action = json.dumps({"thought": "check", "action": "execute_shell_command", "arguments": {"command": "ls"}})
+    genai = FakeGenAI(replies=[action])
+    pool = GeminiSessionPool(genai.GenerativeModel(GEMINI_MODEL_ID), genai_module=genai)
+
+    history = [
+        {"role": "system", "content": CLI_AGENT_SYSTEM_PROMPT},
+        {"role": "user", "content": "START_TASK: list the files"},
+    ]
+    rebuild_conversions = 0
+    for _ in range(STEPS):
+        # What the old per-call rebuild converted: every non-system message, every step.
+        rebuild_conversions += len(history) - 1
+        reply = "".join(chunk.text for chunk in pool.send(history, session_id="bench", stream=True))
+        history.append({"role": "assistant", "content": reply})
+        history.append({"role": "user", "content": "Tool Output: file.txt"})
+
+    stats = pool.stats()
+    print(f"Steps:                         {STEPS}")
+    print(f"Models built (incl. base):     {genai.models_built}  (per-call rebuild: {STEPS + 1})")
+    print(f"generate_content calls:        {genai.calls}")
+    print(f"Messages converted:            {stats['conversions']}  (per-call rebuild: {rebuild_conversions})")
+    print(f"Session rebuilds:              {stats['session_rebuilds']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compares the old rewrite-everything JSON history with the append-only JSONL store on a
+history of 100k messages.
+
+    python -m benchmarks.bench_history [--messages 100000]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from pulse_config.history_store import HistoryStore
+
+def make_messages(count):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}: " + "lorem ipsum " * 8}
+        for i in range(count)
+    ]
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100_000)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    turn = messages[-2:]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "conversation_history.json")
+        jsonl_path = os.path.join(tmp, "conversation_history.jsonl")
+
+        # Old behaviour: every turn rewrites the whole file, every start parses all of it.
+        def legacy_save():
+            with open(legacy_path, "w") as f:
+                json.dump(messages, f, indent=4)
+
+        def legacy_load():
+            with open(legacy_path, "r") as f:
+                history = json.load(f)
+            return history[-20:]
+
+        store = HistoryStore(jsonl_path, compact_bytes=0)
+        started = time.perf_counter()
+        store.append(messages)
+        bulk_write = time.perf_counter() - started
+
+        legacy_save_time = timed(legacy_save)
+        legacy_load_time = timed(legacy_load)
+        append_time = timed(lambda: store.append(turn), repeat=20)
+        tail_time = timed(lambda: store.tail(20), repeat=20)
+        assert store.tail(20)[-2:] == turn
+
+        print(f"Messages in history:        {args.messages}")
+        print(f"JSONL file size:            {os.path.getsize(jsonl_path) / 1e6:.1f} MB")
+        print(f"JSONL initial bulk write:   {bulk_write * 1000:9.2f} ms")
+        print(f"Save one turn   (old JSON): {legacy_save_time * 1000:9.2f} ms")
+        print(f"Save one turn   (JSONL):    {append_time * 1000:9.2f} ms  (includes fsync)")
+        print(f"Load last 20    (old JSON): {legacy_load_time * 1000:9.2f} ms")
+        print(f"Load last 20    (JSONL):    {tail_time * 1000:9.2f} ms")
+
+if __name__ == "__main__":
+    main()
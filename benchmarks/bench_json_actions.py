@@ -0,0 +1,99 @@
+"""
+Agent action parsing and constrained decoding.
+
+1. A corpus of replies in the shapes models actually produce (fences, prose around the
+   object, trailing commas, single quotes, bad escapes, truncation) parsed the strict way
+   (`clean_json_response` + `json.loads`, what the agent loop used to do) and with
+   `parse_action`. Every strict failure is a wasted agent step.
+2. The real LocalEngine over a model that emits random logits, with and without
+   ActionLogitsProcessor: how many generations parse, and the per-token cost of the mask.
+
+    python -m benchmarks.bench_json_actions [--generations 20] [--max-new-tokens 2000]
+"""
+import argparse
+import json
+import time
+
+from benchmarks.fakes import FakeTokenizer, RandomCausalLM
+from pulse_brain.json_actions import ActionLogitsProcessor, clean_json_response, parse_action
+from pulse_brain.local_engine import LocalEngine
+from pulse_config.config import CLI_AGENT_SYSTEM_PROMPT
+
+_ACTION = '"thought": "List the files.", "action": "execute_shell_command", "arguments": {"command": "ls -la"}'
+CORPUS = {
+    "plain object": "{" + _ACTION + "}",
+    "```json fence": "```json\n{" + _ACTION + "}\n```",
+    "bare ``` fence": "```\n{" + _ACTION + "}\n```",
+    "prose before": "Sure! Here is the next step:\n{" + _ACTION + "}",
+    "prose after": "{" + _ACTION + "}\nLet me know the output.",
+    "trailing comma": '{"thought": "Done.", "action": "finish", "arguments": {},}',
+    "single quotes": "{'thought': 'Check space.', 'action': 'execute_shell_command', 'arguments': {'command': 'df -h'}}",
+    "python literal": '{"thought": "Done.", "action": "finish", "arguments": {}, "verified": True}',
+    "invalid escape": '{"thought": "Count digits.", "action": "execute_shell_command", "arguments": {"command": "grep -cP \\d+ log.txt"}}',
+    "raw newline": '{"thought": "Two steps:\n1. list", "action": "execute_shell_command", "arguments": {"command": "ls"}}',
+    "truncated": '{"thought": "Show the log.", "action": "execute_shell_command", "arguments": {"command": "git log --oneline',
+}
+
+def strict_parse(text):
+    try:
+        return isinstance(json.loads(clean_json_response(text)), dict)
+    except ValueError:
+        return False
+
+def tolerant_parse(text):
+    try:
+        parse_action(text)
+        return True
+    except ValueError:
+        return False
+
+def run_corpus():
+    print(f"{'reply shape':<18}{'strict':>8}{'tolerant':>10}")
+    strict_ok = tolerant_ok = 0
+    for name, text in CORPUS.items():
+        strict, tolerant = strict_parse(text), tolerant_parse(text)
+        strict_ok += strict
+        tolerant_ok += tolerant
+        print(f"{name:<18}{'ok' if strict else 'FAIL':>8}{'ok' if tolerant else 'FAIL':>10}")
+    print(f"\nstrict: {strict_ok}/{len(CORPUS)} parse, tolerant: {tolerant_ok}/{len(CORPUS)} "
+          f"({tolerant_ok - strict_ok} agent steps saved)")
+
+def run_generations(generations, max_new_tokens, constrained):
+    tokenizer = FakeTokenizer()
+    engine = LocalEngine(RandomCausalLM(tokenizer), tokenizer)
+    history = [
+        {"role": "system", "content": CLI_AGENT_SYSTEM_PROMPT},
+        {"role": "user", "content": "START_TASK: list the files"},
+    ]
+    parsed = tokens = 0
+    elapsed = 0.0
+    for _ in range(generations):
+        processor = ActionLogitsProcessor(tokenizer) if constrained else None
+        started = time.perf_counter()
+        ids = list(engine.generate_ids(history, max_new_tokens=max_new_tokens, logits_processor=processor))
+        elapsed += time.perf_counter() - started
+        tokens += len(ids)
+        try:
+            action, _ = parse_action(tokenizer.decode(ids))
+            parsed += action.get("action") in ("execute_shell_command", "finish")
+        except ValueError:
+            pass
+    return parsed, tokens, elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--generations", type=int, default=20)
+    parser.add_argument("--max-new-tokens", type=int, default=2000)
+    args = parser.parse_args()
+
+    run_corpus()
+
+    print(f"\nRandom-logits model, {args.generations} generations of up to {args.max_new_tokens} tokens")
+    print(f"{'decoding':<14}{'valid actions':>15}{'tokens':>9}{'ms/token':>10}")
+    for constrained in (False, True):
+        parsed, tokens, elapsed = run_generations(args.generations, args.max_new_tokens, constrained)
+        print(f"{'constrained' if constrained else 'free':<14}{parsed:>9}/{args.generations:<5}{tokens:>9}"
+              f"{elapsed * 1000 / max(tokens, 1):>10.3f}")
+
+if __name__ == "__main__":
+    main()
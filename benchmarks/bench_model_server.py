@@ -0,0 +1,145 @@
+"""
+Shared model server: client start-up time and throughput with concurrent clients.
+
+A ModelServer runs in this process on a temporary Unix socket, serving a random-weight
+Llama over a byte vocabulary (a real transformers model, so batched forward passes run for
+real). Concurrent clients go through RemoteModel exactly like cli_agent.py processes would.
+
+Reports:
+- how long a fresh process takes to be ready: importing the app and connecting to the server,
+  vs importing torch/transformers and loading the model in-process (only the tiny model here;
+  the 3B model takes far longer)
+- aggregate tokens/s and request latency for `--clients` concurrent clients, with requests
+  served one at a time (--max-batch 1) vs batched
+
+    python -m benchmarks.bench_model_server [--clients 4] [--requests 3] [--tokens 64] [--hidden 512 --layers 4]
+"""
+import os
+
+os.environ.setdefault("PULSE_TTS_BACKEND", "null")
+
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.fakes import TinyLlamaPipeline
+from pulse_brain.model_client import connect_model_server
+from pulse_config.config import ROUTER_SYSTEM_PROMPT
+from pulse_model_server import ModelServer
+
+CLIENT_START = """
+import time
+started = time.perf_counter()
+import cli_agent
+from pulse_brain.model_client import connect_model_server
+assert connect_model_server({socket!r}) is not None
+print(time.perf_counter() - started)
+"""
+
+IN_PROCESS_START = """
+import time
+started = time.perf_counter()
+import cli_agent
+import torch, transformers
+from benchmarks.fakes import TinyLlamaPipeline
+TinyLlamaPipeline({hidden}, {layers})
+print(time.perf_counter() - started)
+"""
+
+def start_time(code):
+    """Seconds a fresh Python process takes to run `code` (as reported by the code itself)."""
+    env = dict(os.environ, PULSE_TTS_BACKEND="null")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env)
+    return float(output.stdout.strip().splitlines()[-1])
+
+def run_clients(model, clients, requests, prompt_chars=200):
+    """Each client thread sends `requests` router prompts back to back; returns (wall s, latencies)."""
+    latencies = []
+    lock = threading.Lock()
+
+    def client(number):
+        for request in range(requests):
+            history = [
+                {"role": "system", "content": ROUTER_SYSTEM_PROMPT},
+                {"role": "user", "content": f"client {number} request {request} " + "x" * prompt_chars},
+            ]
+            started = time.perf_counter()
+            model.generate(history)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies
+
+def serve(pipeline, socket_path, max_batch, tokens):
+    # Greedy decoding, so both configurations generate the same replies.
+    server = ModelServer(
+        pipeline, [pipeline.tokenizer.eos_token_id], max_batch=max_batch, model_id="random tiny Llama",
+        generation_kwargs={"max_new_tokens": tokens, "do_sample": False},
+    )
+    thread = threading.Thread(target=server.serve, args=(socket_path,), daemon=True)
+    thread.start()
+    for _ in range(100):
+        model = connect_model_server(socket_path)
+        if model is not None:
+            return server, thread, model
+        time.sleep(0.05)
+    raise RuntimeError("model server did not start")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=3, help="requests per client")
+    parser.add_argument("--tokens", type=int, default=64, help="max new tokens per request")
+    parser.add_argument("--hidden", type=int, default=512)
+    parser.add_argument("--layers", type=int, default=4)
+    args = parser.parse_args()
+
+    pipeline = TinyLlamaPipeline(args.hidden, args.layers)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, "model.sock")
+        for name, max_batch in (("one at a time", 1), (f"batched (max {args.clients})", args.clients)):
+            server, thread, model = serve(pipeline, socket_path, max_batch, args.tokens)
+            if not results:
+                client_start = start_time(CLIENT_START.format(socket=socket_path))
+                in_process_start = start_time(IN_PROCESS_START.format(hidden=args.hidden, layers=args.layers))
+            run_clients(model, 1, 1)  # warm-up
+            before = server.stats()
+            wall, latencies = run_clients(model, args.clients, args.requests)
+            # Clients get their last piece before the scheduler books the batch.
+            while server.stats()["requests"] < before["requests"] + args.clients * args.requests:
+                time.sleep(0.01)
+            after = server.stats()
+            server.shutdown()
+            thread.join(5)
+            batches = after["batches"] - before["batches"]
+            results[name] = {
+                "wall": wall, "tokens": after["tokens"] - before["tokens"], "latencies": sorted(latencies),
+                "average_batch": (after["requests"] - before["requests"]) / batches if batches else 0.0,
+            }
+
+    print(f"Process ready to answer: {client_start * 1000:.0f} ms with the model server running, "
+          f"{in_process_start * 1000:.0f} ms loading the tiny model in-process\n")
+    print(f"{args.clients} clients x {args.requests} requests, up to {args.tokens} tokens each "
+          f"(hidden {args.hidden}, {args.layers} layers)\n")
+    print(f"{'serving':<22}{'wall s':>8}{'tokens/s':>10}{'p50 s':>8}{'p95 s':>8}{'avg batch':>11}")
+    for name, r in results.items():
+        latencies = r["latencies"]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{name:<22}{r['wall']:>8.2f}{r['tokens'] / r['wall']:>10.1f}{statistics.median(latencies):>8.2f}"
+              f"{p95:>8.2f}{r['average_batch']:>11.1f}")
+    single, batched = results.values()
+    print(f"\nbatching: {(batched['tokens'] / batched['wall']) / (single['tokens'] / single['wall']):.2f}x throughput")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Recurring CLI tasks with and without the trajectory cache, through the real agent loop
+(LocalEngine over a scripted model that simulates per-token latency, and a fake shell).
+
+Each round runs the same task list; some tasks come back reworded (same normalized text:
+replayed; similar wording: the plan is proposed to the model), and one task's shell output
+changes half-way, so its replay diverges and the model takes over. Reports model calls and
+time per task for each round, and the cache's hit rate, replayed steps and divergences.
+Fails if a router reply without a task (`[TOOL: cli_agent]`) breaks the agent loop.
+
+    python -m benchmarks.bench_trajectory_cache [--rounds 4] [--token-latency 0.002]
+"""
+import os
+
+# Must be set before pulse modules read their config.
+os.environ.setdefault("PULSE_TTS_BACKEND", "null")
+os.environ["PULSE_TRAJECTORY_CACHE"] = "1"
+
+import argparse
+import contextlib
+import io
+import json
+import re
+import tempfile
+import time
+
+from benchmarks.fakes import FakePipeline, FakeShellSession
+from pulse_brain import trajectory_cache
+from pulse_brain.brain import start_cli_agent_loop
+from pulse_brain.llm_interface import stream_llm, tool_dispatcher
+from pulse_config.config import CLI_AGENT_SYSTEM_PROMPT
+
+AGENT_STEPS = 3
+TASKS = [
+    "show disk usage of this repo",
+    "create a venv and install requirements",
+    "list the largest files in this folder",
+    "show me the git log of this repo",
+]
+REWORDED = {
+    # Normalizes to the same key as the original: replayed.
+    "show disk usage of this repo": "Show disk usage of this repo!",
+    # Close but not identical: the cached plan is proposed to the model.
+    "list the largest files in this folder": "list the largest files in this directory",
+}
+DIVERGING_TASK = "show me the git log of this repo"
+
+def task_slug(task):
+    return re.sub(r"[^a-z]+", "_", task.lower()).strip("_")[:24]
+
+def agent_reply(history):
+    """Task-specific commands, then finish; the task text is taken from the START_TASK message."""
+    if history[0]["content"] != CLI_AGENT_SYSTEM_PROMPT:
+        return "OK"
+    task = history[1]["content"].removeprefix("START_TASK: ").split("\n")[0]
+    steps = sum(1 for msg in history if msg["role"] == "assistant")
+    if steps >= AGENT_STEPS:
+        return json.dumps({"thought": "The task is complete.", "action": "finish", "arguments": {}})
+    return json.dumps({
+        "thought": f"Step {steps + 1} of the {task_slug(task)} task.",
+        "action": "execute_shell_command",
+        "arguments": {"command": f"run_{task_slug(task)} --step {steps + 1}"},
+    })
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--token-latency", type=float, default=0.002, help="simulated seconds per generated token")
+    args = parser.parse_args()
+
+    pipeline = FakePipeline(agent_reply, token_latency=args.token_latency)
+    terminators = [pipeline.tokenizer.eos_token_id]
+    state = {"round": 0, "calls": 0}
+
+    def shell_output(command):
+        if command.startswith(f"run_{task_slug(DIVERGING_TASK)}") and state["round"] >= args.rounds // 2:
+            return "Exit code: 0\ncommit 4f2a (HEAD -> main) Add a new feature"  # new commits since the recording
+        return f"Exit code: 0\noutput of {command} at {time.time():.0f}"  # numbers are masked when comparing
+
+    def stream_func(history):
+        state["calls"] += 1
+        return stream_llm(pipeline, history, "local", terminators)
+
+    shell = FakeShellSession(shell_output)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = trajectory_cache.TrajectoryCache(os.path.join(tmp, "trajectories.json"))
+        trajectory_cache._trajectory_cache = cache
+        for number in range(args.rounds):
+            state["round"] = number
+            tasks = [REWORDED.get(task, task) if number % 2 else task for task in TASKS]
+            calls_before, started = state["calls"], time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for task in tasks:
+                    start_cli_agent_loop(task, None, "local", stream_func=stream_func, shell_session=shell)
+            elapsed = time.perf_counter() - started
+            rows.append((number + 1, (state["calls"] - calls_before) / len(tasks), elapsed / len(tasks) * 1000))
+
+        # The router may name the tool without a task; the agent must still run, uncached.
+        entries = len(cache.entries)
+        with contextlib.redirect_stdout(io.StringIO()):
+            tool_name, result = tool_dispatcher("[TOOL: cli_agent]", pipeline, terminators, "local", shell_session=shell)
+        assert (tool_name, result) == ("cli_agent", "CLI task finished."), (tool_name, result)
+        assert len(cache.entries) == entries, "a task-less route was recorded in the trajectory cache"
+
+    print(f"{len(TASKS)} tasks per round, {AGENT_STEPS} commands each, {args.token_latency * 1000:.1f} ms per token\n")
+    print(f"{'round':<8}{'model calls/task':>18}{'ms/task':>10}")
+    for number, calls, ms in rows:
+        print(f"{number:<8}{calls:>18.2f}{ms:>10.1f}")
+    stats = cache.stats()
+    print(f"\nTrajectory cache: {stats['hits']} replays, {stats['similar_hits']} proposed plans, "
+          f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate); {stats['replayed_steps']} steps "
+          f"without the model, {stats['diverged']} replays diverged")
+    print(f"Without the cache every task takes {AGENT_STEPS + 1} model calls.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+End-to-end latency of main-loop turns with scripted backends, a fake shell and no audio.
+
+Each turn runs the router (`generate_response`), `parse_tool_call`, `tool_dispatcher`
+(the CLI agent loop: streamed JSON actions, `clean_json_response` + `json.loads`,
+`execute_shell_command`) and the history append/load, on both the local path (the real
+LocalEngine over a scripted byte-level model) and the Gemini path (session pool, rate
+limiter and context manager over a fake client). p50/p95 per stage are compared with
+benchmarks/baselines.json and the run fails if a stage got slower than the threshold.
+
+    python -m benchmarks.bench_turn [--turns 30] [--backend local|gemini|all]
+    python -m benchmarks.bench_turn --update-baselines   # after an intended change
+
+Baselines are machine-specific; re-record them when benchmarking on different hardware.
+"""
+import os
+
+# Headless, no quota sleeps. Must be set before pulse modules read their config.
+os.environ.setdefault("PULSE_TTS_BACKEND", "null")
+os.environ.setdefault("GEMINI_RPM", "1000000")
+os.environ.setdefault("GEMINI_TPM", "1000000000")
+# Every task is asked of the model; replaying cached plans would skip the steps being measured.
+os.environ.setdefault("PULSE_TRAJECTORY_CACHE", "0")
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+
+from benchmarks.fakes import FakeGenAI, FakePipeline, FakeShellSession
+from pulse_brain.brain import clean_json_response
+from pulse_brain.gemini_session import get_gemini_pool
+from pulse_brain.llm_interface import generate_response, parse_tool_call, tool_dispatcher
+from pulse_config.config import (
+    CLI_AGENT_SYSTEM_PROMPT, GEMINI_MODEL_ID, ROUTER_SYSTEM_PROMPT, append_history, load_history,
+)
+from pulse_tools.general_tools import execute_shell_command
+
+BASELINES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+AGENT_STEPS = 3  # shell commands per task before "finish"
+QUERIES = [
+    "create a folder called reports and list it",
+    "check how much disk space is free",
+    "show me the git log of this repo",
+    "tell me a joke about compilers",
+]
+
+def scripted_reply(history):
+    """The script both fake backends follow: route, then a few shell steps, then finish."""
+    system = history[0]["content"] if history and history[0]["role"] == "system" else ""
+    last = history[-1]["content"]
+    if system == ROUTER_SYSTEM_PROMPT:
+        if "joke" in last:
+            return "Sure! Here is a short answer to that."
+        return f"[TOOL: cli_agent, task: {last}]"
+    if system == CLI_AGENT_SYSTEM_PROMPT:
+        steps = sum(1 for msg in history if msg["role"] == "assistant")
+        if steps >= AGENT_STEPS:
+            return json.dumps({"thought": "Done.", "action": "finish", "arguments": {}})
+        action = {
+            "thought": f"Step {steps + 1}: inspect the workspace.",
+            "action": "execute_shell_command",
+            "arguments": {"command": f"ls -la step_{steps + 1}"},
+        }
+        return json.dumps(action)
+    return "OK"
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+class StageTimer:
+    def __init__(self):
+        self.samples = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(name, []).append(time.perf_counter() - started)
+
+    def summary(self):
+        return {
+            name: {"p50": percentile(values, 50) * 1000, "p95": percentile(values, 95) * 1000}
+            for name, values in self.samples.items()
+        }
+
+def make_backend(name):
+    if name == "local":
+        pipeline = FakePipeline(scripted_reply)
+        return pipeline, [pipeline.tokenizer.eos_token_id], "local"
+    genai = FakeGenAI(replies=lambda system, contents: scripted_reply(
+        [{"role": "system", "content": system or ""}]
+        + [{"role": "assistant" if c["role"] == "model" else "user", "content": c["parts"][0]} for c in contents]
+    ))
+    model = genai.GenerativeModel(GEMINI_MODEL_ID)
+    get_gemini_pool(model, genai_module=genai)
+    return model, None, "gemini"
+
+def run_turns(backend, turns):
+    model, terminators, model_type = make_backend(backend)
+    shell = FakeShellSession()
+    timer = StageTimer()
+    history = load_history()
+
+    for i in range(turns):
+        query = QUERIES[i % len(QUERIES)]
+        with timer.stage("turn"):
+            with timer.stage("router"):
+                router_history = [{"role": "system", "content": ROUTER_SYSTEM_PROMPT}, {"role": "user", "content": query}]
+                response, _ = generate_response(query, router_history, model, terminators, model_type, is_tool_check=True)
+            with timer.stage("parse_tool_call"):
+                parse_tool_call(response)
+            with timer.stage("tool_dispatcher"):
+                tool_name, _ = tool_dispatcher(response, model, terminators, model_type=model_type, shell_session=shell)
+            turn = [
+                {"role": "user", "content": query},
+                {"role": "assistant", "content": f"Executed tool: {tool_name}" if tool_name else response},
+            ]
+            history.extend(turn)
+            with timer.stage("history.append"):
+                append_history(turn)
+            with timer.stage("history.load"):
+                load_history()
+
+        # Per-step pieces of the agent loop, timed in isolation on the same inputs.
+        reply = scripted_reply([{"role": "system", "content": CLI_AGENT_SYSTEM_PROMPT}, {"role": "user", "content": query}])
+        with timer.stage("agent.parse_action"):
+            json.loads(clean_json_response(reply))
+        with timer.stage("agent.execute_shell_command"):
+            execute_shell_command("ls -la", session=shell)
+
+    return timer.summary()
+
+def compare(results, baselines, threshold, slack_ms):
+    """Returns the list of regressions: stages whose p50 or p95 exceeds baseline * (1 + threshold) + slack."""
+    regressions = []
+    for backend, stages in results.items():
+        for stage, stats in stages.items():
+            base = baselines.get(backend, {}).get(stage)
+            if not base:
+                continue
+            for key in ("p50", "p95"):
+                limit = base[key] * (1 + threshold) + slack_ms
+                if stats[key] > limit:
+                    regressions.append(f"{backend}/{stage} {key}: {stats[key]:.3f} ms > {limit:.3f} ms (baseline {base[key]:.3f} ms)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--backend", choices=["local", "gemini", "all"], default="all")
+    parser.add_argument("--threshold", type=float, default=0.5, help="allowed relative slowdown (0.5 = +50%%)")
+    parser.add_argument("--slack-ms", type=float, default=0.5, help="absolute slack so sub-millisecond noise doesn't fail")
+    parser.add_argument("--update-baselines", action="store_true")
+    args = parser.parse_args()
+
+    backends = ["local", "gemini"] if args.backend == "all" else [args.backend]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # History files are relative to the working directory; keep them out of the repo.
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            for backend in backends:
+                if backend == "local":
+                    try:
+                        import torch, transformers
+                    except ImportError as e:
+                        print(f"Skipping local backend ({e}).")
+                        continue
+                with contextlib.redirect_stdout(io.StringIO()):
+                    run_turns(backend, 2)  # warm up imports and caches
+                    results[backend] = run_turns(backend, args.turns)
+        finally:
+            os.chdir(cwd)
+
+    for backend, stages in results.items():
+        print(f"\n[{backend}] {args.turns} turns")
+        print(f"{'stage':<32}{'p50 ms':>10}{'p95 ms':>10}")
+        for stage, stats in stages.items():
+            print(f"{stage:<32}{stats['p50']:>10.3f}{stats['p95']:>10.3f}")
+
+    if args.update_baselines:
+        baselines = {}
+        if os.path.exists(BASELINES_FILE):
+            with open(BASELINES_FILE, "r", encoding="utf-8") as f:
+                baselines = json.load(f)
+        for backend, stages in results.items():
+            baselines[backend] = {
+                stage: {key: round(value, 4) for key, value in stats.items()} for stage, stats in stages.items()
+            }
+        with open(BASELINES_FILE, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaselines written to {BASELINES_FILE}")
+        return
+
+    if not os.path.exists(BASELINES_FILE):
+        print("\nNo baselines yet; run with --update-baselines to record them.")
+        return
+    with open(BASELINES_FILE, "r", encoding="utf-8") as f:
+        baselines = json.load(f)
+    regressions = compare(results, baselines, args.threshold, args.slack_ms)
+    if regressions:
+        print("\nREGRESSIONS:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nNo regressions against baselines.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Deterministic stand-ins for the external services PulseAI talks to, so benchmarks can run
+offline on CPU and count exactly how much work each layer does.
+"""
+import itertools
+import time
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+        self.parts = [text] if text else []
+
+class FakeResponse(FakeChunk):
+    pass
+
+class FakeGenerativeModel:
+    """Mimics google.generativeai.GenerativeModel.generate_content."""
+
+    def __init__(self, client, model_name, system_instruction=None):
+        self.client = client
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+
+    def generate_content(self, contents, stream=False):
+        client = self.client
+        client.calls += 1
+        client.contents_sent.append(len(contents))
+        reply = client.next_reply(self.system_instruction, contents)
+        if client.latency:
+            client.sleep(client.latency)
+        if not stream:
+            return FakeResponse(reply)
+        return (FakeChunk(reply[i:i + client.chunk_size]) for i in range(0, len(reply), client.chunk_size))
+
+class FakeGenAI:
+    """
+    Drop-in for the `google.generativeai` module.
+
+    `replies` is either a list of strings (cycled) or a callable
+    `(system_instruction, contents) -> str`. Counters record model constructions,
+    generate_content calls and how many contents each call carried.
+    """
+
+    def __init__(self, replies=("OK",), latency=0.0, chunk_size=8, sleep=time.sleep):
+        if callable(replies):
+            self._reply_fn = replies
+        else:
+            cycle = itertools.cycle(replies)
+            self._reply_fn = lambda system_instruction, contents: next(cycle)
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.sleep = sleep
+        self.models_built = 0
+        self.calls = 0
+        self.contents_sent = []
+
+    def configure(self, **kwargs):
+        pass
+
+    def GenerativeModel(self, model_name, system_instruction=None):
+        self.models_built += 1
+        return FakeGenerativeModel(self, model_name, system_instruction)
+
+    def next_reply(self, system_instruction, contents):
+        return self._reply_fn(system_instruction, contents)
+
+class FakeTokenizer:
+    """Byte-level tokenizer (ids 0-255 are bytes, 256 is EOS) with a minimal chat template."""
+
+    eos_token_id = 256
+    vocab_size = 257
+    separator = "\x1e"
+
+    def apply_chat_template(self, history, tokenize=False, add_generation_prompt=True):
+        text = "".join(f"<|{msg['role']}|>{msg['content']}{self.separator}" for msg in history)
+        return text + ("<|assistant|>" if add_generation_prompt else "")
+
+    def parse_chat(self, text):
+        """Inverse of apply_chat_template: the messages in a rendered prompt (without the generation prompt)."""
+        messages = []
+        for part in text.split(self.separator)[:-1]:
+            if part.startswith("<|") and "|>" in part:
+                role, content = part[2:].split("|>", 1)
+                messages.append({"role": role, "content": content})
+        return messages
+
+    def __call__(self, text, add_special_tokens=False):
+        return {"input_ids": self.encode(text)}
+
+    def encode(self, text, add_special_tokens=False):
+        return list(text.encode("utf-8"))
+
+    def decode(self, ids, skip_special_tokens=True):
+        return bytes(i for i in ids if i < 256).decode("utf-8", errors="replace")
+
+    def convert_tokens_to_ids(self, token):
+        return self.eos_token_id
+
+class FakeCausalLM:
+    """
+    Scripted stand-in for a transformers causal LM, driven by the real LocalEngine.
+
+    Each forward pass appends to the KV cache like a real model (so prefix reuse and cropping
+    are exercised) and returns one-hot logits for the next byte of the scripted reply.
+    `replies(history) -> str` picks the reply when a prompt ends in the generation prompt.
+    `token_latency` is charged per forward pass, `prefill_latency` per input token.
+    """
+
+    def __init__(self, tokenizer, replies, token_latency=0.0, prefill_latency=0.0, sleep=time.sleep):
+        from transformers import LlamaConfig
+
+        self.tokenizer = tokenizer
+        self.replies = replies
+        self.token_latency = token_latency
+        self.prefill_latency = prefill_latency
+        self.sleep = sleep
+        self.device = "cpu"
+        self.config = LlamaConfig(
+            num_hidden_layers=1, hidden_size=8, intermediate_size=8, num_attention_heads=1,
+            num_key_value_heads=1, vocab_size=tokenizer.vocab_size,
+        )
+        self.forward_calls = 0
+        self.forward_tokens = 0
+        self._contexts = {}
+        self._pending = []
+
+    def __call__(self, input_ids, past_key_values=None, use_cache=True):
+        import torch
+
+        new_ids = input_ids[0].tolist()
+        self.forward_calls += 1
+        self.forward_tokens += len(new_ids)
+        cached = self._contexts.get(id(past_key_values), [])[:past_key_values.get_seq_length()]
+        context = cached + new_ids
+        self._contexts[id(past_key_values)] = context
+        placeholder = torch.zeros(1, 1, len(new_ids), 1)
+        past_key_values.update(placeholder, placeholder, 0)
+
+        text = self.tokenizer.decode(context)
+        if text.endswith("<|assistant|>"):
+            reply = self.replies(self.tokenizer.parse_chat(text))
+            self._pending = self.tokenizer.encode(reply) + [self.tokenizer.eos_token_id]
+        next_id = self._pending.pop(0) if self._pending else self.tokenizer.eos_token_id
+        if self.token_latency or self.prefill_latency:
+            self.sleep(self.token_latency + self.prefill_latency * len(new_ids))
+
+        # Only the last position is ever sampled from.
+        logits = torch.full((1, 1, self.config.vocab_size), -1e4)
+        logits[0, -1, next_id] = 0.0
+        return _FakeOutput(logits)
+
+class _FakeOutput:
+    def __init__(self, logits):
+        self.logits = logits
+
+class FakePipeline:
+    """What cli_agent gets from load_model: an object with `.model` and `.tokenizer`."""
+
+    def __init__(self, replies, token_latency=0.0, prefill_latency=0.0):
+        self.tokenizer = FakeTokenizer()
+        self.model = FakeCausalLM(self.tokenizer, replies, token_latency, prefill_latency)
+
+class FakeShellSession:
+    """ShellSession stand-in: returns scripted output instantly and records the commands."""
+
+    def __init__(self, outputs=None, latency=0.0, sleep=time.sleep):
+        self.outputs = outputs or (lambda command: f"output of {command}")
+        self.latency = latency
+        self.sleep = sleep
+        self.commands = []
+
+    def run(self, command, timeout=60, max_output_bytes=1_000_000, head_bytes=2000, tail_bytes=2000):
+        from pulse_tools.shell_engine import CommandResult
+
+        self.commands.append(command)
+        if self.latency:
+            self.sleep(self.latency)
+        output = self.outputs(command)
+        return CommandResult(0, output, len(output), self.latency)
+
+    def alive(self):
+        return True
+
+    def close(self):
+        pass
+
+class RandomCausalLM(FakeCausalLM):
+    """FakeCausalLM that ignores the script and returns seeded random logits: a model with no grasp of the format."""
+
+    def __init__(self, tokenizer, seed=0, **kwargs):
+        import torch
+
+        super().__init__(tokenizer, replies=lambda history: "", **kwargs)
+        self.generator = torch.Generator().manual_seed(seed)
+
+    def __call__(self, input_ids, past_key_values=None, use_cache=True):
+        import torch
+
+        super().__call__(input_ids, past_key_values, use_cache)
+        return _FakeOutput(torch.randn(1, 1, self.config.vocab_size, generator=self.generator) * 4)
+
+class TinyLlamaPipeline:
+    """
+    A real transformers Llama with random weights over FakeTokenizer's byte vocabulary, so
+    batched forward passes (padding, attention masks, cache row selection) run for real.
+    It loads offline in about a second; the output is random bytes.
+    """
+
+    def __init__(self, hidden_size=512, num_hidden_layers=4, seed=0):
+        import torch
+        from transformers import LlamaConfig, LlamaForCausalLM
+
+        torch.manual_seed(seed)
+        self.tokenizer = FakeTokenizer()
+        config = LlamaConfig(
+            hidden_size=hidden_size, intermediate_size=hidden_size * 11 // 4, num_hidden_layers=num_hidden_layers,
+            num_attention_heads=max(1, hidden_size // 64), num_key_value_heads=max(1, hidden_size // 256),
+            vocab_size=self.tokenizer.vocab_size, max_position_embeddings=16384,  # byte tokens: long prompts
+        )
+        self.model = LlamaForCausalLM(config).eval()
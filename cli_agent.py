@@ -1,10 +1,27 @@
+import time
+_startup_t0 = time.perf_counter()
 from dotenv import load_dotenv
 load_dotenv()
-import time
 import sys
-from pulse_ear.speech_handler import command, speak
+import argparse
+import atexit
+import threading
+from pulse_ear.speech_handler import command, listen_for_wake_word_local, local_wake_word_available, speak, split_sentences, cancel_speech, wait_for_speech, mute_speech
 from pulse_config.config import *
-from pulse_brain.llm_interface import tool_dispatcher, load_model, load_gemini_model, generate_response
+from pulse_brain.llm_interface import tool_dispatcher, load_model, load_gemini_model, stream_llm, split_fused_response
+from pulse_brain.route_cache import RouteCache
+from pulse_brain.local_engine import get_local_engine
+from pulse_brain.rate_limiter import get_rate_limiter
+from pulse_brain.context_manager import get_context_manager
+from pulse_brain.backend_manager import get_backend_manager
+from pulse_brain import json_actions
+from pulse_brain.jobs import get_job_manager
+from pulse_brain.model_client import connect_model_server
+from pulse_brain.trajectory_cache import get_trajectory_cache
+from pulse_brain.batch_runner import read_queries, run_batch, format_report
+from pulse_config import tracing
+from pulse_config.tracing import span
+_startup_import_time = time.perf_counter() - _startup_t0
 
 def get_user_input(mode="voice"):
     if mode == "text":
@@ -13,29 +30,264 @@ def get_user_input(mode="voice"):
         except EOFError:
             return "0"
     else:
+        # Finish speaking before the mic opens, or Pulse hears itself as the next query.
+        wait_for_speech()
+        if USE_WAKE_WORD and local_wake_word_available():
+            while not listen_for_wake_word_local():
+                pass
         return command()
 
-if __name__ == '__main__':
-    
-    llm_pipeline = None
-    terminators = None
-    model_type = "local"
-    
-    print("Initializing PulseAI...")
+def load_local_backend(state):
+    """
+    Returns (model, terminators, model_type). A running pulse_model_server.py is used when
+    there is one (no torch import or model load here); otherwise the model is loaded in-process.
+    """
+    timings = state["timings"]
+    if USE_MODEL_SERVER:
+        t = time.perf_counter()
+        remote = connect_model_server(MODEL_SERVER_SOCKET)
+        timings["model server connect"] = time.perf_counter() - t
+        if remote is not None:
+            state["log"].append(f"Using the shared model server at {MODEL_SERVER_SOCKET} "
+                                f"({remote.info.get('model')}, pid {remote.info.get('pid')}).")
+            return remote, None, "remote"
+
+    t = time.perf_counter()
+    import torch, transformers
+    timings["import (local backend)"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    model, terminators = load_model(LOCAL_MODEL_ID)
+    timings["model load (local)"] = time.perf_counter() - t
+
+    if LOCAL_CONSTRAINED_JSON:
+        t = time.perf_counter()
+        json_actions.warm_up(model.tokenizer)
+        timings["action token table"] = time.perf_counter() - t
+
+    if LOCAL_KV_CACHE:
+        t = time.perf_counter()
+        engine = get_local_engine(model)
+        engine.warm_up(FUSED_ROUTER_SYSTEM_PROMPT if state["fused_routing"] else ROUTER_SYSTEM_PROMPT)
+        engine.warm_up(CLI_AGENT_SYSTEM_PROMPT)
+        timings["prefix cache warm-up"] = time.perf_counter() - t
+    return model, terminators, "local"
+
+def load_gemini_backend(state):
+    timings = state["timings"]
+    t = time.perf_counter()
+    import google.generativeai
+    timings["import (gemini backend)"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    model, _ = load_gemini_model(GEMINI_API_KEY)
+    timings["model load (gemini)"] = time.perf_counter() - t
+    return model
+
+def load_backend(state):
+    """
+    Loads the LLM backends for BACKEND_MODE. Meant to run on a background thread while the
+    user picks an input mode; results and timings are written into `state`.
+    In "auto" mode both backends are loaded when possible and registered with the backend
+    manager, which then picks one per call.
+    """
+    log = state["log"]
+    manager = get_backend_manager()
+    local = gemini = None
+
+    if BACKEND_MODE in ("auto", "local"):
+        try:
+            local, terminators, local_type = load_local_backend(state)
+            manager.register("local", "llm", model=local, model_type=local_type, terminators=terminators)
+            log.append("Local model loaded successfully.")
+        except Exception as e:
+            log.append(f"\n[WARNING] System incapable of running local model ({e}).")
+            log.append("Switching to Gemini API...")
+
+    if BACKEND_MODE == "gemini" or local is None or (BACKEND_MODE == "auto" and GEMINI_API_KEY):
+        try:
+            gemini = load_gemini_backend(state)
+            manager.register("gemini", "llm", model=gemini, model_type="gemini", needs_network=True)
+            log.append("Gemini API loaded successfully.")
+        except Exception as gemini_e:
+            if local is None:
+                log.append(f"CRITICAL: Failed to load Gemini API as well: {gemini_e}")
+                state["error"] = gemini_e
+            else:
+                log.append(f"Gemini API unavailable ({gemini_e}); using the local model only.")
+
+    if local is not None and gemini is not None:
+        state["llm_pipeline"], state["terminators"], state["model_type"] = manager, None, "auto"
+        log.append("Routing between local and Gemini backends automatically.")
+    elif local is not None:
+        state["llm_pipeline"], state["terminators"], state["model_type"] = local, terminators, local_type
+    elif gemini is not None:
+        state["llm_pipeline"], state["model_type"] = gemini, "gemini"
+
+def stream_router_response(history, llm_pipeline, terminators, model_type, speak_chat=False, on_first_token=None):
+    """
+    Streams the router generation. Tool calls are buffered silently, while chat answers are
+    printed (and optionally spoken sentence by sentence) as they arrive.
+    Returns (response, streamed) where `streamed` tells whether the answer was already shown.
+    A fused tool reply is cut off as soon as its first JSON action is complete.
+    """
+    response = ""
+    streamed = False
+    unspoken = ""
+    stream = stream_llm(llm_pipeline, history, model_type, terminators)
     try:
-        print(f"Attempting to load local model: {LOCAL_MODEL_ID}...")
-        llm_pipeline, terminators = load_model(LOCAL_MODEL_ID)
-        print("Local model loaded successfully.")
-        model_type = "local"
+        for piece in stream:
+            if not response and on_first_token:
+                on_first_token()
+            response += piece
+            if not streamed:
+                head = response.lstrip()
+                if head.startswith("[TOOL:") and head.rstrip().endswith("}") and split_fused_response(head)[1]:
+                    break
+                if not head or "[TOOL:".startswith(head[:6]):
+                    continue
+                streamed = True
+                print(f"PulseAI ({model_type}): ", end="")
+                piece = head
+            print(piece, end="", flush=True)
+            if speak_chat:
+                sentences, unspoken = split_sentences(unspoken + piece)
+                for sentence in sentences:
+                    speak(sentence)
     except Exception as e:
-        print(f"\n[WARNING] System incapable of running local model ({e}).")
-        print("Switching to Gemini API...")
+        print(f"Error generating response: {e}")
+        return "I seem to be having some trouble with my thoughts right now.", streamed
+    finally:
+        stream.close()
+
+    if streamed:
+        print()
+        if speak_chat and unspoken.strip():
+            speak(unspoken.strip())
+    return response, streamed
+
+def handle_job_command(query, job_manager):
+    """Handles `jobs`, `job <id>` (show and follow its output) and `cancel <id>`; False for anything else."""
+    words = query.split()
+    if words[:2] == ["cancel", "job"]:
+        words = ["cancel"] + words[2:]
+    if words == ["jobs"]:
+        jobs = job_manager.list()
+        if not jobs:
+            print("No background jobs.")
+        for job in jobs:
+            print(f"[{job.id}] {job.status:<10} {job.elapsed():7.1f}s  {job.task}")
+        return True
+    if len(words) != 2 or words[0] not in ("job", "cancel") or not words[1].isdigit():
+        return False
+
+    job = job_manager.get(int(words[1]))
+    if job is None:
+        print(f"No job {words[1]}.")
+    elif words[0] == "cancel":
+        print(f"Cancelling job {job.id}." if job_manager.cancel(job.id) else f"Job {job.id} is already {job.status}.")
+    else:
+        print(f"[{job.id}] {job.status}: {job.task}")
         try:
-            llm_pipeline, model_type = load_gemini_model(GEMINI_API_KEY)
-            print("Gemini API loaded successfully.")
-        except Exception as gemini_e:
-            print(f"CRITICAL: Failed to load Gemini API as well: {gemini_e}")
+            for chunk in job.follow():
+                sys.stdout.write(chunk)
+                sys.stdout.flush()
+            print(f"\n[{job.id}] {job.status}: {job.result}")
+        except KeyboardInterrupt:
+            print(f"\nStopped following job {job.id}; it keeps running.")
+    return True
+
+def announce_job(job, input_mode):
+    """Called on the job's worker thread when it finishes."""
+    print(f"\n[Job {job.id} {job.status}] {job.task}: {job.result}")
+    if input_mode == "voice":
+        speak(f"Background job {job.id} {job.status}.")
+
+def print_startup_profile(timings):
+    print("\n--- Startup Profile ---")
+    for stage, seconds in timings.items():
+        print(f"{stage:<28} {seconds * 1000:10.1f} ms")
+    print("-----------------------")
+
+def report_trace(profile, trace_file):
+    """Prints the per-span latency summary and/or writes the Chrome trace (runs at exit)."""
+    tracer = tracing.get_tracer()
+    if tracer is None:
+        return
+    if profile:
+        print("\n--- Turn Profile ---")
+        print(tracer.summary())
+        print("--------------------")
+    if trace_file:
+        tracer.export_chrome_trace(trace_file)
+        print(f"Trace written to {trace_file} (open in chrome://tracing or ui.perfetto.dev)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="PulseAI CLI agent")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="print a breakdown of import, model load and first-token time")
+    parser.add_argument("--fused-routing", action="store_true",
+                        help="route and produce the first CLI action in a single generation")
+    parser.add_argument("--profile", action="store_true",
+                        help="trace every turn and print per-stage latency histograms on exit")
+    parser.add_argument("--trace-file", metavar="PATH",
+                        help="trace every turn and write a Chrome trace JSON to PATH on exit")
+    parser.add_argument("--background", action="store_true",
+                        help="run CLI tasks as background jobs (manage them with jobs / job <id> / cancel <id>)")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="answer the queries in FILE (one per line, - for stdin) without interaction and exit")
+    parser.add_argument("--output", metavar="PATH", default=BATCH_OUTPUT_FILE,
+                        help=f"JSONL results of --batch (default {BATCH_OUTPUT_FILE})")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"router queries generated together in --batch mode (default {BATCH_SIZE})")
+    parser.add_argument("--jobs", type=int, default=BATCH_MAX_JOBS,
+                        help=f"CLI tasks run at once in --batch mode (default {BATCH_MAX_JOBS})")
+    args = parser.parse_args()
+    if args.batch:
+        mute_speech()  # unattended
+    if args.profile or args.trace_file:
+        tracing.enable()
+        atexit.register(report_trace, args.profile, args.trace_file)
+
+    print("Initializing PulseAI...")
+    print(f"Attempting to load local model: {LOCAL_MODEL_ID}... (in background)")
+
+    # Warm the model up while the user is still answering the mode prompt.
+    backend_state = {
+        "llm_pipeline": None,
+        "terminators": None,
+        "model_type": "local",
+        "error": None,
+        "fused_routing": FUSED_ROUTING or args.fused_routing,
+        "log": [],
+        "timings": {"import (app modules)": _startup_import_time},
+    }
+    startup_timings = backend_state["timings"]
+    loader = threading.Thread(target=load_backend, args=(backend_state,), daemon=True)
+    load_started = time.perf_counter()
+    loader.start()
+
+    if args.batch:
+        queries = read_queries(args.batch)
+        loader.join()
+        for line in backend_state["log"]:
+            print(line)
+        if backend_state["error"] is not None:
             sys.exit(1)
+        print(f"Running {len(queries)} queries in batch mode...")
+        stats = run_batch(
+            queries,
+            backend_state["llm_pipeline"],
+            backend_state["terminators"],
+            backend_state["model_type"],
+            args.output,
+            FUSED_ROUTER_SYSTEM_PROMPT if backend_state["fused_routing"] else ROUTER_SYSTEM_PROMPT,
+            batch_size=args.batch_size,
+            max_jobs=args.jobs,
+        )
+        print(format_report(stats))
+        print(f"Results written to {args.output}")
+        sys.exit(1 if stats["failed"] else 0)
 
     print("\nSelect Input Mode:")
     print("1. Voice Mode (Default)")
@@ -43,45 +295,146 @@ if __name__ == '__main__':
     mode_choice = input("Choice (1/2): ").strip()
     
     input_mode = "text" if mode_choice == "2" else "voice"
+    if input_mode == "voice":
+        get_backend_manager().probe.start()  # connectivity is known before the first utterance
+
+    if loader.is_alive():
+        print("Waiting for model to finish loading...")
+    wait_started = time.perf_counter()
+    loader.join()
+    startup_timings["wait after mode prompt"] = time.perf_counter() - wait_started
+    startup_timings["backend load (wall)"] = time.perf_counter() - load_started
+
+    for line in backend_state["log"]:
+        print(line)
+    if backend_state["error"] is not None:
+        sys.exit(1)
+
+    llm_pipeline = backend_state["llm_pipeline"]
+    terminators = backend_state["terminators"]
+    model_type = backend_state["model_type"]
+
     print(f"Starting in {input_mode.upper()} mode.")
 
     
     conversation_history = load_history()
+    route_cache = RouteCache(
+        ROUTE_CACHE_FILE,
+        max_entries=ROUTE_CACHE_MAX_ENTRIES,
+    ) if ROUTE_CACHE_ENABLED else None
     
+    job_manager = None
+    if BACKGROUND_JOBS or args.background:
+        job_manager = get_job_manager()
+        job_manager.on_finish = lambda job: announce_job(job, input_mode)
+        print(f"CLI tasks run as background jobs (up to {job_manager.max_workers} at once).")
+
+    startup_profile_reported = False
     listening = True
 
     while True:
         if listening:
     
-            query = get_user_input(input_mode)
+            with span("input", mode=input_mode):
+                query = get_user_input(input_mode)
             
     
             if not query or query == "0":
                 if input_mode == "text":
                     print("Exiting...")
+                    if job_manager:
+                        active = [job for job in job_manager.list() if job.active]
+                        if active:
+                            print(f"Cancelling {len(active)} unfinished job(s)...")
+                        job_manager.on_finish = None
+                        job_manager.shutdown()
+                        stats = job_manager.stats()
+                        print(f"Jobs: {stats['done']} done, {stats['failed']} failed, {stats['cancelled']} cancelled")
+                    if route_cache:
+                        stats = route_cache.stats()
+                        print(f"Route cache: {stats['hits']} hits, "
+                              f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+                    stats = get_trajectory_cache().stats() if TRAJECTORY_CACHE_ENABLED else None
+                    if stats and stats["hits"] + stats["similar_hits"] + stats["misses"]:
+                        print(f"Trajectory cache: {stats['hits']} replays, {stats['similar_hits']} proposed plans, "
+                              f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+                              f"{stats['replayed_steps']} steps without the LLM, {stats['diverged']} diverged")
+                    stats = get_context_manager().stats()
+                    if stats["trimmed_calls"]:
+                        print(f"Context manager: {stats['tokens_saved']} tokens saved over "
+                              f"{stats['trimmed_calls']}/{stats['calls']} calls")
+                    stats = json_actions.stats()
+                    if stats["steps"]:
+                        print(f"Agent actions: {stats['steps']} parsed, {stats['steps_saved']} repaired (steps saved), "
+                              f"{stats['failed']} failed ({stats['failure_rate']:.0%}), "
+                              f"{stats['constrained']} constrained generations")
+                    for name, stats in get_backend_manager().stats().items():
+                        if stats["calls"]:
+                            latency = f"{stats['latency'] * 1000:.0f} ms" if stats["latency"] is not None else "n/a"
+                            print(f"Backend {name}: {stats['calls']} calls, {stats['failures']} failures, "
+                                  f"{latency} avg latency ({stats['state']})")
+                    if model_type in ("gemini", "auto"):
+                        stats = get_rate_limiter().stats()
+                        print(f"Rate limiter: {stats['waits']}/{stats['acquisitions']} calls waited, "
+                              f"{stats['total_wait']:.1f}s total (max {stats['max_wait']:.1f}s), "
+                              f"{stats['quota_errors']} quota errors")
+                    if args.startup_profile and not startup_profile_reported:
+                        print_startup_profile(startup_timings)
+                    wait_for_speech(timeout=5)
                     break
                 listening = False
                 continue
 
-            tool_check_history = [{"role": "system", "content": ROUTER_SYSTEM_PROMPT}, {"role": "user", "content": query}]
+            if job_manager and handle_job_command(query, job_manager):
+                continue
+
+            # Barge-in: new input makes anything still being spoken stale.
+            cancel_speech()
+            turn_started = time.perf_counter()
+
+            router_prompt = FUSED_ROUTER_SYSTEM_PROMPT if backend_state["fused_routing"] else ROUTER_SYSTEM_PROMPT
+            tool_check_history = [{"role": "system", "content": router_prompt}, {"role": "user", "content": query}]
             
     
-            initial_response, _ = generate_response(
-                query, 
-                tool_check_history, 
-                llm_pipeline, 
-                terminators, 
-                model_type=model_type, 
-                is_tool_check=True
-            )
+            speak_chat = input_mode == "voice" and SPEAK_CHAT_RESPONSES
+            streamed = False
+            with span("route_cache.lookup"):
+                cached_route = route_cache.lookup(query) if route_cache else None
+            if cached_route:
+                print(f"Route cache hit: {cached_route}")
+                initial_response = cached_route
+            else:
+                generation_started = time.perf_counter()
+
+                def record_first_token():
+                    if args.startup_profile and "first token" not in startup_timings:
+                        startup_timings["first token"] = time.perf_counter() - generation_started
+
+                with span("router", model=model_type):
+                    initial_response, streamed = stream_router_response(
+                        tool_check_history,
+                        llm_pipeline,
+                        terminators,
+                        model_type,
+                        speak_chat=speak_chat,
+                        on_first_token=record_first_token
+                    )
+                if args.startup_profile and not startup_profile_reported:
+                    startup_profile_reported = True
+                    print_startup_profile(startup_timings)
+                if route_cache:
+                    # Only the route is cached; a fused first action is specific to this moment.
+                    route_cache.store(query, split_fused_response(initial_response)[0])
 
     
-            tool_name, tool_result = tool_dispatcher(
-                initial_response, 
-                llm_pipeline, 
-                terminators, 
-                model_type=model_type
-            )
+            with span("tool_dispatcher"):
+                tool_name, tool_result = tool_dispatcher(
+                    initial_response,
+                    llm_pipeline,
+                    terminators,
+                    model_type=model_type,
+                    job_manager=job_manager
+                )
 
             if tool_name:
                 print(f"Executed tool: {tool_name}")
@@ -92,19 +445,30 @@ if __name__ == '__main__':
                     
                 time.sleep(1)
                 
-                conversation_history.append({"role": "user", "content": query})
-                conversation_history.append({"role": "assistant", "content": f"Executed tool: {tool_name}"})
-                save_history(conversation_history)
+                turn = [
+                    {"role": "user", "content": query},
+                    {"role": "assistant", "content": f"Executed tool: {tool_name}"},
+                ]
+                conversation_history.extend(turn)
+                with span("history.append"):
+                    append_history(turn)
                 listening = False
+                tracing.record("turn", time.perf_counter() - turn_started, route="tool", cached=bool(cached_route))
             
             else:
-                print(f"PulseAI ({model_type}): {initial_response}")
-                if input_mode == "voice":
+                if not streamed:
+                    print(f"PulseAI ({model_type}): {initial_response}")
+                if input_mode == "voice" and not speak_chat:
                     speak("I'm not sure how to handle that.")
                 listening = False
-                conversation_history.append({"role": "user", "content": query})
-                conversation_history.append({"role": "assistant", "content": initial_response})
-                save_history(conversation_history)
+                turn = [
+                    {"role": "user", "content": query},
+                    {"role": "assistant", "content": initial_response},
+                ]
+                conversation_history.extend(turn)
+                with span("history.append"):
+                    append_history(turn)
+                tracing.record("turn", time.perf_counter() - turn_started, route="chat", cached=bool(cached_route))
                 
         else:
     
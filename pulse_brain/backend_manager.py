@@ -0,0 +1,300 @@
+import threading
+import time
+
+from pulse_brain.rate_limiter import is_quota_error
+
+NETWORK_ERROR_WORDS = ("connection", "timeout", "timed out", "deadlineexceeded", "serviceunavailable",
+                       "unreachable", "name resolution", "getaddrinfo")
+
+def is_network_error(error):
+    """True for connection failures and timeouts; quota and bad-request errors are not the network's fault."""
+    if error is None or is_quota_error(error):
+        return False
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(word in text for word in NETWORK_ERROR_WORDS)
+
+class Backend:
+    """
+    One backend (an LLM or a speech recogniser) with its health record.
+
+    Latency and error rate are exponentially weighted moving averages. A circuit breaker
+    opens after `failure_threshold` consecutive failures and keeps the backend out of
+    rotation for `cooldown` seconds; then one trial call is let through (half-open) and
+    everyone else is refused until it reports back, or for another `cooldown` if it never
+    does. A success closes the circuit, a failure re-opens it with the cooldown doubled.
+    """
+
+    def __init__(self, name, kind, model=None, model_type=None, terminators=None, needs_network=False,
+                 failure_threshold=3, cooldown=30.0, max_cooldown=300.0, alpha=0.3, clock=time.monotonic):
+        self.name = name
+        self.kind = kind
+        self.model = model
+        self.model_type = model_type
+        self.terminators = terminators
+        self.needs_network = needs_network
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.alpha = alpha
+        self.clock = clock
+
+        self.state = "closed"
+        self.cooldown = cooldown
+        self.open_until = 0.0
+        self.trial_until = None
+        self.consecutive_failures = 0
+        self.latency = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.last_error = None
+
+    def allowed(self):
+        if self.state == "open" and self.clock() >= self.open_until:
+            self.state = "half_open"
+            self.trial_until = None
+        if self.state == "half_open" and self.trial_until is not None:
+            return self.clock() >= self.trial_until
+        return self.state != "open"
+
+    def start_trial(self):
+        """Called (under the manager lock) when a half-open backend is picked: it gets the one trial call."""
+        if self.state == "half_open":
+            self.trial_until = self.clock() + self.cooldown
+
+    def record_success(self, latency):
+        self.calls += 1
+        self.latency = latency if self.latency is None else self.alpha * latency + (1 - self.alpha) * self.latency
+        self.error_rate *= 1 - self.alpha
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.trial_until = None
+        self.cooldown = self.base_cooldown
+
+    def record_failure(self, error=None):
+        self.calls += 1
+        self.failures += 1
+        self.last_error = error
+        self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+        self.consecutive_failures += 1
+        self.trial_until = None
+        if self.state == "half_open":
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            self._open()
+        elif self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.open_until = self.clock() + self.cooldown
+
+    def score(self):
+        """Lower is better: latency inflated by recent errors."""
+        return self.latency * (1 + 4 * self.error_rate)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+        }
+
+class ConnectivityProbe:
+    """
+    Checks connectivity on a background thread every `interval` seconds and caches the
+    answer, so callers never block on a network round trip. `online()` only waits (up to
+    `timeout`) if no probe has finished yet.
+    """
+
+    def __init__(self, url="http://www.google.com/", interval=30.0, timeout=3.0, check=None):
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.check = check or self._http_check
+        self.probes = 0
+        self._online = None
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _http_check(self):
+        import requests
+        try:
+            requests.get(self.url, timeout=self.timeout)
+            return True
+        except (requests.ConnectionError, requests.Timeout):
+            return False
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pulse-probe", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                self._online = bool(self.check())
+            except Exception:
+                self._online = False
+            self.probes += 1
+            self._ready.set()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def online(self, wait=True):
+        """Cached connectivity: True/False, or None if unknown and `wait` is False."""
+        self.start()
+        if wait and not self._ready.is_set():
+            self._ready.wait(self.timeout + 1)
+        return self._online
+
+    def mark_offline(self):
+        """A network call just failed: assume offline and re-probe right away."""
+        self._online = False
+        self._wake.set()
+
+class BackendManager:
+    """
+    Routes each call to the healthiest, fastest backend of a kind ("llm" or "stt").
+
+    Backends are tried in registration (preference) order. A later backend is only chosen
+    when it is measurably faster (`switch_ratio`) or the preferred one is unavailable: its
+    circuit is open, or it needs the network and the connectivity probe says offline.
+    Every `reprobe_every` calls the preferred backend is picked again so its latency
+    estimate can recover.
+    """
+
+    def __init__(self, probe=None, clock=time.monotonic, failure_threshold=3, cooldown=30.0,
+                 switch_ratio=1.5, reprobe_every=20):
+        self.probe = probe or ConnectivityProbe()
+        self.clock = clock
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.switch_ratio = switch_ratio
+        self.reprobe_every = reprobe_every
+        self.backends = {}
+        self.switches = 0
+        self._choices = 0
+        self._lock = threading.Lock()
+
+    def register(self, name, kind, **kwargs):
+        kwargs.setdefault("failure_threshold", self.failure_threshold)
+        kwargs.setdefault("cooldown", self.cooldown)
+        kwargs.setdefault("clock", self.clock)
+        self.backends[name] = Backend(name, kind, **kwargs)
+        return self.backends[name]
+
+    def get(self, name):
+        return self.backends.get(name)
+
+    def online(self, wait=True):
+        return self.probe.online(wait)
+
+    def choose(self, kind, exclude=()):
+        """Returns the backend to use for the next `kind` call, or None if none is available."""
+        with self._lock:
+            backend = self._choose(kind, exclude)
+            if backend is not None:
+                backend.start_trial()
+            return backend
+
+    def _choose(self, kind, exclude):
+        online = None
+        candidates = []
+        for backend in self.backends.values():
+            if backend.kind != kind or backend.name in exclude or not backend.allowed():
+                continue
+            if backend.needs_network:
+                if online is None:
+                    online = self.probe.online(wait=False)
+                if online is False:
+                    continue
+            candidates.append(backend)
+        if not candidates:
+            return None
+
+        self._choices += 1
+        preferred = candidates[0]
+        if preferred.latency is None or self._choices % self.reprobe_every == 0:
+            return preferred
+        unmeasured = [b for b in candidates if b.latency is None]
+        if unmeasured:
+            return unmeasured[0]
+        fastest = min(candidates, key=Backend.score)
+        if fastest is not preferred and fastest.score() * self.switch_ratio < preferred.score():
+            return fastest
+        return preferred
+
+    def record_success(self, name, latency):
+        with self._lock:
+            self.backends[name].record_success(latency)
+
+    def record_failure(self, name, error=None):
+        with self._lock:
+            backend = self.backends[name]
+            backend.record_failure(error)
+        # Quota errors are left to the rate limiter; only a failed connection says we are offline.
+        if backend.needs_network and is_network_error(error):
+            self.probe.mark_offline()
+
+    def stream(self, stream_func, history, session_id=None):
+        """
+        Streams an LLM reply from the chosen backend. Latency is the time to the first piece.
+        If a backend fails before producing anything, the next one is tried.
+        """
+        tried = []
+        last_error = None
+        while True:
+            backend = self.choose("llm", exclude=tried)
+            if backend is None:
+                raise RuntimeError(f"No LLM backend available (last error: {last_error}).")
+            if tried:
+                self.switches += 1
+                print(f"Switching to {backend.name} backend.")
+            tried.append(backend.name)
+            started = self.clock()
+            yielded = False
+            try:
+                for piece in stream_func(backend.model, history, backend.model_type, backend.terminators, session_id):
+                    if not yielded:
+                        yielded = True
+                        self.record_success(backend.name, self.clock() - started)
+                    yield piece
+                if not yielded:
+                    self.record_success(backend.name, self.clock() - started)
+                return
+            except Exception as e:
+                self.record_failure(backend.name, e)
+                print(f"{backend.name} backend failed: {e}")
+                if yielded:
+                    raise
+                last_error = e
+
+    def stats(self):
+        return {name: backend.stats() for name, backend in self.backends.items()}
+
+_backend_manager = None
+_backend_manager_lock = threading.Lock()
+
+def get_backend_manager():
+    """Returns the shared backend manager; the speech recognisers are registered up front."""
+    global _backend_manager
+    with _backend_manager_lock:
+        if _backend_manager is None:
+            from pulse_config.config import (
+                CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_COOLDOWN, CONNECTIVITY_PROBE_URL,
+                CONNECTIVITY_PROBE_INTERVAL, CONNECTIVITY_PROBE_TIMEOUT,
+            )
+            probe = ConnectivityProbe(CONNECTIVITY_PROBE_URL, CONNECTIVITY_PROBE_INTERVAL, CONNECTIVITY_PROBE_TIMEOUT)
+            _backend_manager = BackendManager(probe, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                                              cooldown=CIRCUIT_COOLDOWN)
+            _backend_manager.register("google", "stt", needs_network=True)
+            _backend_manager.register("offline", "stt")
+        return _backend_manager
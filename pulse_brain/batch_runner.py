@@ -0,0 +1,182 @@
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pulse_brain.jobs import JobManager
+from pulse_brain.local_engine import get_local_engine
+from pulse_brain.trajectory_cache import disable_trajectory_cache
+from pulse_brain.llm_interface import LOCAL_GENERATION_KWARGS, query_llm, split_fused_response, tool_dispatcher
+from pulse_config.config import LOCAL_KV_CACHE
+from pulse_config.tracing import span
+
+def read_queries(source):
+    """
+    Queries from a file, or stdin for "-": one per line, blank lines and `#` comments skipped.
+    A line may also be a JSON object with "query" and an optional "id" (copied to the results).
+    Returns a list of {"id", "query"} dicts.
+    """
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, 'r') as f:
+            lines = f.read().splitlines()
+    queries = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            item = json.loads(line)
+            queries.append({"id": item.get("id", len(queries) + 1), "query": item["query"]})
+        else:
+            queries.append({"id": len(queries) + 1, "query": line})
+    return queries
+
+def _count_tokens(text, tokenizer):
+    if tokenizer is None:
+        return max(1, len(text) // 4) if text else 0
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+def route_batch(histories, llm_pipeline, terminators, model_type, batch_size=8, generation_kwargs=None):
+    """
+    Router replies for many chats, in order. Returns (responses, generated tokens).
+
+    The local model decodes `batch_size` chats per forward pass: through the KV-cache engine
+    (which also reuses the warm system prompt) or as a padded, batched pipeline call. The
+    model server batches concurrent requests itself, and Gemini calls are simply issued
+    `batch_size` at a time. In "auto" mode the manager's local backend is used whenever its
+    circuit is closed; only otherwise do the calls go through the manager to Gemini.
+    """
+    generation_kwargs = generation_kwargs or LOCAL_GENERATION_KWARGS
+    if model_type == "auto":
+        local = llm_pipeline.get("local")
+        if local is not None and local.state == "closed":
+            try:
+                return route_batch(histories, local.model, local.terminators, local.model_type, batch_size,
+                                   generation_kwargs)
+            except Exception as e:
+                llm_pipeline.record_failure(local.name, e)
+                print(f"local backend failed: {e}")
+        with ThreadPoolExecutor(max_workers=batch_size) as pool:
+            responses = list(pool.map(lambda history: query_llm(llm_pipeline, history, model_type), histories))
+        # Count with the local tokenizer when there is one, like the local path does.
+        tokenizer = getattr(local.model, "tokenizer", None) if local is not None else None
+        return responses, sum(_count_tokens(text, tokenizer) for text in responses)
+
+    if model_type == "local" and LOCAL_KV_CACHE:
+        engine = get_local_engine(llm_pipeline)
+        responses, tokens = [], 0
+        for start in range(0, len(histories), batch_size):
+            chunk = histories[start:start + batch_size]
+            ids = [[] for _ in chunk]
+            for index, token_id in engine.generate_batch_ids(chunk, eos_token_id=terminators, **generation_kwargs):
+                if token_id is not None:
+                    ids[index].append(token_id)
+            responses += [engine.tokenizer.decode(row, skip_special_tokens=True) for row in ids]
+            tokens += sum(len(row) for row in ids)
+        return responses, tokens
+
+    if model_type == "local":
+        tokenizer = llm_pipeline.tokenizer
+        # Decoder-only models need left padding, and Llama ships without a pad token.
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token_id is None:
+            tokenizer.pad_token_id = tokenizer.eos_token_id
+        outputs = llm_pipeline(
+            histories, batch_size=batch_size, eos_token_id=terminators, return_full_text=False, **generation_kwargs
+        )
+        responses = [output[0]["generated_text"] for output in outputs]
+        return responses, sum(_count_tokens(text, tokenizer) for text in responses)
+
+    with ThreadPoolExecutor(max_workers=batch_size) as pool:
+        responses = list(pool.map(lambda history: query_llm(llm_pipeline, history, model_type, terminators), histories))
+    return responses, sum(_count_tokens(text, getattr(llm_pipeline, "tokenizer", None)) for text in responses)
+
+def run_batch(queries, llm_pipeline, terminators, model_type, output_path, router_prompt,
+              batch_size=8, max_jobs=4, shell_session=None):
+    """
+    Answers `queries` (from read_queries) without interaction and writes one JSON line per
+    query to `output_path`, in input order. Queries are routed `batch_size` at a time; CLI
+    tasks run as background jobs (up to `max_jobs` at once) while later batches are routed.
+    Every query reaches the current prompts: the route cache and history are not used, and the
+    trajectory cache is turned off for the process (no replayed plans, nothing recorded).
+    Returns the throughput stats printed by `format_report`.
+    """
+    disable_trajectory_cache()
+    job_manager = JobManager(max_jobs)
+    results = [None] * len(queries)
+    stats = {"queries": len(queries), "chat": 0, "tasks": 0, "router_tokens": 0, "router_time": 0.0,
+             "done": 0, "failed": 0, "cancelled": 0}
+    written = 0
+    started = time.perf_counter()
+
+    def write_ready(out, wait=False):
+        nonlocal written
+        while written < len(results) and results[written] is not None:
+            record, job = results[written]
+            if job is not None:
+                if wait:
+                    job.future.result()
+                elif job.active:
+                    return
+                record.update(status=job.status, result=job.result, output="".join(job.output),
+                              seconds=round(job.elapsed(), 3))
+                stats[job.status] += 1
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            written += 1
+
+    try:
+        with open(output_path, 'w') as out:
+            for start in range(0, len(queries), batch_size):
+                chunk = queries[start:start + batch_size]
+                histories = [
+                    [{"role": "system", "content": router_prompt}, {"role": "user", "content": item["query"]}]
+                    for item in chunk
+                ]
+                routed = time.perf_counter()
+                with span("batch.route", size=len(chunk)):
+                    responses, tokens = route_batch(histories, llm_pipeline, terminators, model_type, batch_size)
+                stats["router_time"] += time.perf_counter() - routed
+                stats["router_tokens"] += tokens
+
+                for offset, (item, response) in enumerate(zip(chunk, responses)):
+                    record = {"id": item["id"], "query": item["query"], "response": response}
+                    job = None
+                    if split_fused_response(response)[0].strip().startswith("[TOOL:"):
+                        stats["tasks"] += 1
+                        known = set(job_manager.jobs)
+                        tool_name, tool_result = tool_dispatcher(
+                            response, llm_pipeline, terminators, model_type=model_type,
+                            shell_session=shell_session, job_manager=job_manager,
+                        )
+                        new = set(job_manager.jobs) - known
+                        record.update(route="tool", tool=tool_name, result=tool_result)
+                        if new:
+                            job = job_manager.get(new.pop())
+                            record["task"] = job.task
+                        else:
+                            stats["failed"] += 1
+                            record["status"] = "failed"
+                    else:
+                        stats["chat"] += 1
+                        record["route"] = "chat"
+                    results[start + offset] = (record, job)
+                write_ready(out)
+            write_ready(out, wait=True)
+    finally:
+        job_manager.shutdown()
+    stats["wall"] = time.perf_counter() - started
+    return stats
+
+def format_report(stats):
+    wall = stats["wall"] or 1e-9
+    router_time = stats["router_time"] or 1e-9
+    return (
+        f"Batch: {stats['queries']} queries in {stats['wall']:.1f}s ({stats['queries'] / wall:.2f} queries/s); "
+        f"{stats['chat']} chat, {stats['tasks']} CLI tasks "
+        f"({stats['done']} done, {stats['failed']} failed, {stats['cancelled']} cancelled)\n"
+        f"Router: {stats['router_tokens']} tokens in {stats['router_time']:.1f}s "
+        f"({stats['router_tokens'] / router_time:.1f} tokens/s, {stats['router_tokens'] / wall:.1f} tokens/s overall)"
+    )
@@ -1,82 +1,179 @@
+import contextvars
 import json
-import time
-from pulse_config.config import CLI_AGENT_SYSTEM_PROMPT
+import threading
+from pulse_config.config import (
+    CLI_AGENT_SYSTEM_PROMPT, SHELL_ECHO_OUTPUT, PERSISTENT_SHELL, TRAJECTORY_CACHE_ENABLED, TRAJECTORY_REPLAY,
+)
 from pulse_tools.general_tools import execute_shell_command
-from pulse_ear.speech_handler import speak
+from pulse_tools.shell_session import open_shell_session
+from pulse_ear.speech_handler import speak, PRIORITY_HIGH, PRIORITY_LOW
+from pulse_brain.json_actions import ActionParser, clean_json_response, parse_action, record_parse
+from pulse_brain.trajectory_cache import Replay, get_trajectory_cache, plan_hint
+from pulse_config.tracing import span, count
 
-def clean_json_response(response_str):
-    """Helper to strip Markdown code blocks if present."""
-    if "```json" in response_str:
-        response_str = response_str.split("```json")[1].split("```")[0].strip()
-    elif "```" in response_str:
-        response_str = response_str.split("```")[0].strip()
-    return response_str
+def read_json_action(chunks):
+    """
+    Consumes a streamed response until the first top-level JSON object is complete and
+    returns that object's text, so the agent can act without waiting for trailing output.
+    If no complete object arrives, returns everything from its opening brace (or the full text).
+    """
+    parser = ActionParser()
+    try:
+        for piece in chunks:
+            if parser.feed(piece):
+                break
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    return parser.text
 
-def start_cli_agent_loop(task_description, query_func,model_type):
+def start_cli_agent_loop(task_description, query_func, model_type, stream_func=None, shell_session=None,
+                         first_action=None, cancel=None, prefill_func=None):
+    # One persistent shell per task, so cd/exports/venvs carry over between steps.
+    # A session passed in by the caller is used as-is and left open.
+    # `first_action` is a JSON action already produced by fused routing; it becomes step 1.
+    # `cancel` (a background Job) stops the loop between steps and interrupts a running command.
+    # Finished tasks are recorded in the trajectory cache; a repeated task replays its plan.
+    # `prefill_func(history)` warms the model's cache with the fused first action while its
+    # command runs (the model generated it under the router prompt, not this one).
+    with span("agent.task", model=model_type, fused=first_action is not None):
+        if shell_session is not None:
+            return _run_agent_loop(task_description, query_func, stream_func, shell_session, first_action, cancel,
+                                   prefill_func)
+        shell_session = open_shell_session(echo=SHELL_ECHO_OUTPUT) if PERSISTENT_SHELL else None
+        try:
+            if cancel is not None and shell_session is not None:
+                cancel.on_cancel(shell_session.interrupt)
+            return _run_agent_loop(task_description, query_func, stream_func, shell_session, first_action, cancel,
+                                   prefill_func)
+        finally:
+            if shell_session is not None:
+                shell_session.close()
+
+def _run_agent_loop(task_description, query_func, stream_func, shell_session, first_action=None, cancel=None,
+                    prefill_func=None):
+    # A background job (`cancel` set) stays quiet: its narration would play while the main
+    # loop is listening, and the job manager announces when it finishes.
+    say = speak if cancel is None else (lambda *args, **kwargs: None)
     print(f"CLI Agent Activated. Task: {task_description}")
-    speak(f"Starting CLI task: {task_description}")
+    say(f"Starting CLI task: {task_description}")
+
+    # A `[TOOL: cli_agent]` route without a task has nothing to look up or record.
+    trajectories = get_trajectory_cache() if TRAJECTORY_CACHE_ENABLED and task_description else None
+    replay, hint, steps_taken = None, "", []
+    prefill_thread = None
+    if trajectories is not None:
+        trajectory, exact = trajectories.lookup(task_description)
+        if trajectory is not None and exact and TRAJECTORY_REPLAY:
+            replay = Replay(trajectory)
+            print(f"Replaying the cached plan for this task ({len(replay.steps)} commands).")
+        elif trajectory is not None:
+            hint = plan_hint(trajectory)
 
     history = [
         {"role": "system", "content": CLI_AGENT_SYSTEM_PROMPT},
-        {"role": "user", "content": f"START_TASK: {task_description}"}
+        {"role": "user", "content": f"START_TASK: {task_description}{hint}"}
     ]
 
-    # RATE LIMIT CONFIG
-    RATE_LIMIT_DELAY = 32 
-    last_request_time = 0 
-
+    # Gemini rate limiting is handled by the shared limiter in llm_interface.
     for step in range(10):
-        try:
-            # --- 1. RATE LIMIT CHECK ---
-            if model_type == "gemini":
-                time_since_last = time.time() - last_request_time
-                
-                if time_since_last < RATE_LIMIT_DELAY and last_request_time != 0:
-                    wait_time = RATE_LIMIT_DELAY - time_since_last
-                    print(f"Rate limit safety: Waiting {wait_time:.1f} seconds...")
-                    time.sleep(wait_time)
+        if cancel is not None and cancel.cancelled:
+            print("CLI task cancelled.")
+            return "CLI task cancelled."
+        with span("agent.step", step=step + 1) as step_trace:
+            try:
+                # --- 1. THINK ---
+                print(f"Thinking (Step {step+1})...")
+                replayed = None
+                with span("agent.think", fused=step == 0 and first_action is not None) as think_trace:
+                    if step == 0 and first_action is not None:
+                        response_str = first_action
+                    elif replay is not None and replay.active:
+                        replayed = replay.next_action()
+                        response_str = json.dumps(replayed)
+                        trajectories.record_replayed_step()
+                        think_trace.set(replayed=True)
+                    else:
+                        if prefill_thread is not None:
+                            # A late prefill would crop away the cache this step builds.
+                            prefill_thread.join()
+                            prefill_thread = None
+                        if stream_func:
+                            response_str = read_json_action(stream_func(history))
+                        else:
+                            response_str = query_func(history)
+                if replayed is not None:
+                    ai_decision = replayed
+                    history.append({"role": "assistant", "content": response_str})
+                else:
+                    with span("agent.parse") as parse_trace:
+                        try:
+                            ai_decision, repaired = parse_action(response_str)
+                        except json.JSONDecodeError:
+                            record_parse(failed=True)
+                            count("agent.parse_failed")
+                            history.append({"role": "assistant", "content": response_str})
+                            raise
+                        record_parse(repaired=repaired)
+                        parse_trace.set(repaired=repaired)
+                        if repaired:
+                            # Show the model its action as valid JSON, not the malformed original.
+                            count("agent.parse_repaired")
+                            response_str = json.dumps(ai_decision)
+                        else:
+                            response_str = clean_json_response(response_str)
+                        history.append({"role": "assistant", "content": response_str})
+                thought = ai_decision.get("thought", "...")
+                action = ai_decision.get("action")
+                args = ai_decision.get("arguments", {})
+                step_trace.set(action=action)
+
+                print(f"CLI Agent Thought: {thought}")
+
+                # --- 2. ACT ---
+                if action == "finish":
+                    if trajectories is not None:
+                        trajectories.store(task_description, steps_taken, thought)
+                    print("CLI Task Complete.")
+                    say("CLI task complete.", priority=PRIORITY_HIGH)
+                    return "CLI task finished."
 
-            # --- 2. THINK ---
-            print(f"Thinking (Step {step+1})...")
-            response_str = query_func(history)
-            response_str = clean_json_response(response_str)
-            last_request_time = time.time()
-            
-            history.append({"role": "assistant", "content": response_str})
+                if cancel is not None and cancel.cancelled:
+                    print("CLI task cancelled.")
+                    return "CLI task cancelled."
 
-            ai_decision = json.loads(response_str)
-            thought = ai_decision.get("thought", "...")
-            action = ai_decision.get("action")
-            args = ai_decision.get("arguments", {})
+                if action == "execute_shell_command":
+                    command = args.get("command")
+                    say(f"Running command: {command}", priority=PRIORITY_LOW)
+                    if prefill_func is not None and step == 0 and first_action is not None:
+                        # The agent's cache lacks the fused action: prefill it while the command
+                        # runs, so step 2 only adds the output.
+                        prefill_thread = threading.Thread(target=contextvars.copy_context().run,
+                                                          args=(prefill_func, list(history)), daemon=True)
+                        prefill_thread.start()
 
-            print(f"CLI Agent Thought: {thought}")
+                    tool_output = execute_shell_command(command, session=shell_session)
+                    if not SHELL_ECHO_OUTPUT:
+                        print(f"CLI Agent Observation: {tool_output}")
+                    steps_taken.append({"thought": thought, "command": command, "output": tool_output})
+                    if replay is not None and not replay.observe(command, tool_output):
+                        replay = None
+                        trajectories.record_divergence()
+                        print("Output differs from the cached plan; asking the model from here.")
 
-            # --- 3. ACT ---
-            if action == "finish":
-                print("CLI Task Complete.")
-                speak("CLI task complete.")
-                return "CLI task finished."
+                    # --- 3. OBSERVE ---
+                    history.append({"role": "user", "content": f"Tool Output: {tool_output}"})
 
-            if action == "execute_shell_command":
-                command = args.get("command")
-                speak(f"Running command: {command}") 
-                
-                tool_output = execute_shell_command(command)
-                print(f"CLI Agent Observation: {tool_output}")
-                
-                # --- 4. OBSERVE ---
-                history.append({"role": "user", "content": f"Tool Output: {tool_output}"})
-            
-            else:
-                history.append({"role": "user", "content": f"Error: Unknown tool '{action}'."})
+                else:
+                    history.append({"role": "user", "content": f"Error: Unknown tool '{action}'."})
 
-        except json.JSONDecodeError:
-            print(f"Error: LLM did not return valid JSON. Response: {response_str}")
-            history.append({"role": "user", "content": "Error: You must respond in valid JSON."})
-        except Exception as e:
-            print(f"Error in CLI agent loop: {e}")
-            speak("I ran into an error. Stopping.")
-            return f"Error: {e}"
+            except json.JSONDecodeError:
+                print(f"Error: LLM did not return valid JSON. Response: {response_str}")
+                history.append({"role": "user", "content": "Error: You must respond in valid JSON."})
+            except Exception as e:
+                print(f"Error in CLI agent loop: {e}")
+                say("I ran into an error. Stopping.", priority=PRIORITY_HIGH, interrupt=True)
+                return f"Error: {e}"
 
-    speak("Task step limit reached.")
+    say("Task step limit reached.")
     return "CLI task step limit reached."
\ No newline at end of file
@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+
+MESSAGE_OVERHEAD_TOKENS = 4  # role header / separators added by the chat template
+
+def estimate_tokens(history):
+    """Rough token count for a chat history (~4 characters per token)."""
+    return sum(len(msg["content"]) // 4 + MESSAGE_OVERHEAD_TOKENS for msg in history) + 1
+
+def compact_observation(content, max_chars=300):
+    """Shrinks an old `Tool Output:` message to its first lines plus a note of what was dropped."""
+    if len(content) <= max_chars:
+        return content
+    head = content[:max_chars].rsplit("\n", 1)[0] if "\n" in content[:max_chars] else content[:max_chars]
+    return f"{head}\n[... {len(content) - len(head)} chars of older output compacted ...]"
+
+class ContextManager:
+    """
+    Keeps every prompt within a token budget.
+
+    The system prompt, the task message and the newest `keep_recent` messages are always
+    sent verbatim. When a history is over budget, older `Tool Output:` observations are
+    compacted to short summaries first (oldest first); if that is not enough, the oldest
+    assistant/user pairs after the task are dropped. Tokens are counted with the active
+    tokenizer when there is one (cached per message), otherwise estimated.
+    """
+
+    def __init__(self, budget=4096, keep_recent=4, summary_chars=300, cache_size=4096):
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.summary_chars = summary_chars
+        self.cache_size = cache_size
+        self.calls = 0
+        self.trimmed_calls = 0
+        self.tokens_saved = 0
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _message_tokens(self, msg, tokenizer):
+        if tokenizer is None:
+            return len(msg["content"]) // 4 + MESSAGE_OVERHEAD_TOKENS
+        key = (id(tokenizer), msg["content"])
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                return count
+        count = len(tokenizer.encode(msg["content"], add_special_tokens=False)) + MESSAGE_OVERHEAD_TOKENS
+        with self._lock:
+            self._counts[key] = count
+            while len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return count
+
+    def count_tokens(self, history, tokenizer=None):
+        return sum(self._message_tokens(msg, tokenizer) for msg in history)
+
+    def fit(self, history, tokenizer=None):
+        """Returns (history_within_budget, tokens_before, tokens_after). The input is not modified."""
+        counts = [self._message_tokens(msg, tokenizer) for msg in history]
+        before = sum(counts)
+        self.calls += 1
+        if before <= self.budget:
+            return history, before, before
+
+        fitted = list(history)
+        total = before
+        # Protected: system prompt + task at the start, newest turns at the end.
+        first_free = 2 if len(fitted) > 1 and fitted[0]["role"] == "system" else 1
+        last_free = len(fitted) - self.keep_recent
+
+        for i in range(first_free, last_free):
+            if total <= self.budget:
+                break
+            msg = fitted[i]
+            if msg["role"] == "user" and msg["content"].startswith("Tool Output:"):
+                compacted = {**msg, "content": compact_observation(msg["content"], self.summary_chars)}
+                new_count = self._message_tokens(compacted, tokenizer)
+                total -= counts[i] - new_count
+                counts[i] = new_count
+                fitted[i] = compacted
+
+        # Drop whole assistant/user pairs so roles keep alternating.
+        while total > self.budget and last_free - first_free >= 2:
+            total -= counts[first_free] + counts[first_free + 1]
+            del fitted[first_free:first_free + 2]
+            del counts[first_free:first_free + 2]
+            last_free -= 2
+
+        self.trimmed_calls += 1
+        self.tokens_saved += before - total
+        return fitted, before, total
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "trimmed_calls": self.trimmed_calls,
+            "tokens_saved": self.tokens_saved,
+        }
+
+_context_manager = None
+
+def get_context_manager():
+    """Returns the shared context manager configured from pulse_config."""
+    global _context_manager
+    if _context_manager is None:
+        from pulse_config.config import CONTEXT_TOKEN_BUDGET, CONTEXT_KEEP_RECENT, CONTEXT_SUMMARY_CHARS
+        _context_manager = ContextManager(CONTEXT_TOKEN_BUDGET, CONTEXT_KEEP_RECENT, CONTEXT_SUMMARY_CHARS)
+    return _context_manager
@@ -0,0 +1,263 @@
+import json
+import os
+import re
+import time
+
+# Bump when the cache layout changes so stale files are re-quantized instead of misread.
+CACHE_FORMAT = "pulse-int8-v1"
+
+# Quantized backends with dynamic int8 linear kernels, in order of preference
+# (x86/fbgemm on Intel and AMD, qnnpack on ARM).
+QUANTIZED_ENGINES = ("x86", "fbgemm", "qnnpack")
+
+def quantized_engine():
+    """The quantized backend int8 layers run on (the current one if usable), or None if torch has none."""
+    import torch
+
+    supported = torch.backends.quantized.supported_engines
+    if torch.backends.quantized.engine in QUANTIZED_ENGINES:
+        return torch.backends.quantized.engine
+    return next((name for name in QUANTIZED_ENGINES if name in supported), None)
+
+def resolve_engine(engine):
+    """
+    Maps "auto" to "bf16" on CUDA and Apple-silicon (MPS) machines, and to "cpu-int8" on
+    CPU-only machines whose torch build has a quantized int8 backend (bf16 otherwise).
+    """
+    if engine != "auto":
+        return engine
+    import torch
+    if torch.cuda.is_available() or torch.backends.mps.is_available():
+        return "bf16"
+    return "cpu-int8" if quantized_engine() else "bf16"
+
+def physical_cores():
+    """Physical cores available to this process; hyperthreads don't help matmul-bound decoding."""
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:
+        available = os.cpu_count() or 1
+    try:
+        import psutil
+        physical = psutil.cpu_count(logical=False) or available
+    except ImportError:
+        physical = available
+    return max(1, min(available, physical))
+
+def tune_threads(num_threads=None):
+    """Sets torch's intra-op threads (default: one per physical core) and a single inter-op thread."""
+    import torch
+
+    num_threads = num_threads or physical_cores()
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # only settable before the first parallel op
+    return num_threads
+
+def _release_freed_memory():
+    """Hands the float weights freed while quantizing back to the OS (glibc keeps them otherwise)."""
+    import ctypes
+    import gc
+
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def _child(model, name):
+    parent_name, _, attr = name.rpartition(".")
+    return (model.get_submodule(parent_name) if parent_name else model), attr
+
+def _float32_copy(linear):
+    """
+    A float32 copy of `linear` to quantize from. Calling .float() on the layer itself would
+    convert its parameters in place, and a tied lm_head shares its weight with the embedding.
+    """
+    import torch
+
+    copy = torch.nn.Linear(linear.in_features, linear.out_features, bias=linear.bias is not None, device="meta")
+    copy.weight = torch.nn.Parameter(linear.weight.detach().float(), requires_grad=False)
+    if linear.bias is not None:
+        copy.bias = torch.nn.Parameter(linear.bias.detach().float(), requires_grad=False)
+    return copy
+
+def _embeddings_to_float32_output(model):
+    """
+    Embedding tables stay bf16 (for a 128k vocabulary that is 0.8 GB less than float32);
+    their output is cast to float32, which is what the quantized linear layers expect.
+    """
+    import torch
+
+    for module in model.modules():
+        if isinstance(module, torch.nn.Embedding):
+            module.register_forward_hook(lambda module, inputs, output: output.float())
+
+def quantize_linear_layers(model):
+    """
+    Swaps every nn.Linear for a dynamically quantized int8 one (per-channel weights),
+    one layer at a time, so peak memory stays near the bf16 model instead of a full fp32 copy.
+    Norms and other small weights are converted to float32; embeddings stay bf16.
+    """
+    import torch
+    from torch.ao.nn.quantized.dynamic import Linear as QuantizedLinear
+    from torch.ao.quantization import per_channel_dynamic_qconfig
+
+    names = [name for name, module in model.named_modules() if isinstance(module, torch.nn.Linear)]
+    with torch.no_grad():
+        for name in names:
+            parent, attr = _child(model, name)
+            layer = _float32_copy(getattr(parent, attr))
+            layer.qconfig = per_channel_dynamic_qconfig
+            setattr(parent, attr, QuantizedLinear.from_float(layer))
+        for module in model.modules():
+            keep_dtype = isinstance(module, torch.nn.Embedding)
+            for tensors in (module._parameters, module._buffers):
+                for key, tensor in tensors.items():
+                    if tensor is not None and tensor.is_floating_point():
+                        # A copy either way: tensors still backed by the memory-mapped checkpoint
+                        # would keep every page read while quantizing resident.
+                        tensor.data = tensor.data.clone() if keep_dtype else tensor.data.float()
+    _embeddings_to_float32_output(model)
+    model.config.tie_word_embeddings = False  # lm_head now has its own int8 weights
+    _release_freed_memory()
+    return len(names)
+
+def save_quantized(model, path, metadata=None):
+    """Writes the quantized model as one safetensors file: int8 weights, scales and float tensors."""
+    import torch
+    from safetensors.torch import save_file
+    from torch.ao.nn.quantized.dynamic import Linear as QuantizedLinear
+
+    tensors = {}
+    quantized = set()
+    for name, module in model.named_modules():
+        if isinstance(module, QuantizedLinear):
+            quantized.add(name)
+            weight, bias = module._weight_bias()
+            tensors[f"{name}.int8_weight"] = weight.int_repr()
+            tensors[f"{name}.int8_scales"] = weight.q_per_channel_scales().float()
+            tensors[f"{name}.int8_zero_points"] = weight.q_per_channel_zero_points()
+            if bias is not None:
+                tensors[f"{name}.bias"] = bias.detach()
+    # Buffers too (e.g. rotary inv_freq), since the skeleton is built on the meta device.
+    for name, tensor in list(model.named_parameters()) + list(model.named_buffers()):
+        if name.rpartition(".")[0] not in quantized:
+            tensors[name] = tensor.detach().contiguous()
+
+    header = {"format": CACHE_FORMAT, "torch": torch.__version__, "quantized": json.dumps(sorted(quantized))}
+    header.update(metadata or {})
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    save_file(tensors, tmp, metadata=header)
+    os.replace(tmp, path)
+
+def load_quantized(path, config):
+    """
+    Rebuilds a model saved by save_quantized. The skeleton is created on the meta device (no
+    weight allocation), and the tensors are read from the memory-mapped safetensors file and
+    copied out of it (int8 weights are repacked by set_weight_bias), so the mapping is released.
+    """
+    import torch
+    from safetensors import safe_open
+    from torch.ao.nn.quantized.dynamic import Linear as QuantizedLinear
+    from transformers import AutoModelForCausalLM
+
+    with safe_open(path, framework="pt") as f:
+        header = f.metadata()
+        quantized = json.loads(header["quantized"])
+        with torch.device("meta"):
+            model = AutoModelForCausalLM.from_config(config, dtype=torch.float32)
+
+        for name in quantized:
+            parent, attr = _child(model, name)
+            layer = getattr(parent, attr)
+            bias = f.get_tensor(f"{name}.bias") if layer.bias is not None else None
+            qlayer = QuantizedLinear(layer.in_features, layer.out_features, bias_=bias is not None, dtype=torch.qint8)
+            weight = torch._make_per_channel_quantized_tensor(
+                f.get_tensor(f"{name}.int8_weight"),
+                f.get_tensor(f"{name}.int8_scales").double(),
+                f.get_tensor(f"{name}.int8_zero_points"),
+                0,
+            )
+            qlayer.set_weight_bias(weight, bias)
+            setattr(parent, attr, qlayer)
+
+        prefixes = tuple(f"{name}." for name in quantized)
+        for key in f.keys():
+            if key.startswith(prefixes):
+                continue
+            module, attr = _child(model, key)
+            tensor = f.get_tensor(key).clone()
+            if attr in module._parameters:
+                module._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+            else:
+                module._buffers[attr] = tensor
+
+    _embeddings_to_float32_output(model)
+    model.config.tie_word_embeddings = False
+    _release_freed_memory()
+    return model.eval()
+
+def cache_path(model_id, cache_dir):
+    return os.path.join(cache_dir, re.sub(r"[^\w.-]+", "--", model_id).strip("-") + ".int8.safetensors")
+
+def _cache_valid(path, model_id):
+    import torch
+    from safetensors import safe_open
+
+    try:
+        with safe_open(path, framework="pt") as f:
+            header = f.metadata() or {}
+    except Exception:
+        return False
+    return (header.get("format") == CACHE_FORMAT and header.get("model_id") == model_id
+            and header.get("torch") == torch.__version__)
+
+def load_int8_model(model_id, cache_dir=None, num_threads=None):
+    """
+    Returns the model with int8 dynamically quantized linear layers for CPU inference.
+    With `cache_dir`, the quantized weights are saved after the first load and later
+    loads read them directly (memory-mapped) instead of loading bf16 and quantizing again.
+    """
+    import torch
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    engine = quantized_engine()
+    if engine is None:
+        raise RuntimeError(f"this torch build has no quantized int8 backend ({QUANTIZED_ENGINES})")
+    torch.backends.quantized.engine = engine
+    threads = tune_threads(num_threads)
+    config = AutoConfig.from_pretrained(model_id)
+    path = cache_path(model_id, cache_dir) if cache_dir else None
+    if path and os.path.exists(path) and _cache_valid(path, model_id):
+        started = time.perf_counter()
+        model = load_quantized(path, config)
+        print(f"Loaded int8 model from {path} in {time.perf_counter() - started:.1f}s ({threads} threads).")
+        return model
+
+    started = time.perf_counter()
+    # safetensors checkpoints are memory-mapped; bf16 halves what has to be paged in.
+    model = AutoModelForCausalLM.from_pretrained(model_id, dtype=torch.bfloat16, use_safetensors=True)
+    loaded = time.perf_counter()
+    layers = quantize_linear_layers(model)
+    model.eval()
+    print(f"Quantized {layers} linear layers to int8 in {time.perf_counter() - loaded:.1f}s "
+          f"(load {loaded - started:.1f}s, {threads} threads).")
+    if path:
+        try:
+            save_quantized(model, path, {"model_id": model_id})
+            print(f"Cached the int8 model at {path}.")
+        except Exception as e:
+            print(f"Could not cache the int8 model ({e}).")
+    return model
+
+def load_int8_pipeline(model_id, cache_dir=None, num_threads=None):
+    """load_model's CPU variant: a text-generation pipeline over the int8 model."""
+    from transformers import AutoTokenizer, pipeline
+
+    model = load_int8_model(model_id, cache_dir, num_threads)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    return pipeline("text-generation", model=model, tokenizer=tokenizer, device="cpu")
@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict
+
+def to_gemini_content(msg):
+    """Converts one chat message into the Gemini `contents` format."""
+    role = "model" if msg["role"] == "assistant" else "user"
+    return {"role": role, "parts": [msg["content"]]}
+
+class _ChatSession:
+    """Converted Gemini contents for one conversation and how much of the history they cover."""
+
+    def __init__(self, model, system_instruction):
+        self.model = model
+        self.system_instruction = system_instruction
+        self.contents = []
+        self.synced = 0
+        self.user_messages = {}
+
+    def matches(self, history):
+        """True if `history` only adds messages after what this session has already sent."""
+        if len(history) <= self.synced or history[self.synced - 1]["role"] != "assistant":
+            return False
+        return all(history[i]["content"] == content for i, content in self.user_messages.items())
+
+class GeminiSessionPool:
+    """
+    Reuses Gemini models and conversations across calls.
+
+    One GenerativeModel is kept per system instruction, and each agent loop gets a live
+    session (keyed by `session_id`) that holds the already-converted contents. A call only
+    converts the messages added since the previous one, i.e. the model's last reply and
+    the new user turn. If the history no longer lines up (e.g. earlier turns were edited)
+    the session is rebuilt from scratch.
+    """
+
+    def __init__(self, base_model, model_name=None, genai_module=None, max_sessions=16):
+        self.base_model = base_model
+        self.model_name = model_name or getattr(base_model, "model_name", None)
+        self.max_sessions = max_sessions
+        self.models = {}
+        self.sessions = OrderedDict()
+        self.model_builds = 0
+        self.conversions = 0
+        self.session_rebuilds = 0
+        self._genai = genai_module
+        self._lock = threading.Lock()
+
+    def genai(self):
+        if self._genai is None:
+            import google.generativeai as genai
+            self._genai = genai
+        return self._genai
+
+    def model_for(self, system_instruction):
+        if not system_instruction:
+            return self.base_model
+        with self._lock:
+            model = self.models.get(system_instruction)
+            if model is None:
+                model = self.genai().GenerativeModel(self.model_name, system_instruction=system_instruction)
+                self.models[system_instruction] = model
+                self.model_builds += 1
+            return model
+
+    def _convert(self, messages):
+        self.conversions += len(messages)
+        return [to_gemini_content(msg) for msg in messages]
+
+    def send(self, history, session_id=None, stream=False):
+        """Sends `history` to Gemini and returns the (possibly streaming) response."""
+        system_instruction = None
+        if history and history[0]["role"] == "system":
+            system_instruction = history[0]["content"]
+        model = self.model_for(system_instruction)
+        offset = 1 if system_instruction is not None else 0
+
+        if session_id is None:
+            contents = self._convert(history[offset:])
+            return model.generate_content(contents, stream=stream)
+
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is not None and session.model is model and session.matches(history):
+                new_messages = history[session.synced - 1:]
+            else:
+                if session is not None:
+                    self.session_rebuilds += 1
+                session = _ChatSession(model, system_instruction)
+                self.sessions[session_id] = session
+                new_messages = history[offset:]
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+            session.contents.extend(self._convert(new_messages))
+            for i in range(len(history) - len(new_messages), len(history)):
+                if history[i]["role"] == "user":
+                    session.user_messages[i] = history[i]["content"]
+            # The model's reply will be appended by the caller; it is converted on the next call.
+            session.synced = len(history) + 1
+            contents = list(session.contents)
+
+        return model.generate_content(contents, stream=stream)
+
+    def close_session(self, session_id):
+        with self._lock:
+            self.sessions.pop(session_id, None)
+
+    def stats(self):
+        return {
+            "model_builds": self.model_builds,
+            "conversions": self.conversions,
+            "session_rebuilds": self.session_rebuilds,
+            "live_sessions": len(self.sessions),
+        }
+
+_gemini_pool = None
+
+def get_gemini_pool(base_model, genai_module=None):
+    """
+    Returns the shared session pool for a loaded Gemini model, creating it on first use.
+    `genai_module` replaces google.generativeai for the pool (e.g. the benchmark fakes).
+    """
+    global _gemini_pool
+    if _gemini_pool is None or _gemini_pool.base_model is not base_model:
+        _gemini_pool = GeminiSessionPool(base_model, genai_module=genai_module)
+    return _gemini_pool
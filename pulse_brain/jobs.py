@@ -0,0 +1,226 @@
+import contextvars
+import itertools
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class Job:
+    """
+    One background task. Status goes queued -> running -> done/failed/cancelled.
+
+    Everything the task prints on its worker thread is kept in `output` instead of going to
+    the terminal. A job is also the task's cancel token: the CLI agent checks `cancelled`
+    between steps and registers `on_cancel` callbacks (e.g. interrupting its shell).
+    """
+
+    def __init__(self, job_id, task):
+        self.id = job_id
+        self.task = task
+        self.status = "queued"
+        self.result = None
+        self.output = []
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        self._cancel_event = threading.Event()
+        self._cancel_callbacks = []
+        self._changed = threading.Condition()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def on_cancel(self, callback):
+        """Calls `callback()` when the job is cancelled (right away if it already was)."""
+        with self._changed:
+            if not self.cancelled:
+                self._cancel_callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._changed:
+            if self.cancelled or not self.active:
+                return False
+            self._cancel_event.set()
+            callbacks, self._cancel_callbacks = self._cancel_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                self.write(f"Error while cancelling: {e}\n")
+        return True
+
+    def write(self, text):
+        with self._changed:
+            self.output.append(text)
+            self._changed.notify_all()
+
+    def _set_status(self, status, result=None):
+        with self._changed:
+            self.status = status
+            if status == "running":
+                self.started = time.time()
+            elif status in ("done", "failed", "cancelled"):
+                self.result = result
+                self.finished = time.time()
+            self._changed.notify_all()
+
+    def follow(self, start=0, timeout=None):
+        """Yields output chunks from index `start` as they are written, until the job ends."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._changed:
+                while len(self.output) <= start and self.active:
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        return
+                    self._changed.wait(remaining)
+                chunks = self.output[start:]
+                active = self.active
+            for chunk in chunks:
+                yield chunk
+            start += len(chunks)
+            if not active:
+                return
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+# The job whose worker is running. Helper threads a job starts (shell output readers, the
+# KV-cache prefill) run in a copy of its context, so their output is the job's too.
+_current_job = contextvars.ContextVar("pulse_job", default=None)
+
+class _JobRoutedStdout:
+    """sys.stdout replacement: writes made in a job's context go to that job's output."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        job = _current_job.get()
+        if job is None:
+            return self.stream.write(text)
+        job.write(text)
+        return len(text)
+
+    def flush(self):
+        if _current_job.get() is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class JobManager:
+    """
+    Runs tasks on a bounded thread pool so the main loop stays free for new input.
+
+    `submit(task, run)` queues `run(job)` and returns the Job right away; at most
+    `max_workers` jobs run at once and the rest wait their turn. Finished jobs are put on
+    `finished` and passed to `on_finish(job)` (on the worker thread, printing to the
+    terminal). While a manager exists, sys.stdout is routed per job (see `_current_job`), so
+    job output is kept with the job until someone follows it.
+    """
+
+    def __init__(self, max_workers=2, on_finish=None):
+        self.max_workers = max_workers
+        self.on_finish = on_finish
+        self.jobs = {}
+        self.finished = queue.Queue()
+        self._ids = itertools.count(1)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pulse-job")
+        self._lock = threading.Lock()
+        if not isinstance(sys.stdout, _JobRoutedStdout):
+            sys.stdout = _JobRoutedStdout(sys.stdout)
+
+    def submit(self, task, run):
+        with self._lock:
+            job = Job(next(self._ids), task)
+            self.jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job, run)
+        return job
+
+    def _finish(self, job):
+        self.finished.put(job)
+        if self.on_finish is not None:
+            self.on_finish(job)
+
+    def _run(self, job, run):
+        if job.cancelled:
+            job._set_status("cancelled", "Cancelled before it started.")
+            self._finish(job)
+            return
+        token = _current_job.set(job)
+        job._set_status("running")
+        try:
+            result = run(job)
+            job._set_status("cancelled" if job.cancelled else "done", result)
+        except Exception as e:
+            job.write(f"Job failed: {e}\n")
+            job._set_status("failed", f"Error: {e}")
+        finally:
+            _current_job.reset(token)
+        self._finish(job)
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or not job.cancel():
+            return False
+        if job.future is not None and job.future.cancel():
+            # Never started: the pool won't run it, so finish it here.
+            job._set_status("cancelled", "Cancelled before it started.")
+            self._finish(job)
+        return True
+
+    def drain_finished(self):
+        """Returns the jobs that finished since the last call."""
+        done = []
+        while True:
+            try:
+                done.append(self.finished.get_nowait())
+            except queue.Empty:
+                return done
+
+    def stats(self):
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0, "cancelled": 0}
+        for job in self.list():
+            counts[job.status] += 1
+        return counts
+
+    def shutdown(self, cancel=True, timeout=5.0):
+        """Cancels (optionally) and waits up to `timeout` seconds for running jobs."""
+        if cancel:
+            for job in self.list():
+                self.cancel(job.id)
+        deadline = time.monotonic() + timeout
+        for job in self.list():
+            if job.future is not None and not job.future.done():
+                try:
+                    job.future.result(max(0.0, deadline - time.monotonic()))
+                except Exception:
+                    pass
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+_job_manager = None
+
+def get_job_manager():
+    global _job_manager
+    if _job_manager is None:
+        from pulse_config.config import MAX_CONCURRENT_JOBS
+        _job_manager = JobManager(MAX_CONCURRENT_JOBS)
+    return _job_manager
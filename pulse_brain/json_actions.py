@@ -0,0 +1,420 @@
+import json
+import threading
+
+# Arguments each agent action takes, in the order constrained decoding writes them.
+ACTION_ARGUMENTS = {
+    "execute_shell_command": ("command",),
+    "finish": (),
+}
+
+_JSON_ESCAPES = '"\\/bfnrtu'
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+def clean_json_response(response_str):
+    """Helper to strip Markdown code blocks if present."""
+    if "```json" in response_str:
+        response_str = response_str.split("```json")[1].split("```")[0].strip()
+    elif "```" in response_str:
+        response_str = response_str.split("```")[1].strip()
+    return response_str
+
+class ActionParser:
+    """
+    Incremental, tolerant parser for the CLI agent's JSON action.
+
+    `feed()` pieces of a (streamed) reply; it returns True once the first top-level object
+    is complete, so the caller can stop generation there. Text before the object (prose,
+    a ``` fence) is ignored, and braces inside strings don't count. `parse()` then tries
+    strict JSON first and falls back to `repair_json` for the mistakes models commonly
+    make: trailing commas, single quotes, Python literals, raw newlines or invalid escapes
+    inside strings, and output cut off before the object closed.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.start = None
+        self.end = None
+        self._scanned = 0
+        self._depth = 0
+        self._quote = None
+        self._escaped = False
+
+    @property
+    def complete(self):
+        return self.end is not None
+
+    @property
+    def text(self):
+        """The object's text once complete; otherwise everything from its opening brace."""
+        if self.start is None:
+            return self.buffer
+        return self.buffer[self.start:self.end]
+
+    def feed(self, piece):
+        if self.complete:
+            return True
+        self.buffer += piece
+        for i in range(self._scanned, len(self.buffer)):
+            ch = self.buffer[i]
+            if self._quote:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == self._quote:
+                    self._quote = None
+            elif ch in "\"'" and self.start is not None:
+                self._quote = ch
+            elif ch == "{":
+                if self.start is None:
+                    self.start = i
+                self._depth += 1
+            elif ch == "}" and self.start is not None:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = i + 1
+                    break
+        self._scanned = len(self.buffer)
+        return self.complete
+
+    def parse(self):
+        """
+        Returns (action, repaired): the action as a dict and whether the strict path
+        (`clean_json_response` + `json.loads`) rejected the text, so the object had to be
+        extracted or repaired. Raises json.JSONDecodeError if it can't be parsed at all.
+        """
+        repaired = False
+        try:
+            action = json.loads(clean_json_response(self.buffer))
+        except json.JSONDecodeError as e:
+            if self.start is None:
+                raise
+            repaired = True
+            try:
+                action = json.loads(self.text)
+            except json.JSONDecodeError:
+                try:
+                    action = json.loads(repair_json(self.text))
+                except json.JSONDecodeError:
+                    raise e from None
+        if not isinstance(action, dict):
+            raise json.JSONDecodeError("Expected a JSON object", self.text, 0)
+        if not isinstance(action.get("arguments", {}), dict):
+            action["arguments"] = {}
+        return action, repaired
+
+def parse_action(text):
+    """One-shot ActionParser: returns (action, repaired) for a complete reply."""
+    parser = ActionParser()
+    parser.feed(text)
+    return parser.parse()
+
+def repair_json(text):
+    """
+    Best-effort rewrite of a JSON-like object into valid JSON. Only the first top-level
+    object is kept; unterminated strings, objects and arrays are closed.
+    """
+    out = []
+    stack = []
+    quote = None
+    escaped = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        i += 1
+        if quote:
+            if escaped:
+                escaped = False
+                if ch == "'":
+                    out[-1] = "'"
+                elif ch not in _JSON_ESCAPES:
+                    # e.g. grep "\d": keep the backslash literally.
+                    out.append("\\" + ch)
+                else:
+                    out.append(ch)
+            elif ch == "\\":
+                escaped = True
+                out.append(ch)
+            elif ch == quote:
+                quote = None
+                out.append('"')
+            elif ch == '"':
+                out.append('\\"')
+            elif ch < " ":
+                out.append(_CONTROL_ESCAPES.get(ch, f"\\u{ord(ch):04x}"))
+            else:
+                out.append(ch)
+        elif ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            _strip_trailing_comma(out)
+            if stack:
+                out.append(stack.pop())
+            if not stack:
+                break
+        elif ch.isalpha():
+            word_end = i
+            while word_end < len(text) and text[word_end].isalnum():
+                word_end += 1
+            word = ch + text[i:word_end]
+            out.append(_PYTHON_LITERALS.get(word, word))
+            i = word_end
+        else:
+            out.append(ch)
+
+    if quote:
+        if escaped:
+            out.pop()
+        out.append('"')
+    if stack:
+        _strip_trailing_comma(out)
+        if out and out[-1].rstrip().endswith(":"):
+            out.append(" null")
+        out.extend(reversed(stack))
+    return "".join(out)
+
+def _strip_trailing_comma(out):
+    while out and not out[-1].strip():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+class ActionGrammar:
+    """
+    Character-level automaton for the agent's action object:
+
+        {"thought": "...", "action": "<one of ACTION_ARGUMENTS>", "arguments": {"command": "..."}}
+
+    Keys are fixed and in this order, whitespace is allowed between tokens, and the
+    arguments follow from the chosen action. States are immutable tuples
+    (segments, index, progress) so candidate tokens can be checked without copying.
+    """
+
+    MAX_WHITESPACE = 16
+
+    def __init__(self, actions=None):
+        self.actions = actions or ACTION_ARGUMENTS
+        self.head = (
+            ("lit", "{"), *self._field("thought"), ("ws",), ("lit", ","),
+            *self._field("action", ("enum", tuple(self.actions))), ("ws",), ("lit", ","),
+            ("ws",), ("lit", '"arguments"'), ("ws",), ("lit", ":"), ("ws",), ("lit", "{"),
+        )
+        self.tails = {}
+        for action, arguments in self.actions.items():
+            tail = []
+            for n, name in enumerate(arguments):
+                if n:
+                    tail += [("ws",), ("lit", ",")]
+                tail += self._field(name)
+            self.tails[action] = tuple(tail) + (("ws",), ("lit", "}"), ("ws",), ("lit", "}"))
+
+    @staticmethod
+    def _field(name, value=("str",)):
+        return (("ws",), ("lit", f'"{name}"'), ("ws",), ("lit", ":"), ("ws",), ("lit", '"'), value)
+
+    def start(self):
+        return (self.head, 0, 0)
+
+    def is_complete(self, state):
+        segments, index, _ = state
+        return index == len(segments)
+
+    def advance(self, state, text):
+        """The state after `text`, or None if `text` can't continue a valid action."""
+        for ch in text:
+            state = self._step(state, ch)
+            if state is None:
+                return None
+        return state
+
+    def _step(self, state, ch):
+        segments, index, progress = state
+        while index < len(segments):
+            kind = segments[index][0]
+            if kind == "ws":
+                if ch in " \t\r\n" and progress < self.MAX_WHITESPACE:
+                    return (segments, index, progress + 1)
+                index, progress = index + 1, 0
+                continue
+            if kind == "lit":
+                literal = segments[index][1]
+                if ch != literal[progress]:
+                    return None
+                if progress + 1 == len(literal):
+                    return (segments, index + 1, 0)
+                return (segments, index, progress + 1)
+            if kind == "str":
+                # progress: 0 plain, 1 after a backslash, 2-5 inside a \uXXXX escape.
+                if progress == 1:
+                    if ch not in _JSON_ESCAPES:
+                        return None
+                    return (segments, index, 2 if ch == "u" else 0)
+                if progress >= 2:
+                    if ch not in "0123456789abcdefABCDEF":
+                        return None
+                    return (segments, index, 0 if progress == 5 else progress + 1)
+                if ch == '"':
+                    return (segments, index + 1, 0)
+                if ch == "\\":
+                    return (segments, index, 1)
+                if ch < " ":
+                    return None
+                return state
+            if kind == "enum":
+                # progress: the part of the name written so far.
+                prefix = progress or ""
+                if ch == '"' and prefix in self.actions:
+                    return (segments + self.tails[prefix], index + 1, 0)
+                prefix += ch
+                if not any(name.startswith(prefix) for name in self.actions):
+                    return None
+                return (segments, index, prefix)
+        return None
+
+    def next_chars(self, state):
+        """The characters that can come next, or None if almost any character can."""
+        segments, index, progress = state
+        chars = set()
+        while index < len(segments):
+            kind = segments[index][0]
+            if kind == "ws":
+                chars.update(" \t\r\n")
+                index, progress = index + 1, 0
+                continue
+            if kind == "lit":
+                chars.add(segments[index][1][progress])
+            elif kind == "enum":
+                prefix = progress or ""
+                chars.update(name[len(prefix)] for name in self.actions if name.startswith(prefix) and name != prefix)
+                if prefix in self.actions:
+                    chars.add('"')
+            elif progress == 1:
+                chars.update(_JSON_ESCAPES)
+            elif progress >= 2:
+                chars.update("0123456789abcdefABCDEF")
+            else:
+                return None
+            return chars
+        return chars
+
+_token_tables = {}
+_token_tables_lock = threading.Lock()
+
+def _token_table(tokenizer):
+    """Per tokenizer: each token id's text, and the ids grouped by their first character."""
+    with _token_tables_lock:
+        return _build_token_table(tokenizer)
+
+def _build_token_table(tokenizer):
+    table = _token_tables.get(id(tokenizer))
+    if table is None:
+        try:
+            size = len(tokenizer)
+        except TypeError:
+            size = tokenizer.vocab_size
+        texts = [tokenizer.decode([i], skip_special_tokens=False) for i in range(size)]
+        by_first = {}
+        for token_id, text in enumerate(texts):
+            if text:
+                by_first.setdefault(text[0], []).append(token_id)
+        table = _token_tables[id(tokenizer)] = (texts, by_first)
+    return table
+
+def warm_up(tokenizer):
+    """Builds the token table (a decode of the whole vocabulary) at load time, not on the first agent step."""
+    _token_table(tokenizer)
+
+class ActionLogitsProcessor:
+    """
+    Schema-constrained decoding for the agent's JSON action, usable as a transformers
+    LogitsProcessor (`__call__(input_ids, scores)`) or from LocalEngine.generate_ids.
+
+    Tokens that can't continue a valid action are masked out, so the reply always parses,
+    and once the object closes only the end-of-sequence tokens are allowed. To keep each step
+    cheap, tokens are checked from the likeliest down, stopping once the checked ones cover
+    `coverage` of the probability mass (at most `top_k`); the whole vocabulary (narrowed by
+    first character) is searched only if none of them fits. Handles batch size 1.
+    """
+
+    def __init__(self, tokenizer, eos_token_id=None, top_k=64, coverage=0.999, grammar=None):
+        if eos_token_id is None:
+            eos_token_id = tokenizer.eos_token_id
+        self.eos_ids = [eos_token_id] if isinstance(eos_token_id, int) else list(eos_token_id)
+        self.top_k = top_k
+        self.coverage = coverage
+        self.grammar = grammar or ActionGrammar()
+        self.texts, self.by_first = _token_table(tokenizer)
+        self.state = self.grammar.start()
+        self.prompt_length = None
+        self.consumed = 0
+        self.full_scans = 0
+        _count("constrained")
+
+    def _allowed(self, token_id):
+        if token_id >= len(self.texts) or not self.texts[token_id]:
+            return False
+        return self.grammar.advance(self.state, self.texts[token_id]) is not None
+
+    def __call__(self, input_ids, scores):
+        import torch
+
+        if self.prompt_length is None:
+            self.prompt_length = input_ids.shape[-1]
+        for token_id in input_ids[0, self.prompt_length + self.consumed:].tolist():
+            self.consumed += 1
+            if self.state is not None and token_id < len(self.texts):
+                self.state = self.grammar.advance(self.state, self.texts[token_id])
+        if self.state is None:
+            return scores
+
+        if self.grammar.is_complete(self.state):
+            allowed = self.eos_ids
+        else:
+            top = torch.topk(scores[0], min(self.top_k, scores.shape[-1]))
+            mass = torch.softmax(scores[0].float(), dim=-1)[top.indices].cumsum(0).tolist()
+            allowed = []
+            for token_id, covered in zip(top.indices.tolist(), mass):
+                if self._allowed(token_id):
+                    allowed.append(token_id)
+                if allowed and covered >= self.coverage:
+                    break
+            if not allowed:
+                self.full_scans += 1
+                chars = self.grammar.next_chars(self.state)
+                candidates = range(len(self.texts)) if chars is None else (
+                    i for ch in chars for i in self.by_first.get(ch, ())
+                )
+                allowed = [i for i in candidates if i < scores.shape[-1] and self._allowed(i)]
+            if not allowed:
+                return scores
+
+        masked = torch.full_like(scores, float("-inf"))
+        index = torch.tensor(allowed, device=scores.device)
+        masked[0, index] = scores[0, index]
+        return masked
+
+_stats = {"steps": 0, "repaired": 0, "failed": 0, "constrained": 0}
+_stats_lock = threading.Lock()
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+def record_parse(repaired=False, failed=False):
+    """Counts one agent step's parse; a repaired parse is a step that would otherwise be wasted."""
+    with _stats_lock:
+        _stats["steps"] += 1
+        _stats["repaired"] += bool(repaired)
+        _stats["failed"] += bool(failed)
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    result["failure_rate"] = result["failed"] / result["steps"] if result["steps"] else 0.0
+    result["steps_saved"] = result["repaired"]
+    return result
@@ -1,76 +1,205 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
-import torch
-import google.generativeai as genai
-from pulse_brain.brain import start_cli_agent_loop
-from pulse_config.config import GEMINI_API_KEY
+from pulse_brain.brain import start_cli_agent_loop, read_json_action
+from pulse_brain.local_engine import get_local_engine
+from pulse_brain.gemini_session import get_gemini_pool
+from pulse_brain.rate_limiter import get_rate_limiter, is_quota_error
+from pulse_brain.context_manager import get_context_manager, estimate_tokens
+from pulse_brain.json_actions import ActionLogitsProcessor
+from pulse_config.config import (
+    GEMINI_API_KEY, GEMINI_MODEL_ID, GEMINI_MAX_RETRIES, LOCAL_KV_CACHE, LOCAL_CONSTRAINED_JSON,
+    CLI_AGENT_SYSTEM_PROMPT, LOCAL_ENGINE, CPU_THREADS, QUANTIZED_CACHE_DIR,
+)
+from pulse_config.tracing import span, record, count
+import json
 import re
+import time
+import uuid
+
+# Backend libraries (transformers/torch, google.generativeai) are imported inside the
+# functions that use them, so only the backend that is actually selected gets loaded.
 
 def load_gemini_model(api_key):
     """Configures and returns the Gemini model."""
     if not api_key:
         raise ValueError("Gemini API Key not found in environment variables.")
+    import google.generativeai as genai
     genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.5-pro')
+    model = genai.GenerativeModel(GEMINI_MODEL_ID)
     return model, "gemini"
 
 def load_model(model_name, cache_directory=None):
-    """Loads Local LLM, returns pipeline and terminators."""
-    llm_pipeline = pipeline(
-        "text-generation",
-        model=model_name,
-        model_kwargs={"dtype": torch.bfloat16},
-        device_map="auto",
-    )
+    """
+    Loads Local LLM, returns pipeline and terminators.
+    LOCAL_ENGINE picks bf16 (device_map="auto") or the int8 CPU engine (pulse_brain/cpu_inference.py).
+    """
+    from pulse_brain.cpu_inference import resolve_engine, load_int8_pipeline
+    if resolve_engine(LOCAL_ENGINE) == "cpu-int8":
+        llm_pipeline = load_int8_pipeline(model_name, cache_directory or QUANTIZED_CACHE_DIR, CPU_THREADS)
+    else:
+        from transformers import pipeline
+        import torch
+        llm_pipeline = pipeline(
+            "text-generation",
+            model=model_name,
+            model_kwargs={"dtype": torch.bfloat16},
+            device_map="auto",
+        )
     terminators = [
         llm_pipeline.tokenizer.eos_token_id,
         llm_pipeline.tokenizer.convert_tokens_to_ids("<|eot_id|>")
     ]
     return llm_pipeline, terminators
 
-def query_llm(model_obj, history, model_type="local", terminators=None):
+LOCAL_GENERATION_KWARGS = {
+    "max_new_tokens": 256,
+    "do_sample": True,
+    "temperature": 0.6,
+    "top_p": 0.9,
+}
+
+def query_llm(model_obj, history, model_type="local", terminators=None, session_id=None):
     """
     Unified function to query either Local LLM or Gemini.
     Returns the string response.
     """
+    return "".join(stream_llm(model_obj, history, model_type, terminators, session_id))
+
+def stream_llm(model_obj, history, model_type="local", terminators=None, session_id=None):
+    """
+    Streaming variant of query_llm: yields the response in pieces as they are generated.
+    Closing the generator early stops generation.
+    `session_id` keeps a live Gemini session so repeated calls only send the new turns.
+    With model_type "auto", `model_obj` is the BackendManager and it picks the backend per call.
+    """
+    if model_type == "auto":
+        yield from model_obj.stream(_stream_backend, history, session_id)
+        return
+    try:
+        yield from _stream_backend(model_obj, history, model_type, terminators, session_id)
+    except Exception as e:
+        if model_type != "gemini":
+            raise
+        print(f"Gemini Error: {e}")
+        yield "I encountered an error reaching the Gemini API."
+
+def _stream_backend(model_obj, history, model_type, terminators=None, session_id=None):
+    """Streams from one concrete backend. Errors are raised so the backend manager can see them."""
+    with span("llm.generate", backend=model_type) as trace:
+        tokenizer = getattr(model_obj, "tokenizer", None) if model_type == "local" else None
+        history, tokens_before, tokens_after = get_context_manager().fit(history, tokenizer)
+        if tokens_after < tokens_before:
+            print(f"Context trimmed: {tokens_before} -> {tokens_after} tokens ({tokens_before - tokens_after} saved).")
+        trace.set(prompt_tokens=tokens_after)
+
+        started = time.perf_counter()
+        pieces = chars = 0
+        try:
+            for piece in _generate(model_obj, history, model_type, terminators, session_id):
+                if not pieces:
+                    trace.set(first_token_ms=(time.perf_counter() - started) * 1000)
+                pieces += 1
+                chars += len(piece)
+                yield piece
+        finally:
+            trace.set(output_pieces=pieces, output_chars=chars)
+
+def _generate(model_obj, history, model_type, terminators=None, session_id=None):
     # gemini locgi
     if model_type == "gemini":
-        try:
-            system_instruction = None
-            chat_history = []
-            
-            for msg in history:
-                if msg['role'] == 'system':
-                    system_instruction = msg['content']
-                elif msg['role'] == 'user':
-                    chat_history.append({'role': 'user', 'parts': [msg['content']]})
-                elif msg['role'] == 'assistant':
-                    chat_history.append({'role': 'model', 'parts': [msg['content']]})
-            
-            if system_instruction:
-                active_model = genai.GenerativeModel('gemini-2.5-pro', system_instruction=system_instruction)
-            else:
-                active_model = model_obj
-
-            chat = active_model.start_chat(history=chat_history[:-1])
-            last_msg = chat_history[-1]['parts'][0]
-            response = chat.send_message(last_msg)
-            return response.text
-            
-        except Exception as e:
-            print(f"Gemini Error: {e}")
-            return "I encountered an error reaching the Gemini API."
+        limiter = get_rate_limiter()
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            yielded = False
+            try:
+                waited = limiter.acquire(estimate_tokens(history))
+                if waited > 0:
+                    record("gemini.rate_limit_wait", waited)
+                    print(f"Rate limit: waited {waited:.1f} seconds.")
+                response = get_gemini_pool(model_obj).send(history, session_id=session_id, stream=True)
+                for chunk in response:
+                    if chunk.parts:
+                        yielded = True
+                        yield chunk.text
+                limiter.record_success()
+                return
+
+            except Exception as e:
+                if is_quota_error(e) and not yielded and attempt < GEMINI_MAX_RETRIES:
+                    delay = limiter.record_quota_error(e)
+                    count("gemini.quota_retries")
+                    print(f"Gemini quota hit; retrying in {delay:.1f} seconds...")
+                    continue
+                raise
+
+    elif model_type == "remote":
+        # Local model served by pulse_model_server.py, which applies the same decoding settings.
+        yield from model_obj.stream(history)
 
     else:
         # local LLM Logic
-        outputs = model_obj(
-            history,
-            max_new_tokens=256,
-            eos_token_id=terminators,
-            do_sample=True,
-            temperature=0.6,
-            top_p=0.9,
-        )
-        return outputs[0]["generated_text"][-1]["content"]
+        processor = action_processor_for(history, model_obj.tokenizer, terminators)
+        if LOCAL_KV_CACHE:
+            yield from get_local_engine(model_obj).stream(
+                history, eos_token_id=terminators, logits_processor=processor, **LOCAL_GENERATION_KWARGS
+            )
+        else:
+            yield from _stream_pipeline(model_obj, history, terminators, processor)
+
+def prefill_llm(model_obj, history, model_type="local"):
+    """
+    Precomputes the local KV cache for `history`, so the next call only prefills what is added
+    after it. Meant for turns the model didn't generate itself; a no-op for other backends.
+    In "auto" mode the manager's local backend is prefilled, if there is one.
+    """
+    if model_type == "auto":
+        local = model_obj.get("local")
+        if local is None:
+            return
+        model_obj, model_type = local.model, local.model_type
+    if model_type != "local" or not LOCAL_KV_CACHE:
+        return
+    try:
+        with span("llm.prefill", backend=model_type):
+            get_local_engine(model_obj).prefill(history)
+    except Exception as e:
+        print(f"Error prefilling the local cache: {e}")
+
+def action_processor_for(history, tokenizer, terminators=None):
+    """CLI agent steps are decoded against the action schema, so they always parse; None for other prompts."""
+    if LOCAL_CONSTRAINED_JSON and history and history[0]["content"] == CLI_AGENT_SYSTEM_PROMPT:
+        return ActionLogitsProcessor(tokenizer, terminators)
+    return None
+
+def _stream_pipeline(llm_pipeline, history, terminators, logits_processor=None):
+    """Runs the pipeline on a worker thread and yields text from a TextIteratorStreamer."""
+    import contextvars
+    import threading
+    from transformers import LogitsProcessorList, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+    stop_event = threading.Event()
+
+    class _StopWhenClosed(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return stop_event.is_set()
+
+    streamer = TextIteratorStreamer(llm_pipeline.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    worker = threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(llm_pipeline, history),
+        kwargs={
+            "streamer": streamer,
+            "eos_token_id": terminators,
+            "stopping_criteria": StoppingCriteriaList([_StopWhenClosed()]),
+            "logits_processor": LogitsProcessorList([logits_processor] if logits_processor else []),
+            **LOCAL_GENERATION_KWARGS,
+        },
+        daemon=True,
+    )
+    worker.start()
+    try:
+        for text in streamer:
+            if text:
+                yield text
+    finally:
+        stop_event.set()
 
 def generate_response(_query, history, model_obj, terminators=None, model_type="local", is_tool_check=False):
     """
@@ -91,6 +220,21 @@ def generate_response(_query, history, model_obj, terminators=None, model_type="
         print(f"Error generating response: {e}")
         return "I seem to be having some trouble with my thoughts right now.", history
 
+def split_fused_response(response):
+    """
+    Splits a fused router reply into (route, first_action): the `[TOOL: ...]` tag and the JSON
+    action written after it. first_action is None for plain replies or an incomplete/invalid action.
+    """
+    match = re.match(r"\s*(\[TOOL:.*?\])\s*(\{.*)?$", response, re.S)
+    if not match or not match.group(2):
+        return response, None
+    action = read_json_action([match.group(2)])
+    try:
+        json.loads(action)
+    except ValueError:
+        return match.group(1), None
+    return match.group(1), action
+
 def parse_tool_call(response):
     try:
         if not response.strip().startswith("[TOOL:") or not response.strip().endswith("]"):
@@ -118,10 +262,14 @@ def parse_tool_call(response):
         print(f"Error parsing tool command: {e}. Full response: {response}")
         return None, None
 
-def tool_dispatcher(response, model_obj, terminators=None, model_type="local"):
+def tool_dispatcher(response, model_obj, terminators=None, model_type="local", shell_session=None, job_manager=None):
     """
     Parses the LLM's tool command and calls the appropriate function.
+    `shell_session` lets the caller supply the shell the CLI agent runs commands in.
+    A fused router reply (tag + first JSON action) hands that action to the agent as step 1.
+    With a `job_manager` the CLI task runs as a background job and this returns at once.
     """
+    response, first_action = split_fused_response(response)
     tool_name, params = parse_tool_call(response)
 
     if not tool_name:
@@ -131,9 +279,28 @@ def tool_dispatcher(response, model_obj, terminators=None, model_type="local"):
     elif tool_name == "cli_agent":
         task_description = params.get('task')
         
-        query_func = lambda hist: query_llm(model_obj, hist, model_type, terminators)
+        session_id = uuid.uuid4().hex
+        query_func = lambda hist: query_llm(model_obj, hist, model_type, terminators, session_id)
+        stream_func = lambda hist: stream_llm(model_obj, hist, model_type, terminators, session_id)
+        prefill_func = lambda hist: prefill_llm(model_obj, hist, model_type)
         
-        result_message = start_cli_agent_loop(task_description, query_func,model_type)
-        return tool_name, result_message
+        def run_task(cancel=None):
+            try:
+                return start_cli_agent_loop(
+                    task_description, query_func, model_type, stream_func=stream_func,
+                    shell_session=shell_session, first_action=first_action, cancel=cancel,
+                    prefill_func=prefill_func,
+                )
+            finally:
+                gemini = model_obj.get("gemini") if model_type == "auto" else None
+                if model_type == "gemini":
+                    get_gemini_pool(model_obj).close_session(session_id)
+                elif gemini is not None:
+                    get_gemini_pool(gemini.model).close_session(session_id)
+
+        if job_manager is not None:
+            job = job_manager.submit(task_description, run_task)
+            return tool_name, f"Started background job {job.id}: {task_description}"
+        return tool_name, run_task()
         
     return None, "Unknown tool."
\ No newline at end of file
@@ -0,0 +1,290 @@
+import threading
+from collections import OrderedDict
+
+class _PromptSession:
+    """Live KV cache for one system prompt plus the token ids it currently covers."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.ids = []
+
+class LocalEngine:
+    """
+    Incremental inference on top of a transformers text-generation pipeline.
+
+    The pipeline re-encodes the whole chat on every call. This engine keeps `past_key_values`
+    per system prompt instead: the system prefix is prefilled once, and each call only runs
+    the forward pass over the tokens that differ from what is already cached (normally the
+    newest turns). Prompts are matched by longest common token prefix, so edits to earlier
+    turns just crop the cache back to the point of divergence.
+    """
+
+    def __init__(self, model, tokenizer, max_sessions=4):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.prefill_tokens = 0
+        self.reused_tokens = 0
+        self._lock = threading.Lock()
+
+    def encode(self, history, add_generation_prompt=True):
+        text = self.tokenizer.apply_chat_template(
+            history, tokenize=False, add_generation_prompt=add_generation_prompt
+        )
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def _session_for(self, history):
+        from transformers import DynamicCache
+
+        key = history[0]["content"] if history and history[0]["role"] == "system" else None
+        session = self.sessions.get(key)
+        if session is None:
+            session = _PromptSession(DynamicCache(config=self.model.config))
+            self.sessions[key] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        self.sessions.move_to_end(key)
+        return session
+
+    def _forward(self, session, new_ids):
+        import torch
+
+        input_ids = torch.tensor([new_ids], device=self.model.device)
+        with torch.no_grad():
+            outputs = self.model(input_ids=input_ids, past_key_values=session.cache, use_cache=True)
+        session.ids.extend(new_ids)
+        return outputs.logits[0, -1, :]
+
+    def _prefill(self, session, prompt_ids):
+        """Crops the cache to the common prefix with `prompt_ids` and runs only the remainder."""
+        common = _common_prefix_length(session.ids, prompt_ids)
+        # Always feed at least one token so there are logits to sample from.
+        common = min(common, len(prompt_ids) - 1)
+        if common < len(session.ids):
+            session.cache.crop(common - len(session.ids))
+            del session.ids[common:]
+
+        self.reused_tokens += common
+        self.prefill_tokens += len(prompt_ids) - common
+        return self._forward(session, prompt_ids[common:])
+
+    def _shared_prefix_cache(self, history, prompts):
+        """
+        A new batch cache holding the prefix all `prompts` share with the cached session for
+        `history`'s system prompt (normally the whole system prompt), one copy per row.
+        Returns (cache, prefix length); the session itself is left untouched.
+        """
+        from transformers import DynamicCache
+
+        cache = DynamicCache(config=self.model.config)
+        key = history[0]["content"] if history and history[0]["role"] == "system" else None
+        session = self.sessions.get(key)
+        if session is None:
+            return cache, 0
+        # Every row needs at least one token of its own to produce logits.
+        shared = min(min(_common_prefix_length(session.ids, prompt), len(prompt) - 1) for prompt in prompts)
+        if shared <= 0:
+            return cache, 0
+        for layer_index, layer in enumerate(session.cache.layers):
+            cache.update(
+                layer.keys[:, :, :shared].repeat(len(prompts), 1, 1, 1),
+                layer.values[:, :, :shared].repeat(len(prompts), 1, 1, 1),
+                layer_index,
+            )
+        return cache, shared
+
+    def warm_up(self, system_prompt):
+        """Precomputes the KV cache for a system prompt so the first real call only prefills the turns."""
+        self.prefill([{"role": "system", "content": system_prompt}])
+
+    def prefill(self, history):
+        """Brings the session for `history` up to date with it, without generating anything."""
+        prefix_ids = self.encode(history, add_generation_prompt=False)
+        with self._lock:
+            session = self._session_for(history)
+            self._prefill(session, prefix_ids)
+
+    def generate_ids(self, history, max_new_tokens=256, eos_token_id=None, do_sample=True,
+                     temperature=0.6, top_p=0.9, logits_processor=None):
+        """
+        Yields generated token ids one at a time. Closing the generator stops generation.
+        `logits_processor(input_ids, scores)` follows the transformers LogitsProcessor interface.
+        """
+        import torch
+
+        if isinstance(eos_token_id, int):
+            eos_token_id = [eos_token_id]
+        stop_ids = set(eos_token_id or [self.tokenizer.eos_token_id])
+
+        with self._lock:
+            session = self._session_for(history)
+            prompt_ids = self.encode(history)
+            logits = self._prefill(session, prompt_ids)
+            if logits_processor is not None:
+                # Prompt + generated ids for the processor, filled in place as tokens are sampled.
+                input_ids = torch.zeros((1, len(prompt_ids) + max_new_tokens), dtype=torch.long)
+                input_ids[0, :len(prompt_ids)] = torch.tensor(prompt_ids)
+            for step in range(max_new_tokens):
+                if logits_processor is not None:
+                    logits = logits_processor(input_ids[:, :len(prompt_ids) + step], logits[None])[0]
+                next_id = _sample(logits, do_sample, temperature, top_p)
+                if next_id in stop_ids:
+                    break
+                if logits_processor is not None:
+                    input_ids[0, len(prompt_ids) + step] = next_id
+                yield next_id
+                if step + 1 < max_new_tokens:
+                    logits = self._forward(session, [next_id])
+
+    def generate_batch_ids(self, histories, max_new_tokens=256, eos_token_id=None, do_sample=True,
+                           temperature=0.6, top_p=0.9, logits_processors=None, stopped=None):
+        """
+        Generates for several chats in one forward pass per step, yielding `(index, token_id)`
+        as tokens are sampled and `(index, None)` when chat `index` ends. The batch gets its own
+        KV cache, seeded with the prefix the prompts share with the warm session for their system
+        prompt; the rest of each prompt is left-padded and prefilled together. Finished rows, and
+        rows for which `stopped(index)` returns True, are dropped from the batch.
+        `logits_processors` is an optional list with one processor (or None) per chat.
+        """
+        import torch
+
+        if isinstance(eos_token_id, int):
+            eos_token_id = [eos_token_id]
+        stop_ids = set(eos_token_id or [self.tokenizer.eos_token_id])
+        processors = logits_processors or [None] * len(histories)
+
+        prompts = [self.encode(history) for history in histories]
+        pad_id = getattr(self.tokenizer, "pad_token_id", None)
+        pad_id = pad_id if pad_id is not None else self.tokenizer.eos_token_id
+        # Per-chat prompt + generated ids for the logits processors, filled in place.
+        processor_ids = {
+            index: torch.tensor([prompts[index] + [0] * max_new_tokens])
+            for index, processor in enumerate(processors) if processor
+        }
+
+        with self._lock:
+            cache, shared = self._shared_prefix_cache(histories[0], prompts)
+            # Layout per row: [shared prefix][left padding][rest of the prompt].
+            width = max(len(prompt) for prompt in prompts) - shared
+            input_ids = torch.full((len(prompts), width), pad_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(prompts), shared + width), dtype=torch.long)
+            attention_mask[:, :shared] = 1
+            for row, prompt in enumerate(prompts):
+                rest = prompt[shared:]
+                input_ids[row, width - len(rest):] = torch.tensor(rest)
+                attention_mask[row, shared + width - len(rest):] = 1
+            position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, shared:]
+
+            device = self.model.device
+            with torch.no_grad():
+                logits = self.model(
+                    input_ids=input_ids.to(device), attention_mask=attention_mask.to(device),
+                    position_ids=position_ids.to(device), past_key_values=cache, use_cache=True,
+                ).logits[:, -1, :]
+            self.reused_tokens += shared * len(prompts)
+            self.prefill_tokens += sum(len(prompt) - shared for prompt in prompts)
+            rows = list(range(len(prompts)))  # chat index of each batch row
+            for step in range(max_new_tokens):
+                keep, next_ids = [], []
+                for row, index in enumerate(rows):
+                    row_logits = logits[row]
+                    if index in processor_ids:
+                        ids = processor_ids[index][:, :len(prompts[index]) + step]
+                        row_logits = processors[index](ids, row_logits[None])[0]
+                    next_id = _sample(row_logits, do_sample, temperature, top_p)
+                    if next_id in stop_ids or (stopped is not None and stopped(index)):
+                        yield index, None
+                        continue
+                    if index in processor_ids:
+                        processor_ids[index][0, len(prompts[index]) + step] = next_id
+                    keep.append(row)
+                    next_ids.append(next_id)
+                    yield index, next_id
+                rows = [rows[row] for row in keep]
+                if not rows or step + 1 == max_new_tokens:
+                    break
+                if len(keep) < len(attention_mask):
+                    selected = torch.tensor(keep)
+                    cache.batch_select_indices(selected.to(device))
+                    attention_mask, position_ids = attention_mask[selected], position_ids[selected]
+                attention_mask = torch.cat([attention_mask, torch.ones((len(rows), 1), dtype=torch.long)], dim=-1)
+                position_ids = position_ids[:, -1:] + 1
+                with torch.no_grad():
+                    logits = self.model(
+                        input_ids=torch.tensor(next_ids, device=device)[:, None],
+                        attention_mask=attention_mask.to(device), position_ids=position_ids.to(device),
+                        past_key_values=cache, use_cache=True,
+                    ).logits[:, -1, :]
+            for index in rows:
+                yield index, None
+
+    def stream(self, history, **generation_kwargs):
+        """Yields decoded text as tokens are generated."""
+        decoder = TextDecoder(self.tokenizer)
+        for token_id in self.generate_ids(history, **generation_kwargs):
+            text = decoder.add(token_id)
+            if text:
+                yield text
+        text = decoder.flush()
+        if text:
+            yield text
+
+    def generate(self, history, **generation_kwargs):
+        ids = list(self.generate_ids(history, **generation_kwargs))
+        return self.tokenizer.decode(ids, skip_special_tokens=True)
+
+class TextDecoder:
+    """Turns generated token ids into text pieces, holding back partial multi-byte characters."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.ids = []
+        self.emitted = ""
+
+    def add(self, token_id):
+        """Adds one token and returns the text it completes ("" if none yet)."""
+        self.ids.append(token_id)
+        text = self.tokenizer.decode(self.ids, skip_special_tokens=True)
+        # Hold back partial multi-byte characters until the next token completes them.
+        if text.endswith("\ufffd") or not text.startswith(self.emitted) or len(text) <= len(self.emitted):
+            return ""
+        piece, self.emitted = text[len(self.emitted):], text
+        return piece
+
+    def flush(self):
+        """Whatever is still held back once generation has ended."""
+        text = self.tokenizer.decode(self.ids, skip_special_tokens=True)
+        if len(text) > len(self.emitted) and text.startswith(self.emitted):
+            piece, self.emitted = text[len(self.emitted):], text
+            return piece
+        return ""
+
+def _common_prefix_length(a, b):
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+def _sample(logits, do_sample, temperature, top_p):
+    import torch
+
+    if not do_sample:
+        return int(torch.argmax(logits))
+    probs = torch.softmax(logits.float() / temperature, dim=-1)
+    sorted_probs, sorted_ids = torch.sort(probs, descending=True)
+    cumulative = torch.cumsum(sorted_probs, dim=-1)
+    sorted_probs[cumulative - sorted_probs > top_p] = 0.0
+    choice = torch.multinomial(sorted_probs / sorted_probs.sum(), 1)
+    return int(sorted_ids[choice])
+
+_local_engine = None
+
+def get_local_engine(llm_pipeline):
+    """Returns the shared engine for a loaded pipeline, creating it on first use."""
+    global _local_engine
+    if _local_engine is None or _local_engine.model is not llm_pipeline.model:
+        _local_engine = LocalEngine(llm_pipeline.model, llm_pipeline.tokenizer)
+    return _local_engine
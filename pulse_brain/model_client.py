@@ -0,0 +1,62 @@
+import json
+import socket
+
+class RemoteModel:
+    """
+    The local model served by pulse_model_server.py over a Unix socket (model_type "remote").
+
+    Every request uses its own connection, so concurrent callers (background jobs) are
+    independent and the server can batch them. Messages are JSON lines: the request
+    `{"op": "generate", "history": [...]}` is answered with `{"text": ...}` pieces and a final
+    `{"done": true}` or `{"error": ...}`. Closing the stream early closes the connection,
+    which stops generation on the server.
+    """
+
+    tokenizer = None  # the context manager estimates tokens instead of loading the tokenizer
+
+    def __init__(self, socket_path, info=None, timeout=None):
+        self.socket_path = socket_path
+        self.info = info or {}
+        self.timeout = timeout
+
+    def _request(self, message, timeout=None):
+        """Sends one request and yields the decoded reply lines until the server is done."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(self.socket_path)
+            sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+            with sock.makefile("rb") as replies:
+                for line in replies:
+                    reply = json.loads(line)
+                    if "error" in reply:
+                        raise RuntimeError(f"Model server error: {reply['error']}")
+                    done = reply.pop("done", False)
+                    yield reply
+                    if done:
+                        return
+            raise ConnectionError("Model server closed the connection mid-reply.")
+        finally:
+            sock.close()
+
+    def stream(self, history):
+        for reply in self._request({"op": "generate", "history": history}, self.timeout):
+            if reply.get("text"):
+                yield reply["text"]
+
+    def generate(self, history):
+        return "".join(self.stream(history))
+
+    def stats(self):
+        return next(self._request({"op": "stats"}, timeout=5.0))
+
+def connect_model_server(socket_path, timeout=1.0):
+    """Returns a RemoteModel if a model server answers on `socket_path`, otherwise None."""
+    if not hasattr(socket, "AF_UNIX") or not socket_path:
+        return None
+    model = RemoteModel(socket_path)
+    try:
+        model.info = next(model._request({"op": "info"}, timeout))
+    except (OSError, ValueError, RuntimeError, StopIteration):
+        return None
+    return model
@@ -0,0 +1,134 @@
+import re
+import threading
+import time
+
+def is_quota_error(error):
+    """True for 429 / ResourceExhausted / quota errors from the Gemini API."""
+    text = f"{type(error).__name__} {error}".lower()
+    return "429" in text or "resourceexhausted" in text or "quota" in text or "rate limit" in text
+
+def retry_after_from_error(error):
+    """Extracts the server-suggested retry delay (seconds) from an API error, if there is one."""
+    delay = getattr(error, "retry_after", None)
+    if isinstance(delay, (int, float)):
+        return float(delay)
+    text = str(error)
+    for pattern in (r"retry in ([\d.]+)\s*s", r"retry_delay\s*\{\s*seconds:\s*(\d+)", r"retry-after:?\s*([\d.]+)"):
+        match = re.search(pattern, text, re.I)
+        if match:
+            return float(match.group(1))
+    return None
+
+class RateLimiter:
+    """
+    Token bucket over requests per minute and (optionally) tokens per minute.
+
+    `acquire()` reserves capacity and sleeps only as long as the buckets require, instead of
+    a fixed delay before every call. Quota errors block the limiter until the server's
+    retry-after (or an exponential backoff) has passed and halve the effective rate, which
+    then recovers gradually on successful calls. `clock` and `sleep` are injectable so the
+    limiter can be driven without real waiting.
+    """
+
+    def __init__(self, rpm, tpm=None, clock=time.monotonic, sleep=time.sleep,
+                 base_backoff=2.0, max_backoff=60.0, min_rate_factor=0.1):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.clock = clock
+        self.sleep = sleep
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.min_rate_factor = min_rate_factor
+
+        now = clock()
+        self.request_tokens = float(rpm)
+        self.token_tokens = float(tpm) if tpm else 0.0
+        self.last_refill = now
+        self.blocked_until = now
+        self.rate_factor = 1.0
+        self.consecutive_errors = 0
+
+        self.acquisitions = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.quota_errors = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self.last_refill)
+        self.last_refill = now
+        minutes = elapsed / 60.0 * self.rate_factor
+        self.request_tokens = min(float(self.rpm), self.request_tokens + minutes * self.rpm)
+        if self.tpm:
+            self.token_tokens = min(float(self.tpm), self.token_tokens + minutes * self.tpm)
+
+    def reserve(self, tokens=0):
+        """Consumes capacity for one request and returns how long the caller must wait first."""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self.request_tokens -= 1
+            wait = 0.0
+            if self.request_tokens < 0:
+                wait = -self.request_tokens / (self.rpm * self.rate_factor) * 60.0
+            if self.tpm and tokens:
+                self.token_tokens -= min(tokens, self.tpm)
+                if self.token_tokens < 0:
+                    wait = max(wait, -self.token_tokens / (self.tpm * self.rate_factor) * 60.0)
+            wait = max(wait, self.blocked_until - now)
+
+            self.acquisitions += 1
+            if wait > 0:
+                self.waits += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    def acquire(self, tokens=0):
+        """Blocks until a request of roughly `tokens` tokens may be sent. Returns the time waited."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def record_success(self):
+        with self._lock:
+            self._refill(self.clock())
+            self.consecutive_errors = 0
+            self.rate_factor = min(1.0, self.rate_factor + 0.1)
+
+    def record_quota_error(self, error=None):
+        """Backs off after a quota/429 error. Returns the delay imposed before the next request."""
+        with self._lock:
+            self._refill(self.clock())
+            self.quota_errors += 1
+            self.consecutive_errors += 1
+            self.rate_factor = max(self.min_rate_factor, self.rate_factor / 2)
+            delay = retry_after_from_error(error) if error is not None else None
+            if delay is None:
+                delay = min(self.max_backoff, self.base_backoff * 2 ** (self.consecutive_errors - 1))
+            self.blocked_until = max(self.blocked_until, self.clock() + delay)
+            return delay
+
+    def stats(self):
+        return {
+            "acquisitions": self.acquisitions,
+            "waits": self.waits,
+            "total_wait": self.total_wait,
+            "max_wait": self.max_wait,
+            "quota_errors": self.quota_errors,
+            "rate_factor": self.rate_factor,
+        }
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Returns the process-wide Gemini rate limiter."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            from pulse_config.config import GEMINI_RPM, GEMINI_TPM
+            _rate_limiter = RateLimiter(GEMINI_RPM, GEMINI_TPM)
+        return _rate_limiter
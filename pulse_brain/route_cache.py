@@ -0,0 +1,153 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+def normalize_query(query):
+    """
+    Lowercases, strips punctuation and collapses whitespace so trivial variations share a key.
+    Question marks are kept: "delete the logs?" is not the same request as "delete the logs".
+    """
+    query = query.lower().strip()
+    query = re.sub(r"[^\w\s./?-]", " ", query)
+    return re.sub(r"\s+", " ", query).strip()
+
+def char_ngrams(text, n=3):
+    """Character n-grams of a normalized string, padded so short words still produce grams."""
+    padded = f" {text} "
+    if len(padded) <= n:
+        return [padded]
+    return [padded[i:i + n] for i in range(len(padded) - n + 1)]
+
+class NgramIndex:
+    """
+    Small TF-IDF index over character n-grams, used for cheap "is this the same request?" lookups.
+    Vectors are kept sparse and L2-normalised so a lookup is a dot product per stored key.
+    """
+
+    def __init__(self, n=3):
+        self.n = n
+        self.doc_freq = Counter()
+        self.vectors = {}
+
+    def _tf(self, key):
+        return Counter(char_ngrams(key, self.n))
+
+    def _weigh(self, tf):
+        total_docs = len(self.vectors) + 1
+        vec = {}
+        for gram, count in tf.items():
+            idf = math.log((1 + total_docs) / (1 + self.doc_freq.get(gram, 0))) + 1
+            vec[gram] = count * idf
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {gram: v / norm for gram, v in vec.items()}
+
+    def add(self, key):
+        if key in self.vectors:
+            return
+        tf = self._tf(key)
+        self.doc_freq.update(tf.keys())
+        self.vectors[key] = tf
+
+    def remove(self, key):
+        tf = self.vectors.pop(key, None)
+        if tf is None:
+            return
+        self.doc_freq.subtract(tf.keys())
+        self.doc_freq += Counter()  # drop zero counts
+
+    def most_similar(self, key):
+        """Returns (best_key, cosine_similarity) or (None, 0.0) if the index is empty."""
+        if not self.vectors:
+            return None, 0.0
+        query_vec = self._weigh(self._tf(key))
+        best_key, best_score = None, 0.0
+        for candidate, tf in self.vectors.items():
+            cand_vec = self._weigh(tf)
+            score = sum(weight * cand_vec.get(gram, 0.0) for gram, weight in query_vec.items())
+            if score > best_score:
+                best_key, best_score = candidate, score
+        return best_key, best_score
+
+class RouteCache:
+    """
+    LRU cache of router decisions keyed by normalized query.
+
+    Only tool routes are stored: for a chat route the router's generation *is* the answer,
+    so there is nothing to skip. Only exact hits return the cached router output: a similar
+    query can differ in exactly the word that matters ("don't delete...", "why delete...?"),
+    so it always goes to the router.
+    """
+
+    def __init__(self, path=None, max_entries=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def lookup(self, query):
+        """Returns a router response string for `query`, or None on a miss."""
+        key = normalize_query(query)
+        if not key:
+            return None
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def store(self, query, router_response):
+        """Caches `router_response` for `query` if it is a tool route."""
+        response = router_response.strip()
+        key = normalize_query(query)
+        if not key or not response.startswith("[TOOL:") or not response.endswith("]"):
+            return
+        with self._lock:
+            self.entries[key] = response
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.save()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": hit_rate,
+        }
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Error loading route cache: {e}")
+            return
+        for key, response in data.get("entries", [])[-self.max_entries:]:
+            self.entries[key] = response
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {"entries": list(self.entries.items())}
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving route cache: {e}")
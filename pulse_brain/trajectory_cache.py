@@ -0,0 +1,227 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from pulse_brain.route_cache import NgramIndex, normalize_query
+
+# Only this much of each recorded output is kept and compared.
+SIGNATURE_CHARS = 2000
+
+def output_signature(output):
+    """Command output with digits masked and whitespace collapsed, so sizes, PIDs and times don't count as changes."""
+    output = re.sub(r"\d+", "#", output or "")
+    return re.sub(r"\s+", " ", output).strip()[:SIGNATURE_CHARS]
+
+def command_succeeded(output):
+    """False for outputs that report a failure (non-zero exit code or an execution error)."""
+    match = re.match(r"Exit code: (-?\d+)", output or "")
+    if match:
+        return match.group(1) == "0"
+    return not (output or "").startswith("An error occurred")
+
+class Replay:
+    """
+    Walks a cached trajectory alongside the agent loop.
+
+    `next_action()` returns the recorded action for the current step (the finish action once
+    every command has been replayed) for as long as the replay is active. After each command,
+    `observe(command, output)` compares what happened with the recording; on the first
+    difference the replay stops and the model takes over with the history so far.
+    """
+
+    def __init__(self, trajectory):
+        self.task = trajectory["task"]
+        self.steps = trajectory["steps"]
+        self.finish_thought = trajectory.get("finish") or "The cached plan completed."
+        self.position = 0
+        self.active = True
+
+    def next_action(self):
+        if not self.active:
+            return None
+        if self.position < len(self.steps):
+            step = self.steps[self.position]
+            return {"thought": step["thought"], "action": "execute_shell_command",
+                    "arguments": {"command": step["command"]}}
+        return {"thought": self.finish_thought, "action": "finish", "arguments": {}}
+
+    def observe(self, command, output):
+        """Returns False if the replay just diverged from the recording."""
+        if not self.active:
+            return True
+        step = self.steps[self.position] if self.position < len(self.steps) else None
+        if step is None or step["command"] != command or step["output"] != output_signature(output):
+            self.active = False
+            return False
+        self.position += 1
+        return True
+
+class TrajectoryCache:
+    """
+    Known-good command plans for CLI tasks, keyed by normalized task description.
+
+    A trajectory is what a finished task did: its successful commands, with a signature of
+    each command's output, and the final thought. A task with the same normalized
+    description replays the plan (see Replay); a similar one (character n-gram TF-IDF, like
+    the route cache) only gets the plan proposed to the model, since its commands may need
+    different arguments. Entries are evicted least-recently-used beyond `max_entries` and
+    once unused for `ttl` seconds.
+    """
+
+    def __init__(self, path=None, max_entries=200, ttl=30 * 86400, similarity_threshold=0.7, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.index = NgramIndex()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.replayed_steps = 0
+        self.diverged = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def _expired(self, entry):
+        return self.ttl is not None and self.clock() - entry["last_used"] > self.ttl
+
+    def _remove(self, key):
+        self.entries.pop(key, None)
+        self.index.remove(key)
+        self.evicted += 1
+
+    def lookup(self, task):
+        """Returns (trajectory, exact): the cached trajectory for `task` or a similar one, or (None, False)."""
+        key = normalize_query(task or "")
+        if not key:
+            return None, False
+        with self._lock:
+            entry = self.entries.get(key)
+            exact = entry is not None
+            if entry is None:
+                best_key, score = self.index.most_similar(key)
+                if best_key is not None and score >= self.similarity_threshold:
+                    key, entry = best_key, self.entries[best_key]
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None, False
+
+            self.entries.move_to_end(key)
+            entry["last_used"] = self.clock()
+            if exact:
+                self.hits += 1
+            else:
+                self.similar_hits += 1
+            return entry, exact
+
+    def store(self, task, steps, finish_thought=None):
+        """
+        Records a finished task. `steps` are {"thought", "command", "output"} dicts in the
+        order they ran; failed commands are left out of the plan.
+        """
+        key = normalize_query(task or "")
+        plan = [
+            {"thought": step["thought"], "command": step["command"], "output": output_signature(step["output"])}
+            for step in steps if step.get("command") and command_succeeded(step["output"])
+        ]
+        if not key or not plan:
+            return
+        now = self.clock()
+        with self._lock:
+            previous = self.entries.get(key)
+            if previous is None:
+                self.index.add(key)
+            self.entries[key] = {
+                "task": task.strip(), "steps": plan, "finish": finish_thought,
+                "created": previous["created"] if previous else now, "last_used": now,
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+        self.save()
+
+    def record_replayed_step(self):
+        with self._lock:
+            self.replayed_steps += 1
+
+    def record_divergence(self):
+        with self._lock:
+            self.diverged += 1
+
+    def stats(self):
+        lookups = self.hits + self.similar_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+            "replayed_steps": self.replayed_steps,
+            "diverged": self.diverged,
+            "evicted": self.evicted,
+        }
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Error loading trajectory cache: {e}")
+            return
+        for key, entry in data.get("entries", [])[-self.max_entries:]:
+            if not self._expired(entry):
+                self.entries[key] = entry
+                self.index.add(key)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {"entries": list(self.entries.items())}
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving trajectory cache: {e}")
+
+def plan_hint(trajectory):
+    """Text added to a task's first message when a similar task has a cached plan."""
+    commands = "\n".join(f"{number}. {step['command']}" for number, step in enumerate(trajectory["steps"], 1))
+    return (f"\nA similar task (\"{trajectory['task']}\") was completed before with these commands, "
+            f"in order:\n{commands}\nReuse them if they fit this task, adapting arguments as needed.")
+
+_trajectory_cache = None
+_disabled = False
+
+def disable_trajectory_cache():
+    """Turns the cache off for the rest of the process: nothing is replayed, proposed or recorded."""
+    global _disabled
+    _disabled = True
+
+def get_trajectory_cache():
+    """The shared cache, or None once disable_trajectory_cache() has been called."""
+    global _trajectory_cache
+    if _disabled:
+        return None
+    if _trajectory_cache is None:
+        from pulse_config.config import (
+            TRAJECTORY_CACHE_FILE, TRAJECTORY_CACHE_MAX_ENTRIES, TRAJECTORY_CACHE_TTL, TRAJECTORY_CACHE_SIMILARITY,
+        )
+        _trajectory_cache = TrajectoryCache(
+            TRAJECTORY_CACHE_FILE, TRAJECTORY_CACHE_MAX_ENTRIES, TRAJECTORY_CACHE_TTL, TRAJECTORY_CACHE_SIMILARITY,
+        )
+    return _trajectory_cache
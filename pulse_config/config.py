@@ -1,41 +1,150 @@
 import platform
-import json
 import os
 from dotenv import load_dotenv
+from pulse_config.history_store import HistoryStore
 load_dotenv()
 os_name = platform.platform()
 
 LOCAL_MODEL_ID = "meta-llama/Llama-3.2-3B-Instruct"
+GEMINI_MODEL_ID = "gemini-2.5-pro"
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-HISTORY_FILE = "conversation_history.json"
 
-def save_history(history):
+# Backend selection (see pulse_brain/backend_manager.py): "auto" loads the local model and
+# Gemini and routes every call to the healthier/faster one; "local" (Gemini as startup
+# fallback) or "gemini" pin a single backend.
+BACKEND_MODE = os.getenv("PULSE_BACKEND", "auto")
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_COOLDOWN = 30
+CONNECTIVITY_PROBE_URL = "http://www.google.com/"
+CONNECTIVITY_PROBE_INTERVAL = 30
+CONNECTIVITY_PROBE_TIMEOUT = 3
+
+# Append-only conversation log (see pulse_config/history_store.py)
+HISTORY_FILE = "conversation_history.jsonl"
+LEGACY_HISTORY_FILE = "conversation_history.json"
+HISTORY_MAX_MESSAGES = 20
+HISTORY_COMPACT_BYTES = 5_000_000
+HISTORY_KEEP_ON_COMPACT = 1000
+
+# Shared Gemini rate limiter (see pulse_brain/rate_limiter.py). Set these to your quota tier.
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "5"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "250000"))
+GEMINI_MAX_RETRIES = 3
+
+# Local model engine: "bf16" (device_map="auto"), "cpu-int8" (int8 dynamic quantization for
+# CPU-only machines, see pulse_brain/cpu_inference.py) or "auto" (bf16 on CUDA/MPS, cpu-int8 on CPU
+# when torch has a quantized int8 backend)
+LOCAL_ENGINE = os.getenv("PULSE_LOCAL_ENGINE", "auto")
+CPU_THREADS = None  # None = one per physical core
+# The int8 weights are cached here after the first quantization; set to None to always re-quantize
+QUANTIZED_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pulse", "quantized")
+
+# Shared model daemon (pulse_model_server.py): when one is listening on MODEL_SERVER_SOCKET,
+# the local model is used through it instead of being loaded in-process ("0" never connects)
+USE_MODEL_SERVER = os.getenv("PULSE_MODEL_SERVER", "1") == "1"
+MODEL_SERVER_SOCKET = os.getenv(
+    "PULSE_MODEL_SOCKET", os.path.join(os.path.expanduser("~"), ".cache", "pulse", "model.sock")
+)
+MODEL_SERVER_MAX_BATCH = 4  # concurrent requests decoded together in one forward pass
+MODEL_SERVER_BATCH_WINDOW = 0.01  # seconds to wait for more requests before starting a batch
+
+# Reuse past_key_values across calls for the local model (see pulse_brain/local_engine.py)
+LOCAL_KV_CACHE = True
+# Decode CLI agent steps on the local model against the JSON action schema (see pulse_brain/json_actions.py)
+LOCAL_CONSTRAINED_JSON = True
+
+# Prompt token budget for router and agent histories (see pulse_brain/context_manager.py)
+CONTEXT_TOKEN_BUDGET = 4096
+CONTEXT_KEEP_RECENT = 4
+CONTEXT_SUMMARY_CHARS = 300
+
+# Text-to-speech backend: "pyttsx3", "piper" (offline neural voice) or "null" (no audio, for headless runs)
+TTS_BACKEND = os.getenv("PULSE_TTS_BACKEND", "pyttsx3")
+PIPER_MODEL_PATH = os.getenv(
+    "PULSE_PIPER_MODEL",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pulse_ear", "models", "en_US-joe-medium.onnx"),
+)
+
+# Offline speech recognition (see pulse_ear/offline_stt.py)
+OFFLINE_STT_MODEL_ID = "openai/whisper-tiny.en"
+STT_SAMPLE_RATE = 16000
+
+# Always-on capture and local wake word (see pulse_ear/wake_word.py).
+# Enroll templates with `python -m pulse_ear.wake_word`; without them the Google wake word is used.
+CAPTURE_RING_SECONDS = 10
+WAKE_WORD_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pulse_ear", "wake_word")
+WAKE_WORD_THRESHOLD = None  # None = calibrate from the templates
+USE_WAKE_WORD = True  # voice mode waits for the wake word when templates are enrolled
+
+# Speak chat answers sentence by sentence as they stream in (voice mode)
+SPEAK_CHAT_RESPONSES = False
+
+# Shell command execution limits (see pulse_tools/shell_engine.py)
+SHELL_TIMEOUT = 60
+SHELL_MAX_OUTPUT_BYTES = 1_000_000
+SHELL_SUMMARY_HEAD_BYTES = 2000
+SHELL_SUMMARY_TAIL_BYTES = 2000
+SHELL_ECHO_OUTPUT = True
+# Keep one bash session per CLI task so cd/exports/virtualenvs persist between steps
+PERSISTENT_SHELL = True
+
+# Background jobs (see pulse_brain/jobs.py): CLI tasks run on a thread pool so the main loop
+# keeps taking input; `jobs`, `job <id>` and `cancel <id>` manage them (also enabled by --background)
+BACKGROUND_JOBS = os.getenv("PULSE_BACKGROUND_JOBS", "0") == "1"
+MAX_CONCURRENT_JOBS = 2
+
+# Fused routing: one router generation returns the route and, for CLI tasks, the first
+# shell action, saving a full LLM round trip per task (also enabled by --fused-routing)
+FUSED_ROUTING = os.getenv("PULSE_FUSED_ROUTING", "0") == "1"
+
+# Non-interactive batch mode (`cli_agent.py --batch FILE`, see pulse_brain/batch_runner.py)
+BATCH_SIZE = 8  # router chats decoded together
+BATCH_MAX_JOBS = 4  # CLI tasks running at once
+BATCH_OUTPUT_FILE = "batch_results.jsonl"
+
+# Router decision cache (see pulse_brain/route_cache.py)
+ROUTE_CACHE_ENABLED = True
+ROUTE_CACHE_FILE = "route_cache.json"
+ROUTE_CACHE_MAX_ENTRIES = 500
+
+# Cached command plans of finished CLI tasks (see pulse_brain/trajectory_cache.py). A repeated
+# task replays its plan until an output differs; a similar one gets the plan as a hint.
+TRAJECTORY_CACHE_ENABLED = os.getenv("PULSE_TRAJECTORY_CACHE", "1") == "1"
+TRAJECTORY_REPLAY = True  # False: exact matches are only proposed to the model, like similar ones
+TRAJECTORY_CACHE_FILE = "trajectory_cache.json"
+TRAJECTORY_CACHE_MAX_ENTRIES = 200
+TRAJECTORY_CACHE_TTL = 30 * 24 * 3600  # seconds since last use
+TRAJECTORY_CACHE_SIMILARITY = 0.7  # only proposes the plan; the model still decides
+
+_history_store = None
+
+def get_history_store():
+    global _history_store
+    if _history_store is None:
+        _history_store = HistoryStore(
+            HISTORY_FILE,
+            compact_bytes=HISTORY_COMPACT_BYTES,
+            keep_on_compact=HISTORY_KEEP_ON_COMPACT,
+        )
+        _history_store.import_legacy(LEGACY_HISTORY_FILE)
+    return _history_store
+
+def append_history(messages):
+    """Appends new messages to the conversation log."""
     try:
-        with open(HISTORY_FILE, 'w') as f:
-            json.dump(history, f, indent=4)
+        get_history_store().append(messages)
     except Exception as e:
         print(f"Error saving history: {e}")
 
 def load_history():
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, 'r') as f:
-                history = json.load(f)
-                
-                if not history or history[0]['role'] != 'system':
-                    return [{"role": "system", "content": ROUTER_SYSTEM_PROMPT}]
-                
-                history[0]['content'] = ROUTER_SYSTEM_PROMPT
-                
-                if len(history) > 21:
-                
-                    history = [history[0]] + history[-20:]
-                
-                return history
-        except (json.JSONDecodeError, IndexError):
-            return [{"role": "system", "content": ROUTER_SYSTEM_PROMPT}]
-    else:
-        return [{"role": "system", "content": ROUTER_SYSTEM_PROMPT}]
+    """Returns the router system prompt followed by the most recent messages."""
+    try:
+        recent = get_history_store().tail(HISTORY_MAX_MESSAGES)
+    except OSError as e:
+        print(f"Error loading history: {e}")
+        recent = []
+    recent = [msg for msg in recent if msg.get("role") != "system"]
+    return [{"role": "system", "content": ROUTER_SYSTEM_PROMPT}] + recent
 
 ROUTER_SYSTEM_PROMPT = """
 You are an intelligent assistant named Pulse.
@@ -59,7 +168,8 @@ You have access to these two tools:
 
 RULES:
 - You are installed on the platform {os_name}.
-- **Context Awareness:** Always check your current directory (`pwd`) or file existence (`ls`) if you are unsure of the state.
+- **Shell Session:** All your commands run in one persistent shell for the whole task. `cd`, exported variables and activated virtualenvs carry over to later commands, so you do not need to re-check `pwd` after every step.
+- **Context Awareness:** Check your current directory (`pwd`) or file existence (`ls`) only if you are genuinely unsure of the state.
 - **Verification:** After running a critical command (like creating a file), verify it succeeded before moving on.
 - **Error Handling:** If a command fails, analyze the error message in the "Tool Output" and try a different approach.
 - You MUST respond in this exact JSON format:
@@ -86,4 +196,27 @@ You: {{ "thought": "The task is complete.", "action": "finish", "arguments": {{}
 SAFETY RULES:
 - Never execute destructive commands (rm -rf /) without explicit user confirmation.
 - Stop if you encounter sensitive operations (modifying system files, network operations) unless explicitly asked.
-""".format(os_name=os_name)
\ No newline at end of file
+""".format(os_name=os_name)
+
+FUSED_ROUTER_SYSTEM_PROMPT = """
+You are an intelligent assistant named Pulse.
+Your job is to decide if a user's request requires executing shell commands or if it is a general chat.
+
+1. If the request requires shell commands (creating files, running scripts, system info, git, etc.):
+   Respond with this line:
+   [TOOL: cli_agent, task: <concise description of the task>]
+   immediately followed by the FIRST step of the task as JSON, on its own line:
+   {{"thought": "My reasoning for the first step.", "action": "execute_shell_command", "arguments": {{"command": "command_to_run"}}}}
+   Write nothing after the JSON.
+   - You are installed on the platform {os_name}.
+   - Commands run in one persistent shell for the whole task.
+   - Never execute destructive commands (rm -rf /) without explicit user confirmation.
+
+2. If it is a general question, greeting, or conversation:
+   Simply answer the user helperfully. DO NOT use the [TOOL] tag.
+
+EXAMPLE:
+User: "Create a python script named hello.py that prints 'Hello World'"
+You: [TOOL: cli_agent, task: create hello.py that prints Hello World]
+{{"thought": "I will write the python code to the file using echo.", "action": "execute_shell_command", "arguments": {{"command": "echo \\"print('Hello World')\\" > hello.py"}}}}
+""".format(os_name=os_name)
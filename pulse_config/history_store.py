@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+
+class HistoryStore:
+    """
+    Append-only JSONL conversation log.
+
+    Each message is one line, so saving a turn is a single O(1) append instead of rewriting
+    the whole file, and startup only reads the last few blocks of the file to get the tail.
+    Appends are flushed and fsync'd; a line cut short by a crash is skipped when reading.
+    Once the file grows past `compact_bytes` it is rewritten (atomically, via a temp file)
+    to keep only the newest `keep_on_compact` messages.
+    """
+
+    def __init__(self, path, compact_bytes=5_000_000, keep_on_compact=1000, fsync=True):
+        self.path = path
+        self.compact_bytes = compact_bytes
+        self.keep_on_compact = keep_on_compact
+        self.fsync = fsync
+        self._checked_tail = False
+        self._lock = threading.Lock()
+
+    def _repair_tail(self, f):
+        """Makes sure the file ends with a newline so a torn last line can't swallow the next append."""
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def append(self, messages):
+        data = "".join(json.dumps(msg, ensure_ascii=False) + "\n" for msg in messages).encode("utf-8")
+        with self._lock:
+            with open(self.path, "a+b") as f:
+                if not self._checked_tail:
+                    self._repair_tail(f)
+                    self._checked_tail = True
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+                size = f.tell()
+            if self.compact_bytes and size > self.compact_bytes:
+                self._compact()
+
+    def tail(self, n, block_size=65536):
+        """Returns the last `n` messages, reading backwards from the end of the file."""
+        if n <= 0 or not os.path.exists(self.path):
+            return []
+        with open(self.path, "rb") as f:
+            position = f.seek(0, os.SEEK_END)
+            data = b""
+            # n + 1 newlines guarantees n complete lines (the first one may be partial).
+            while position > 0 and data.count(b"\n") <= n:
+                step = min(block_size, position)
+                position -= step
+                f.seek(position)
+                data = f.read(step) + data
+
+        lines = data.split(b"\n")
+        if position > 0:
+            lines = lines[1:]
+        messages = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                messages.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # torn write from a crash
+        return messages[-n:]
+
+    def _compact(self):
+        keep = self.tail(self.keep_on_compact)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write("".join(json.dumps(msg, ensure_ascii=False) + "\n" for msg in keep).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def compact(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                self._compact()
+
+    def import_legacy(self, legacy_path):
+        """One-time migration from the old single-JSON-array history file."""
+        if os.path.exists(self.path) or not os.path.exists(legacy_path):
+            return
+        try:
+            with open(legacy_path, "r") as f:
+                history = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return
+        messages = [msg for msg in history if isinstance(msg, dict) and msg.get("role") != "system"]
+        if messages:
+            self.append(messages[-self.keep_on_compact:])
@@ -0,0 +1,170 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds in milliseconds: 0.05 ms .. ~14 min, doubling.
+BUCKET_BOUNDS_MS = [0.05 * 2 ** i for i in range(25)]
+
+class Histogram:
+    """Log-bucketed latency histogram; percentiles are reported at bucket resolution."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        target = pct / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min(BUCKET_BOUNDS_MS[i], self.max) if i < len(BUCKET_BOUNDS_MS) else self.max
+        return self.max
+
+class Tracer:
+    """
+    Records nested spans (name, start, duration, thread, attributes) for a Chrome trace and
+    aggregates their durations into per-name histograms. Parent/child nesting is tracked
+    per thread. At most `max_events` raw events are kept; histograms keep counting after that.
+    """
+
+    def __init__(self, max_events=200_000):
+        self.max_events = max_events
+        self.events = []
+        self.dropped = 0
+        self.histograms = {}
+        self.counters = {}
+        self.origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def record(self, name, start, duration, attrs=None, parent=None):
+        ms = duration * 1000
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": duration * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": dict(attrs or {}, parent=parent) if parent else dict(attrs or {}),
+        }
+        with self._lock:
+            self.histograms.setdefault(name, Histogram()).add(ms)
+            if len(self.events) < self.max_events:
+                self.events.append(event)
+            else:
+                self.dropped += 1
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        lines = [f"{'span':<30}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'max ms':>11}{'total s':>10}"]
+        with self._lock:
+            for name, hist in sorted(self.histograms.items(), key=lambda item: -item[1].total):
+                lines.append(
+                    f"{name:<30}{hist.count:>7}{hist.percentile(50):>11.2f}{hist.percentile(95):>11.2f}"
+                    f"{hist.max:>11.2f}{hist.total / 1000:>10.2f}"
+                )
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"{name:<30}{value:>7}")
+            if self.dropped:
+                lines.append(f"({self.dropped} trace events dropped after the first {self.max_events})")
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path):
+        """Writes a Chrome trace (open in chrome://tracing or ui.perfetto.dev)."""
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+class Span:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.parent = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        stack = self.tracer._stack()
+        # Spans held open by generators can be closed out of order.
+        if stack and stack[-1] is self:
+            stack.pop()
+        elif self in stack:
+            stack.remove(self)
+        if exc_type is not None and exc_type is not GeneratorExit:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self.name, self.start, duration, self.attrs, self.parent)
+        return False
+
+class _NullSpan:
+    """Returned by span() while tracing is off: entering, exiting and set() do nothing."""
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+_tracer = None
+
+def enable(max_events=200_000):
+    """Turns tracing on for the rest of the process and returns the tracer."""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(max_events)
+    return _tracer
+
+def get_tracer():
+    return _tracer
+
+def span(name, **attrs):
+    """`with span("router", model="local") as s: ... s.set(tokens=12)`; free when tracing is off."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return Span(_tracer, name, attrs)
+
+def record(name, seconds, **attrs):
+    """Records a span measured elsewhere (e.g. a sleep) that ended just now."""
+    if _tracer is not None:
+        _tracer.record(name, time.perf_counter() - seconds, seconds, attrs)
+
+def count(name, value=1):
+    if _tracer is not None:
+        _tracer.count(name, value)
@@ -0,0 +1,103 @@
+import threading
+
+import numpy as np
+
+from pulse_config.config import STT_SAMPLE_RATE
+
+class AudioRingBuffer:
+    """
+    Fixed-size float32 ring of the most recent audio.
+
+    Storage is allocated once; `write` copies each incoming block into it in place, so the
+    audio callback never allocates. Positions are absolute sample counts since capture
+    started, which lets readers ask for "everything since position P" as long as P is still
+    inside the ring.
+    """
+
+    def __init__(self, seconds=10.0, samplerate=STT_SAMPLE_RATE):
+        self.samplerate = samplerate
+        self.capacity = int(seconds * samplerate)
+        self.data = np.zeros(self.capacity, dtype=np.float32)
+        self.position = 0
+        self._cond = threading.Condition()
+
+    def write(self, block):
+        n = len(block)
+        if n >= self.capacity:
+            block = block[-self.capacity:]
+            n = self.capacity
+        with self._cond:
+            start = self.position % self.capacity
+            first = min(n, self.capacity - start)
+            self.data[start:start + first] = block[:first]
+            if first < n:
+                self.data[:n - first] = block[first:]
+            self.position += n
+            self._cond.notify_all()
+
+    def read(self, start, end, out=None):
+        """Copies samples [start, end) into `out` (or a new array). Start is clamped to what's retained."""
+        with self._cond:
+            start = max(start, self.position - self.capacity, 0)
+            end = min(end, self.position)
+            n = max(0, end - start)
+            if out is None:
+                out = np.empty(n, dtype=np.float32)
+            begin = start % self.capacity
+            first = min(n, self.capacity - begin)
+            out[:first] = self.data[begin:begin + first]
+            if first < n:
+                out[first:n] = self.data[:n - first]
+        return out[:n]
+
+    def latest(self, count, out=None):
+        with self._cond:
+            end = self.position
+        return self.read(end - count, end, out)
+
+    def wait_for(self, position, timeout=None):
+        """Blocks until at least `position` samples have been written. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.position >= position, timeout)
+
+class AudioCapture:
+    """Keeps the microphone open on a sounddevice callback, continuously filling a ring buffer."""
+
+    def __init__(self, seconds=10.0, samplerate=STT_SAMPLE_RATE, block_ms=30):
+        self.ring = AudioRingBuffer(seconds, samplerate)
+        self.samplerate = samplerate
+        self.blocksize = int(samplerate * block_ms / 1000)
+        self._stream = None
+
+    def _callback(self, indata, frame_count, time_info, status):
+        self.ring.write(indata[:, 0])
+
+    def start(self):
+        if self._stream is None:
+            import sounddevice as sd
+            self._stream = sd.InputStream(
+                samplerate=self.samplerate, channels=1, dtype='float32',
+                blocksize=self.blocksize, callback=self._callback,
+            )
+            self._stream.start()
+        return self
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def frames(self, start=None, frame_ms=30, stop_event=None):
+        """
+        Yields fixed-size frames starting at absolute position `start` (default: now).
+        Audio already in the ring is yielded immediately, then live audio as it arrives.
+        """
+        size = int(self.samplerate * frame_ms / 1000)
+        position = self.ring.position if start is None else start
+        while stop_event is None or not stop_event.is_set():
+            if not self.ring.wait_for(position + size, timeout=0.5):
+                continue
+            position = max(position, self.ring.position - self.ring.capacity)
+            yield self.ring.read(position, position + size)
+            position += size
@@ -0,0 +1,190 @@
+import queue
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from pulse_config.config import OFFLINE_STT_MODEL_ID, STT_SAMPLE_RATE
+
+FRAME_MS = 30
+
+def microphone_frames(samplerate=STT_SAMPLE_RATE, frame_ms=FRAME_MS, stop_event=None):
+    """Yields float32 mono frames from the default microphone via a sounddevice callback."""
+    import sounddevice as sd
+
+    frames = queue.Queue()
+
+    def callback(indata, frame_count, time_info, status):
+        frames.put(indata[:, 0].copy())
+
+    blocksize = int(samplerate * frame_ms / 1000)
+    with sd.InputStream(samplerate=samplerate, channels=1, dtype='float32', blocksize=blocksize, callback=callback):
+        while stop_event is None or not stop_event.is_set():
+            try:
+                yield frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+def read_wav(path, samplerate=STT_SAMPLE_RATE):
+    """Loads a PCM WAV file as float32 mono at `samplerate`."""
+    with wave.open(path, "rb") as wav:
+        rate = wav.getframerate()
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        raw = wav.readframes(wav.getnframes())
+    dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[width]
+    audio = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+    if width == 1:
+        audio = (audio - 128) / 128.0
+    else:
+        audio /= float(np.iinfo(dtype).max)
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    if rate != samplerate:
+        duration = len(audio) / rate
+        target = np.linspace(0, duration, int(duration * samplerate), endpoint=False)
+        audio = np.interp(target, np.arange(len(audio)) / rate, audio).astype(np.float32)
+    return audio
+
+def wav_frames(path, samplerate=STT_SAMPLE_RATE, frame_ms=FRAME_MS):
+    """Yields a WAV file as fixed-size frames, like microphone_frames (plus trailing silence)."""
+    audio = read_wav(path, samplerate)
+    size = int(samplerate * frame_ms / 1000)
+    for start in range(0, len(audio), size):
+        yield audio[start:start + size]
+    silence = np.zeros(size, dtype=np.float32)
+    for _ in range(int(2000 / frame_ms)):
+        yield silence
+
+class EnergyVAD:
+    """
+    Frame-level voice activity detection on RMS energy with an adaptive noise floor.
+    The floor starts as the quietest of the first few frames and then tracks non-speech
+    frames; a frame is speech when its energy is `ratio` times the floor (and above `min_rms`).
+    """
+
+    def __init__(self, ratio=3.0, min_rms=0.01, floor_decay=0.95, calibration_frames=5):
+        self.ratio = ratio
+        self.min_rms = min_rms
+        self.floor_decay = floor_decay
+        self.calibration_frames = calibration_frames
+        self.noise_floor = None
+        self._calibrated = 0
+
+    def is_speech(self, frame):
+        rms = float(np.sqrt(np.mean(np.square(frame)))) if len(frame) else 0.0
+        if self._calibrated < self.calibration_frames:
+            self.noise_floor = rms if self.noise_floor is None else min(self.noise_floor, rms)
+            self._calibrated += 1
+        speech = rms > max(self.min_rms, self.noise_floor * self.ratio)
+        if not speech:
+            self.noise_floor = self.floor_decay * self.noise_floor + (1 - self.floor_decay) * rms
+        return speech
+
+_asr_pipeline = None
+_asr_lock = threading.Lock()
+
+def get_asr_pipeline(model_id=OFFLINE_STT_MODEL_ID):
+    """Lazy loads the local transformers ASR pipeline once."""
+    global _asr_pipeline
+    with _asr_lock:
+        if _asr_pipeline is None:
+            from transformers import pipeline
+            _asr_pipeline = pipeline("automatic-speech-recognition", model=model_id)
+        return _asr_pipeline
+
+class OfflineRecognizer:
+    """
+    Streaming offline speech recognition.
+
+    Frames go through energy VAD; speech is cut into segments at short pauses (or every
+    `max_segment_s`) and each finished segment is decoded on a background thread while the
+    user keeps talking. When `end_silence_ms` of silence follows speech, only the last
+    segment is left to decode, so end-of-speech to text latency stays low.
+    """
+
+    def __init__(self, transcribe=None, samplerate=STT_SAMPLE_RATE, frame_ms=FRAME_MS,
+                 segment_pause_ms=300, end_silence_ms=800, max_segment_s=8.0,
+                 start_timeout_s=8.0, max_utterance_s=30.0, vad=None):
+        self.transcribe = transcribe or self._transcribe_local
+        self.samplerate = samplerate
+        self.frame_ms = frame_ms
+        self.segment_pause_frames = segment_pause_ms // frame_ms
+        self.end_silence_frames = end_silence_ms // frame_ms
+        self.max_segment_frames = int(max_segment_s * 1000 / frame_ms)
+        self.start_timeout_frames = int(start_timeout_s * 1000 / frame_ms)
+        self.max_utterance_frames = int(max_utterance_s * 1000 / frame_ms)
+        self.vad = vad or EnergyVAD()
+        self.last_latency = 0.0  # end of speech -> text, for the last utterance
+        self._decoder = ThreadPoolExecutor(max_workers=1)
+
+    def _transcribe_local(self, audio):
+        result = get_asr_pipeline()({"raw": audio, "sampling_rate": self.samplerate})
+        return result["text"].strip()
+
+    def listen(self, frames, preroll=None):
+        """
+        Consumes `frames` until the end of one utterance and returns its text ("" if nothing
+        was said). `preroll` is audio captured just before listening started (e.g. by the
+        wake-word detector) and is treated as the beginning of the utterance.
+        """
+        segments = []
+        current = []
+        speech_started = False
+        silent_frames = 0
+        total_frames = 0
+
+        def flush():
+            if current:
+                segments.append(self._decoder.submit(self.transcribe, np.concatenate(current)))
+                current.clear()
+
+        if preroll is not None and len(preroll):
+            current.append(np.asarray(preroll, dtype=np.float32))
+            speech_started = True
+
+        for frame in frames:
+            total_frames += 1
+            speech = self.vad.is_speech(frame)
+            if not speech_started:
+                if speech:
+                    speech_started = True
+                    current.append(frame)
+                elif total_frames >= self.start_timeout_frames:
+                    break
+                continue
+
+            current.append(frame)
+            silent_frames = 0 if speech else silent_frames + 1
+            if silent_frames >= self.end_silence_frames or total_frames >= self.max_utterance_frames:
+                break
+            if silent_frames == self.segment_pause_frames or len(current) >= self.max_segment_frames:
+                flush()
+
+        ended = time.perf_counter()
+        if hasattr(frames, "close"):
+            frames.close()
+        # Trailing silence carries no words; don't spend decode time on it.
+        if silent_frames and len(current) > silent_frames:
+            del current[-silent_frames:]
+        elif silent_frames:
+            current.clear()
+        flush()
+        texts = [future.result() for future in segments]
+        self.last_latency = time.perf_counter() - ended
+        return " ".join(text for text in texts if text).strip()
+
+_offline_recognizer = None
+
+def get_offline_recognizer():
+    global _offline_recognizer
+    if _offline_recognizer is None:
+        _offline_recognizer = OfflineRecognizer()
+    return _offline_recognizer
+
+def transcribe_wav(path, recognizer=None):
+    """Runs the streaming recognizer over a WAV file instead of the microphone."""
+    recognizer = recognizer or get_offline_recognizer()
+    return recognizer.listen(wav_frames(path, recognizer.samplerate, recognizer.frame_ms))
@@ -0,0 +1,97 @@
+import os
+import queue
+import threading
+
+from pulse_config.config import PIPER_MODEL_PATH
+
+_piper_voice_instance = None
+_piper_voice_lock = threading.Lock()
+
+def get_piper_voice(model_path=PIPER_MODEL_PATH):
+    """Lazy loads the Piper voice model only when needed, then keeps it for the session."""
+    global _piper_voice_instance
+    with _piper_voice_lock:
+        if _piper_voice_instance is None:
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(
+                    f"Piper model not found at {model_path}. "
+                    "Please download the .onnx file next to its .json config."
+                )
+            from piper import PiperVoice
+            _piper_voice_instance = PiperVoice.load(model_path)
+        return _piper_voice_instance
+
+def synthesize_chunks(voice, text):
+    """Yields raw 16-bit mono PCM for `text`, across old and new piper-tts APIs."""
+    if hasattr(voice, "synthesize_stream_raw"):
+        yield from voice.synthesize_stream_raw(text)
+    else:
+        for chunk in voice.synthesize(text):
+            yield chunk.audio_int16_bytes
+
+def _open_output_stream(samplerate, channels, dtype):
+    import sounddevice as sd
+    return sd.RawOutputStream(samplerate=samplerate, channels=channels, dtype=dtype)
+
+class PiperSink:
+    """
+    Offline Piper TTS for the TTS worker.
+
+    Text is split into sentences and synthesised on a helper thread one sentence ahead of
+    playback, so the first sentence starts playing as soon as it is rendered while the next
+    one is being synthesised. `voice` and `stream_factory` can be replaced with stubs
+    (anything with `config.sample_rate` + `synthesize_stream_raw`, and a context manager
+    with `write`) to run without the ONNX model or an audio device.
+    """
+
+    def __init__(self, voice=None, stream_factory=None, lookahead=2):
+        self.voice = voice or get_piper_voice()
+        self.stream_factory = stream_factory or _open_output_stream
+        self.lookahead = lookahead
+
+    def _synthesize(self, sentences, chunks, cancelled):
+        try:
+            for sentence in sentences:
+                for audio in synthesize_chunks(self.voice, sentence):
+                    if cancelled():
+                        return
+                    chunks.put(audio)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(None)
+
+    def say(self, text, cancelled):
+        from pulse_ear.speech_handler import split_sentences
+
+        sentences, rest = split_sentences(text)
+        if rest.strip():
+            sentences.append(rest.strip())
+        if not sentences:
+            return
+
+        # Bounded so synthesis stays only a little ahead of playback.
+        chunks = queue.Queue(maxsize=self.lookahead * 8)
+        producer = threading.Thread(target=self._synthesize, args=(sentences, chunks, cancelled), daemon=True)
+        producer.start()
+        try:
+            with self.stream_factory(self.voice.config.sample_rate, 1, 'int16') as stream:
+                while True:
+                    audio = chunks.get()
+                    if audio is None:
+                        break
+                    if isinstance(audio, Exception):
+                        raise audio
+                    if cancelled():
+                        break
+                    stream.write(audio)
+        finally:
+            # Unblock the producer if playback stopped early.
+            while producer.is_alive():
+                try:
+                    chunks.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+
+    def stop(self):
+        pass  # `cancelled` is checked between audio chunks
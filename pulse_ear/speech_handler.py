@@ -1,9 +1,11 @@
-import pyttsx3
-import speech_recognition as sr
-import numpy as np
-import sounddevice as sd
-import queue
-import requests
+import threading
+import time
+from pulse_config.config import TTS_BACKEND
+from pulse_config.tracing import span
+from pulse_ear.tts_worker import TTSWorker, NullSink, Pyttsx3Sink, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+
+# Audio libraries (pyttsx3, speech_recognition, sounddevice, numpy) are imported lazily
+# so text mode never pays for them at startup.
 
 # Change how the Engine Sounds-------xXunderconstructionXx-------------------------------------------------------------------
 
@@ -22,77 +24,91 @@ def voice_change(voice_index=None):
     return engine
 """
 
-def speak(_audio=None,voice_change=False):
+def split_sentences(text):
+    """
+    Splits complete sentences off the front of `text`.
+    Returns (sentences, remainder) where remainder is the trailing, still-incomplete part.
+    """
+    sentences = []
+    start = 0
+    for i, ch in enumerate(text):
+        if ch in ".!?\n" and (i + 1 == len(text) or text[i + 1].isspace()):
+            if i + 1 == len(text) and ch != "\n":
+                break  # might be "3." of "3.5" or an abbreviation still streaming in
+            sentence = text[start:i + 1].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = i + 1
+    return sentences, text[start:]
+
+_tts_worker = None
+_tts_worker_lock = threading.Lock()
+
+def _make_sink():
+    if TTS_BACKEND == "null":
+        return NullSink()
+    if TTS_BACKEND == "piper":
+        try:
+            from pulse_ear.piper_tts import PiperSink
+            return PiperSink()
+        except Exception as e:
+            print(f"Piper TTS unavailable ({e}); falling back to pyttsx3.")
+    return Pyttsx3Sink()
+
+def get_tts_worker():
+    """Starts the shared TTS worker on first use."""
+    global _tts_worker
+    with _tts_worker_lock:
+        if _tts_worker is None:
+            _tts_worker = TTSWorker(_make_sink)
+        return _tts_worker
+
+_muted = False
+
+def mute_speech():
+    """Makes speak() a no-op for the rest of the process (unattended batch runs)."""
+    global _muted
+    _muted = True
+
+def speak(_audio=None,voice_change=False, priority=PRIORITY_NORMAL, interrupt=False):
+    """
+    Queues `_audio` for speech and returns immediately; playback happens on the TTS worker.
+    `interrupt=True` cancels whatever is playing or queued first.
+    """
     # if voice_change:
     #     engine = voice_change(voice_index)
     # else:
     #     engine = pyttsx3.init()
-    engine = pyttsx3.init()
-    engine.say(_audio)
-    engine.runAndWait()
-    engine.stop()
+    if _audio and not _muted:
+        get_tts_worker().say(_audio, priority=priority, interrupt=interrupt)
     return _audio
 
-# PIPER_MODEL_PATH = ""
-# _piper_voice_instance = None
-
-# def get_piper_voice():
-#     """Lazy loads the Piper voice model only when needed."""
-#     global _piper_voice_instance
-#     if _piper_voice_instance is None:
-#         if not os.path.exists(PIPER_MODEL_PATH):
-#             print(f"ERROR: Piper model not found at {PIPER_MODEL_PATH}")
-#             print("Please download the .onnx and .json files.")
-#             return None
-#         try:
-#             # load the voice
-#             _piper_voice_instance = PiperVoice.load(PIPER_MODEL_PATH)
-#         except Exception as e:
-#             print(f"Failed to load Piper model: {e}")
-#             return None
-#     return _piper_voice_instance
-
-# def speak(_audio=None, voice_change=False):
-#     """
-#     Synthesizes text to speech using Piper-TTS and plays it via sounddevice.
-#     """
-#     if not _audio:
-#         return ""
-
-#     print(f"Pulse: {_audio}")
-    
-#     voice = get_piper_voice()
-    
-#     if not voice:
-#         print(f"(Audio output unavailable): {_audio}")
-#         return _audio
+def cancel_speech():
+    """Barge-in: stops current speech and drops anything still queued."""
+    if _tts_worker is not None:
+        _tts_worker.cancel()
 
-#     stream = voice.synthesize_stream_raw(_audio)
-    
-#     try:
-#         with sd.RawOutputStream(samplerate=voice.config.sample_rate, 
-#                                 channels=1, 
-#                                 dtype='int16') as s:
-#             for audio_bytes in stream:
-#                 s.write(audio_bytes)
-                
-#     except Exception as e:
-#         print(f"Audio playback error: {e}")
-
-#     return _audio
-
-def check_internet_connection(url='http://www.google.com/', timeout=5):
-    """Checks for a stable internet connection."""
-    try:
-        requests.get(url, timeout=timeout)
-        return True
-    except (requests.ConnectionError, requests.Timeout):
-        return False
+def wait_for_speech(timeout=None):
+    """Blocks until queued speech has finished playing."""
+    if _tts_worker is not None:
+        _tts_worker.wait(timeout)
+
+# Ring-buffer position right after the last local wake word, consumed by command_offline.
+_wake_position = None
+
+def check_internet_connection():
+    """
+    Connectivity as last seen by the background probe (see pulse_brain/backend_manager.py).
+    Only the very first call waits for a probe to finish.
+    """
+    from pulse_brain.backend_manager import get_backend_manager
+    return bool(get_backend_manager().online())
 
 def command_google():
     """
     Listens using speech_recognition and uses Google's (ONLINE) Web Speech API.
     """
+    import speech_recognition as sr
     _recog = sr.Recognizer()
     with sr.Microphone() as _source:
         print("Listening... (Google Online)")
@@ -100,34 +116,82 @@ def command_google():
         _recog.adjust_for_ambient_noise(_source, duration=1)
         _audio = _recog.listen(_source)
     
+    from pulse_brain.backend_manager import get_backend_manager
+    manager = get_backend_manager()
+    started = time.perf_counter()
     try:
         print("Recognizing... (Google Online)")
-        _query = _recog.recognize_google(_audio)
+        with span("stt.google.recognize"):
+            _query = _recog.recognize_google(_audio)
+        manager.record_success("google", time.perf_counter() - started)
         print(f"Recognized: {_query}")
         return _query
     except sr.UnknownValueError:
+        manager.record_success("google", time.perf_counter() - started)
         print("Sorry, I didn't understand that")
         return "0"
     except sr.RequestError as error1:
+        manager.record_failure("google", error1)
         print(f"Google API request failed; {error1}")
         return "0"
     except Exception as error2:
         print(f"An error occurred: {error2}")
         return "0"
 
+def command_offline():
+    """
+    Listens on the microphone and transcribes locally (VAD endpointing + transformers ASR).
+    """
+    global _wake_position
+    from pulse_ear.offline_stt import get_offline_recognizer, microphone_frames
+    recognizer = get_offline_recognizer()
+    print("Listening... (Offline)")
+    if _wake_position is not None:
+        # Continue from the ring buffer right after the wake word so the first words aren't lost.
+        from pulse_ear.wake_word import get_capture
+        frames = get_capture().frames(start=_wake_position, frame_ms=recognizer.frame_ms)
+        _wake_position = None
+    else:
+        frames = microphone_frames(recognizer.samplerate, recognizer.frame_ms)
+    from pulse_brain.backend_manager import get_backend_manager
+    manager = get_backend_manager()
+    try:
+        with span("stt.offline.listen") as trace:
+            _query = recognizer.listen(frames)
+            trace.set(end_of_speech_to_text_ms=recognizer.last_latency * 1000)
+        manager.record_success("offline", recognizer.last_latency)
+    except Exception as error:
+        manager.record_failure("offline", error)
+        print(f"An error occurred: {error}")
+        return "0"
+    if not _query:
+        print("Sorry, I didn't understand that")
+        return "0"
+    print(f"Recognized: {_query}")
+    return _query
+
 def command():
     """
-    Checks for internet and routes to Google (online) or Whisper (offline).
+    Routes to Google (online) or Whisper (offline), whichever the backend manager
+    considers healthy and fast; Google needs the (cached) connectivity probe to be online.
+    Right after a local wake word the buffered audio is transcribed offline.
     """
-    if check_internet_connection():
+    if _wake_position is not None:
+        return command_offline()
+    from pulse_brain.backend_manager import get_backend_manager
+    manager = get_backend_manager()
+    manager.online()  # waits for the first probe only
+    backend = manager.choose("stt")
+    if backend is not None and backend.name == "google":
         return command_google()
-    else:
-        print("No internet connection.")
-        return None
+    if not manager.online(wait=False):
+        print("No internet connection. Using offline speech recognition.")
+    return command_offline()
 
 def listen_for_wake_word_google(wake_word="wake", duration=2):
     """Listens for wake word using Google (Online) Web Speech."""
     print(f"Listening for wake word '{wake_word}'... (Google Online)")
+    import speech_recognition as sr
     r = sr.Recognizer()
     with sr.Microphone() as source:
         r.adjust_for_ambient_noise(source, duration=0.5)
@@ -149,10 +213,38 @@ def listen_for_wake_word_google(wake_word="wake", duration=2):
         return False
 
 
+def local_wake_word_available():
+    """True when wake-word templates are enrolled and the microphone capture could start."""
+    try:
+        from pulse_ear.wake_word import get_wake_word_listener
+        return get_wake_word_listener() is not None
+    except Exception as e:
+        print(f"Local wake word unavailable ({e}).")
+        return False
+
+def listen_for_wake_word_local(timeout=None):
+    """
+    Waits for the enrolled wake word on the always-on capture ring buffer (no network).
+    On detection, the next `command()` streams from the audio right after the wake word.
+    """
+    global _wake_position
+    from pulse_ear.wake_word import get_wake_word_listener
+    listener = get_wake_word_listener()
+    print("Listening for wake word... (Local)")
+    position = listener.wait(timeout=timeout)
+    if position is None:
+        return False
+    print("Wake word detected.")
+    _wake_position = position
+    return True
+
 def listen_for_wake_word(wake_word="wake", duration=2):
     """
-    Checks for internet and routes to Google (online) for wake word detection.
+    Uses the local spotter when wake-word templates are enrolled, otherwise routes
+    to Google (online) for wake word detection.
     """
+    if local_wake_word_available():
+        return listen_for_wake_word_local()
     if check_internet_connection():
         return listen_for_wake_word_google(wake_word, duration)
     else:
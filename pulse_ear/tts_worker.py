@@ -0,0 +1,121 @@
+import heapq
+import itertools
+import threading
+import time
+
+from pulse_config.tracing import span, record
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+class NullSink:
+    """Audio sink that plays nothing; records what would have been spoken (headless runs and tests)."""
+
+    def __init__(self, echo=False):
+        self.echo = echo
+        self.spoken = []
+
+    def say(self, text, cancelled):
+        if self.echo:
+            print(f"(tts) {text}")
+        self.spoken.append(text)
+
+    def stop(self):
+        pass
+
+class Pyttsx3Sink:
+    """One long-lived pyttsx3 engine. Must be created and used on the TTS worker thread."""
+
+    def __init__(self):
+        import pyttsx3
+        self.engine = pyttsx3.init()
+        self._cancelled = None
+        # Interrupting from the engine's own callback is the safe way to cut an utterance short.
+        self.engine.connect('started-word', self._on_word)
+
+    def _on_word(self, name, location, length):
+        if self._cancelled is not None and self._cancelled():
+            self.engine.stop()
+
+    def say(self, text, cancelled):
+        self._cancelled = cancelled
+        self.engine.say(text)
+        self.engine.runAndWait()
+        self._cancelled = None
+
+    def stop(self):
+        pass  # handled from _on_word on the worker thread
+
+class TTSWorker:
+    """
+    Speaks on a dedicated thread so callers never block on audio.
+
+    Utterances are queued by priority (then arrival order). `cancel()` drops everything
+    queued and interrupts the utterance in progress; a new low-priority utterance replaces
+    any low-priority ones still waiting, since progress chatter goes stale quickly.
+    The sink is built on the worker thread, as pyttsx3 engines are thread-affine.
+    """
+
+    def __init__(self, sink_factory):
+        self.sink_factory = sink_factory
+        self.sink = None
+        self._heap = []
+        self._counter = itertools.count()
+        self._generation = 0
+        self._busy = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="pulse-tts", daemon=True)
+        self._thread.start()
+
+    def say(self, text, priority=PRIORITY_NORMAL, interrupt=False):
+        with self._cond:
+            if interrupt:
+                self._cancel_locked()
+            if priority == PRIORITY_LOW:
+                self._heap = [item for item in self._heap if item[0] != PRIORITY_LOW]
+                heapq.heapify(self._heap)
+            heapq.heappush(self._heap, (priority, next(self._counter), self._generation, text, time.perf_counter()))
+            self._cond.notify_all()
+
+    def _cancel_locked(self):
+        self._generation += 1
+        self._heap.clear()
+        if self.sink is not None:
+            self.sink.stop()
+        self._cond.notify_all()
+
+    def cancel(self):
+        with self._cond:
+            self._cancel_locked()
+
+    def wait(self, timeout=None):
+        """Blocks until everything queued has been spoken. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._heap and not self._busy, timeout)
+
+    def _run(self):
+        try:
+            self.sink = self.sink_factory()
+        except Exception as e:
+            print(f"Text-to-speech unavailable ({e}); continuing without audio.")
+            self.sink = NullSink()
+
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._heap)
+                priority, _, generation, text, queued_at = heapq.heappop(self._heap)
+                self._busy = True
+            cancelled = lambda: generation != self._generation
+            try:
+                if not cancelled():
+                    record("tts.queue_wait", time.perf_counter() - queued_at, priority=priority)
+                    with span("tts.say", chars=len(text), priority=priority) as trace:
+                        self.sink.say(text, cancelled)
+                        trace.set(cancelled=cancelled())
+            except Exception as e:
+                print(f"Audio playback error: {e}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
@@ -0,0 +1,226 @@
+import glob
+import os
+import threading
+import time
+
+import numpy as np
+
+from pulse_config.config import STT_SAMPLE_RATE
+
+WINDOW_MS = 25
+HOP_MS = 20
+NUM_BANDS = 20
+
+def _filterbank(samplerate, n_fft, num_bands):
+    """Triangular filters on a log-frequency scale between 100 Hz and 4 kHz (speech band)."""
+    freqs = np.fft.rfftfreq(n_fft, 1.0 / samplerate)
+    edges = np.geomspace(100, min(4000, samplerate / 2), num_bands + 2)
+    bank = np.zeros((len(freqs), num_bands), dtype=np.float32)
+    for b in range(num_bands):
+        lo, mid, hi = edges[b], edges[b + 1], edges[b + 2]
+        rising = (freqs - lo) / (mid - lo)
+        falling = (hi - freqs) / (hi - mid)
+        bank[:, b] = np.clip(np.minimum(rising, falling), 0, None)
+    return bank
+
+class FeatureExtractor:
+    """Log band energies per 20 ms hop, mean-normalised per clip so loudness doesn't matter."""
+
+    def __init__(self, samplerate=STT_SAMPLE_RATE, num_bands=NUM_BANDS):
+        self.window = int(samplerate * WINDOW_MS / 1000)
+        self.hop = int(samplerate * HOP_MS / 1000)
+        self.hann = np.hanning(self.window).astype(np.float32)
+        self.bank = _filterbank(samplerate, self.window, num_bands)
+
+    def __call__(self, audio):
+        if len(audio) < self.window:
+            return np.zeros((0, self.bank.shape[1]), dtype=np.float32)
+        count = 1 + (len(audio) - self.window) // self.hop
+        idx = np.arange(self.window)[None, :] + self.hop * np.arange(count)[:, None]
+        power = np.abs(np.fft.rfft(audio[idx] * self.hann, axis=1)) ** 2
+        feats = np.log(power @ self.bank + 1e-8)
+        return feats - feats.mean(axis=0)
+
+def dtw_match(template, window):
+    """
+    Subsequence DTW: the whole template must be matched, but it may start and end anywhere
+    inside `window`. Normalised by template length so templates of different length compare.
+    Returns (distance, index of the window frame where the match ends).
+    """
+    if not len(template) or not len(window):
+        return float("inf"), None
+    cost = np.sqrt(((template[:, None, :] - window[None, :, :]) ** 2).sum(axis=2))
+    n, m = cost.shape
+    prev = np.zeros(m + 1)  # free start anywhere in the window
+    prev[0] = np.inf
+    for i in range(n):
+        cur = np.empty(m + 1)
+        cur[0] = np.inf
+        row = cost[i]
+        best = np.minimum(prev[1:], prev[:-1])
+        for j in range(1, m + 1):
+            cur[j] = row[j - 1] + min(best[j - 1], cur[j - 1])
+        prev = cur
+    end = int(np.argmin(prev[1:]))
+    return float(prev[1 + end]) / n, end
+
+def dtw_distance(template, window):
+    return dtw_match(template, window)[0]
+
+class KeywordSpotter:
+    """
+    Template-matching wake-word detector.
+
+    Each template is a short recording of the wake word. The newest window of audio (the
+    longest template plus `slack_s`) is searched for each template with subsequence DTW;
+    a distance under `threshold` is a detection. With two or more templates and no explicit
+    threshold, the threshold is derived from how far the templates are from each other.
+    """
+
+    def __init__(self, templates, samplerate=STT_SAMPLE_RATE, threshold=None, slack_s=0.5):
+        if not templates:
+            raise ValueError("KeywordSpotter needs at least one wake-word template.")
+        self.samplerate = samplerate
+        self.features = FeatureExtractor(samplerate)
+        self.templates = [self.features(np.asarray(t, dtype=np.float32)) for t in templates]
+        self.window_samples = max(len(t) for t in templates) + int(slack_s * samplerate)
+        self.threshold = threshold if threshold is not None else self._calibrate()
+
+    def _calibrate(self):
+        pairs = [
+            dtw_distance(a, b)
+            for a in self.templates
+            for b in self.templates
+            if a is not b
+        ]
+        return max(pairs) * 1.3 if pairs else 6.0
+
+    def match(self, audio):
+        """(distance, sample offset in `audio` where the best match ends) over all templates."""
+        feats = self.features(audio)
+        distance, end = min((dtw_match(template, feats) for template in self.templates), key=lambda m: m[0])
+        if end is None:
+            return distance, None
+        return distance, end * self.features.hop + self.features.window
+
+    def distance(self, audio):
+        return self.match(audio)[0]
+
+    def detect(self, audio):
+        return self.distance(audio) < self.threshold
+
+def load_templates(directory, samplerate=STT_SAMPLE_RATE):
+    """Loads every WAV in `directory` as a wake-word template, trimmed to its voiced part."""
+    from pulse_ear.offline_stt import read_wav
+    templates = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.wav"))):
+        templates.append(trim_silence(read_wav(path, samplerate), samplerate))
+    return [t for t in templates if len(t)]
+
+def trim_silence(audio, samplerate=STT_SAMPLE_RATE, frame_ms=10, ratio=0.1):
+    """Cuts leading/trailing frames quieter than `ratio` of the loudest frame."""
+    size = int(samplerate * frame_ms / 1000)
+    count = len(audio) // size
+    if not count:
+        return audio
+    rms = np.sqrt(np.mean(audio[:count * size].reshape(count, size) ** 2, axis=1))
+    voiced = np.nonzero(rms > rms.max() * ratio)[0]
+    if not len(voiced):
+        return audio[:0]
+    return audio[voiced[0] * size:(voiced[-1] + 1) * size]
+
+class WakeWordListener:
+    """
+    Scans an AudioCapture ring buffer for the wake word.
+
+    Every `scan_ms` the newest window is checked, but only when it holds enough energy to be
+    speech, so silence costs almost nothing. On detection the ring position where the wake
+    word's match ends is returned: anything said after it is already buffered and can be
+    streamed to the recognizer from there with `capture.frames(start=position)`.
+    """
+
+    def __init__(self, capture, spotter, scan_ms=200, min_rms=0.01, refractory_s=1.0):
+        self.capture = capture
+        self.spotter = spotter
+        self.scan_samples = int(capture.samplerate * scan_ms / 1000)
+        self.min_rms = min_rms
+        self.refractory = int(capture.samplerate * refractory_s)
+        self._window = np.zeros(spotter.window_samples, dtype=np.float32)
+        self._last_detection = -self.refractory
+        self.detections = 0
+
+    def wait(self, timeout=None, stop_event=None):
+        """Blocks until the wake word is heard; returns the ring position after it, or None."""
+        ring = self.capture.ring
+        position = ring.position
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while stop_event is None or not stop_event.is_set():
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            if not ring.wait_for(position + self.scan_samples, timeout=0.5):
+                continue
+            # If scanning fell behind, skip ahead rather than work through stale audio.
+            position = max(position + self.scan_samples, ring.position - ring.capacity // 2)
+            if position - self._last_detection < self.refractory:
+                continue
+            window = ring.read(position - len(self._window), position, out=self._window)
+            if len(window) < len(self._window):
+                continue
+            if float(np.sqrt(np.mean(window ** 2))) < self.min_rms:
+                continue
+            distance, end = self.spotter.match(window)
+            if distance < self.spotter.threshold:
+                self._last_detection = position
+                self.detections += 1
+                # The window runs up to the scan position; the wake word may end well before it.
+                return position - len(window) + end
+        return None
+
+_capture = None
+_listener = None
+_lock = threading.Lock()
+
+def get_capture():
+    """Starts the shared always-on microphone capture."""
+    global _capture
+    with _lock:
+        if _capture is None:
+            from pulse_ear.audio_capture import AudioCapture
+            from pulse_config.config import CAPTURE_RING_SECONDS
+            _capture = AudioCapture(CAPTURE_RING_SECONDS).start()
+        return _capture
+
+def get_wake_word_listener():
+    """Returns the shared local wake-word listener, or None when no templates are enrolled."""
+    global _listener
+    if _listener is None:
+        from pulse_config.config import WAKE_WORD_TEMPLATE_DIR, WAKE_WORD_THRESHOLD
+        templates = load_templates(WAKE_WORD_TEMPLATE_DIR)
+        if not templates:
+            return None
+        spotter = KeywordSpotter(templates, threshold=WAKE_WORD_THRESHOLD)
+        _listener = WakeWordListener(get_capture(), spotter)
+    return _listener
+
+def enroll(directory, count=3, seconds=1.5):
+    """Records `count` samples of the wake word from the microphone into `directory`."""
+    import wave
+    capture = get_capture()
+    os.makedirs(directory, exist_ok=True)
+    size = int(seconds * capture.samplerate)
+    for i in range(count):
+        input(f"Press Enter, then say the wake word ({i + 1}/{count})...")
+        start = capture.ring.position
+        capture.ring.wait_for(start + size)
+        audio = trim_silence(capture.ring.read(start, start + size), capture.samplerate)
+        path = os.path.join(directory, f"template_{i + 1}.wav")
+        with wave.open(path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(capture.samplerate)
+            wav.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+        print(f"Saved {path}")
+
+if __name__ == "__main__":
+    from pulse_config.config import WAKE_WORD_TEMPLATE_DIR
+    enroll(WAKE_WORD_TEMPLATE_DIR)
@@ -0,0 +1,264 @@
+"""
+Shared local model daemon: loads the local model once and serves it to every cli_agent.py
+process on this machine over a Unix socket (protocol in pulse_brain/model_client.py).
+
+    python pulse_model_server.py [--socket PATH] [--model ID] [--max-batch N]
+
+Requests that arrive together are decoded as one batch, one forward pass per step for all
+of them. A request on its own goes through LocalEngine, which keeps the KV cache of each
+system prompt warm, so a single session is as fast as loading the model in-process.
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+class _Request:
+    """One generate request: the scheduler puts text pieces on `pieces`, then None (or an exception)."""
+
+    def __init__(self, history):
+        self.history = history
+        self.pieces = queue.Queue()
+        self.cancelled = False
+        self.tokens = 0
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _send(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+
+    def handle(self):
+        server = self.server.model_server
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                self._send({"error": "invalid JSON request"})
+                return
+            op = message.get("op")
+            if op == "generate":
+                self._stream(server.submit(message.get("history") or []))
+            elif op == "info":
+                self._send({**server.info(), "done": True})
+            elif op == "stats":
+                self._send({**server.stats(), "done": True})
+            else:
+                self._send({"error": f"unknown op {op!r}"})
+
+    def _stream(self, request):
+        try:
+            while True:
+                piece = request.pieces.get()
+                if piece is None:
+                    self._send({"done": True, "tokens": request.tokens})
+                    return
+                if isinstance(piece, Exception):
+                    self._send({"error": str(piece)})
+                    return
+                self._send({"text": piece})
+        except OSError:
+            # Client went away (closed its stream early): stop generating for it.
+            request.cancelled = True
+
+def _single_events(token_ids):
+    """generate_ids output as generate_batch_ids-style (index, token_id) events for one request."""
+    try:
+        for token_id in token_ids:
+            yield 0, token_id
+        yield 0, None
+    finally:
+        token_ids.close()
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class ModelServer:
+    """
+    Owns the loaded pipeline and runs every generation on one scheduler thread.
+
+    The scheduler takes the next request, waits up to `batch_window` seconds for others
+    (at most `max_batch` in total) and decodes them together with
+    LocalEngine.generate_batch_ids; requests that arrive meanwhile form the next batch.
+    """
+
+    def __init__(self, llm_pipeline, terminators, max_batch=4, batch_window=0.01,
+                 generation_kwargs=None, model_id=None):
+        from pulse_brain.llm_interface import LOCAL_GENERATION_KWARGS
+        from pulse_brain.local_engine import get_local_engine
+
+        self.pipeline = llm_pipeline
+        self.terminators = terminators
+        self.engine = get_local_engine(llm_pipeline)
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.generation_kwargs = dict(generation_kwargs or LOCAL_GENERATION_KWARGS)
+        self.model_id = model_id
+        self.requests = queue.Queue()
+        self._stats = {"requests": 0, "batches": 0, "batched_requests": 0, "largest_batch": 0,
+                       "tokens": 0, "cancelled": 0, "busy_seconds": 0.0}
+        self._stats_lock = threading.Lock()
+        self._server = None
+
+    def info(self):
+        return {"model": self.model_id, "pid": os.getpid(), "max_batch": self.max_batch}
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["tokens_per_s"] = stats["tokens"] / stats["busy_seconds"] if stats["busy_seconds"] else 0.0
+        stats["average_batch"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def submit(self, history):
+        request = _Request(history)
+        self.requests.put(request)
+        return request
+
+    def _next_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.requests.get(timeout=max(0.0, remaining)) if remaining > 0
+                             else self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run_scheduler(self):
+        while True:
+            batch = [request for request in self._next_batch() if not request.cancelled]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            self._generate(batch)
+            tokens = sum(request.tokens for request in batch)
+            self._count(
+                requests=len(batch), batches=1, tokens=tokens, busy_seconds=time.perf_counter() - started,
+                batched_requests=len(batch) if len(batch) > 1 else 0,
+                cancelled=sum(request.cancelled for request in batch),
+            )
+            with self._stats_lock:
+                self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+
+    def _generate(self, batch):
+        from pulse_brain.llm_interface import action_processor_for
+        from pulse_brain.local_engine import TextDecoder
+
+        tokenizer = self.pipeline.tokenizer
+        open_requests = set(range(len(batch)))
+        events = error = None
+        try:
+            processors = [action_processor_for(request.history, tokenizer, self.terminators) for request in batch]
+            decoders = [TextDecoder(tokenizer) for _ in batch]
+            if len(batch) == 1:
+                events = _single_events(self.engine.generate_ids(
+                    batch[0].history, eos_token_id=self.terminators, logits_processor=processors[0],
+                    **self.generation_kwargs,
+                ))
+            else:
+                events = self.engine.generate_batch_ids(
+                    [request.history for request in batch], eos_token_id=self.terminators,
+                    logits_processors=processors, stopped=lambda index: batch[index].cancelled,
+                    **self.generation_kwargs,
+                )
+
+            for index, token_id in events:
+                request = batch[index]
+                if token_id is not None:
+                    request.tokens += 1
+                    text = decoders[index].add(token_id)
+                else:
+                    open_requests.discard(index)
+                    text = decoders[index].flush()
+                if text:
+                    request.pieces.put(text)
+                if token_id is None:
+                    request.pieces.put(None)
+                elif len(batch) == 1 and request.cancelled:
+                    break
+        except Exception as e:
+            print(f"Generation failed: {e}")
+            error = e
+        finally:
+            if events is not None:
+                events.close()
+            # Requests cut short (cancelled or failed) still get their end marker.
+            for index in open_requests:
+                batch[index].pieces.put(error)
+
+    def serve(self, socket_path):
+        """Listens on `socket_path` until interrupted. Only the current user can connect."""
+        from pulse_brain.model_client import connect_model_server
+
+        if os.path.exists(socket_path):
+            if connect_model_server(socket_path) is not None:
+                raise RuntimeError(f"A model server is already running on {socket_path}.")
+            os.unlink(socket_path)  # left over from a server that didn't shut down cleanly
+        os.makedirs(os.path.dirname(socket_path) or ".", mode=0o700, exist_ok=True)
+
+        self._server = _UnixServer(socket_path, _Handler)
+        self._server.model_server = self
+        os.chmod(socket_path, 0o600)
+        threading.Thread(target=self.run_scheduler, daemon=True, name="pulse-model-scheduler").start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+def main():
+    from pulse_config.config import (
+        LOCAL_MODEL_ID, LOCAL_KV_CACHE, LOCAL_CONSTRAINED_JSON, MODEL_SERVER_SOCKET, MODEL_SERVER_MAX_BATCH, MODEL_SERVER_BATCH_WINDOW,
+        ROUTER_SYSTEM_PROMPT, FUSED_ROUTER_SYSTEM_PROMPT, CLI_AGENT_SYSTEM_PROMPT,
+    )
+    from pulse_brain import json_actions
+    from pulse_brain.llm_interface import load_model
+
+    parser = argparse.ArgumentParser(description="Serve the local model to PulseAI clients over a Unix socket")
+    parser.add_argument("--socket", default=MODEL_SERVER_SOCKET)
+    parser.add_argument("--model", default=LOCAL_MODEL_ID)
+    parser.add_argument("--max-batch", type=int, default=MODEL_SERVER_MAX_BATCH,
+                        help="most concurrent requests decoded together")
+    parser.add_argument("--batch-window", type=float, default=MODEL_SERVER_BATCH_WINDOW,
+                        help="seconds to wait for more requests before starting a batch")
+    args = parser.parse_args()
+    if not hasattr(socket, "AF_UNIX"):
+        raise SystemExit("Unix sockets are not available on this platform.")
+
+    print(f"Loading local model: {args.model}...")
+    started = time.perf_counter()
+    llm_pipeline, terminators = load_model(args.model)
+    server = ModelServer(llm_pipeline, terminators, args.max_batch, args.batch_window, model_id=args.model)
+    if LOCAL_KV_CACHE:
+        for prompt in (ROUTER_SYSTEM_PROMPT, FUSED_ROUTER_SYSTEM_PROMPT, CLI_AGENT_SYSTEM_PROMPT):
+            server.engine.warm_up(prompt)
+    if LOCAL_CONSTRAINED_JSON:
+        json_actions.warm_up(llm_pipeline.tokenizer)
+    print(f"Model ready in {time.perf_counter() - started:.1f}s. Listening on {args.socket} (Ctrl+C to stop).")
+
+    try:
+        server.serve(args.socket)
+    except KeyboardInterrupt:
+        pass
+    stats = server.stats()
+    print(f"\nServed {stats['requests']} requests in {stats['batches']} batches "
+          f"({stats['average_batch']:.1f} avg, {stats['largest_batch']} max), {stats['tokens']} tokens at "
+          f"{stats['tokens_per_s']:.1f} tokens/s, {stats['cancelled']} cancelled")
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,39 @@
-import subprocess
+from pulse_config.config import (
+    SHELL_TIMEOUT, SHELL_MAX_OUTPUT_BYTES, SHELL_SUMMARY_HEAD_BYTES, SHELL_SUMMARY_TAIL_BYTES, SHELL_ECHO_OUTPUT
+)
+from pulse_tools.shell_engine import run_command
+from pulse_config.tracing import span
 
-def execute_shell_command(command):
+def execute_shell_command(command, session=None):
     """
     Executes a given shell command in the terminal and returns its output or error.
+    Output is streamed to the console as it arrives; the returned text is a bounded
+    head/tail summary with the exit code, and the command is stopped if it exceeds the
+    configured time or output limits. With a ShellSession the command runs in that
+    persistent shell instead of a fresh one.
     """
     if not command:
         return "No command provided to execute."
         
     try:
         print(f"Executing CLI command: {command}")
-        result = subprocess.run(command, shell=True, capture_output=True, text=True, check=True)
+        limits = {
+            "timeout": SHELL_TIMEOUT,
+            "max_output_bytes": SHELL_MAX_OUTPUT_BYTES,
+            "head_bytes": SHELL_SUMMARY_HEAD_BYTES,
+            "tail_bytes": SHELL_SUMMARY_TAIL_BYTES,
+        }
+        with span("shell.command", persistent=session is not None) as trace:
+            if session is not None:
+                result = session.run(command, **limits)
+            else:
+                result = run_command(command, echo=SHELL_ECHO_OUTPUT, **limits)
+            summary = result.summary()
+            trace.set(exit_code=result.exit_code, output_bytes=result.total_bytes, summary_bytes=len(summary))
+        if result.exit_code != 0:
+            print(f"Command failed with exit code {result.exit_code}")
+        return summary
         
-        output = result.stdout.strip()
-        if not output:
-            return "Command executed successfully with no output."
-        return output
-        
-    except subprocess.CalledProcessError as e:
-        print(f"Command failed: {e.stderr.strip()}")
-        return f"Command failed with error: {e.stderr.strip()}"
     except Exception as e:
         print(f"An error occurred: {str(e)}")
-        return f"An error occurred while executing command: {str(e)}"
\ No newline at end of file
+        return f"An error occurred while executing command: {str(e)}"
@@ -0,0 +1,163 @@
+import codecs
+import contextvars
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+class OutputBuffer:
+    """
+    Bounded capture of a command's output: the first `head_bytes` are kept as-is and the
+    last `tail_bytes` in a ring, so memory stays constant no matter how much is printed.
+    """
+
+    def __init__(self, head_bytes=2000, tail_bytes=2000):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        with self._lock:
+            self.total_bytes += len(data)
+            room = self.head_bytes - len(self.head)
+            if room > 0:
+                self.head += data[:room]
+                data = data[room:]
+            if data:
+                self.tail += data
+                # Trim lazily so the ring costs amortised O(1) per byte.
+                if len(self.tail) > 2 * self.tail_bytes:
+                    del self.tail[:len(self.tail) - self.tail_bytes]
+
+    def summary(self):
+        """Head and tail of the output with a marker for whatever was dropped in between."""
+        with self._lock:
+            tail = bytes(self.tail[-self.tail_bytes:]) if self.tail_bytes else b""
+            omitted = self.total_bytes - len(self.head) - len(tail)
+            head = bytes(self.head)
+        head = head.decode("utf-8", errors="replace")
+        tail = tail.decode("utf-8", errors="replace")
+        if omitted > 0:
+            return f"{head.rstrip()}\n... [{omitted} bytes omitted] ...\n{tail.lstrip()}".strip()
+        return (head + tail).strip()
+
+class CommandResult:
+    def __init__(self, exit_code, output, total_bytes, duration, timed_out=False, output_limited=False, notes=None):
+        self.exit_code = exit_code
+        self.output = output
+        self.total_bytes = total_bytes
+        self.duration = duration
+        self.timed_out = timed_out
+        self.output_limited = output_limited
+        self.notes = notes or []
+
+    def summary(self):
+        """Compact text handed back to the model."""
+        notes = []
+        if self.timed_out:
+            notes.append(f"Command timed out after {self.duration:.0f}s and was stopped.")
+        if self.output_limited:
+            notes.append(f"Command output exceeded the size limit and was stopped after {self.total_bytes} bytes.")
+        notes.extend(self.notes)
+        if self.exit_code == 0 and not self.output and not notes:
+            return "Command executed successfully with no output."
+        lines = [f"Exit code: {self.exit_code}"] + notes
+        if self.output:
+            lines.append(self.output)
+        return "\n".join(lines)
+
+def _echo(text):
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+def _pump(stream, buffer, limit_event, max_output_bytes, echo):
+    """Reads a pipe until EOF, streaming it to the console and into the bounded buffer."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    read = getattr(stream, "read1", stream.read)
+    while True:
+        data = read(4096)
+        if not data:
+            break
+        buffer.write(data)
+        if echo:
+            _echo(decoder.decode(data))
+        if max_output_bytes and buffer.total_bytes > max_output_bytes:
+            limit_event.set()
+    if echo:
+        _echo(decoder.decode(b"", final=True))
+
+def kill_process_group(process):
+    try:
+        if os.name == "nt":
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+def run_command(command, timeout=60, max_output_bytes=1_000_000, head_bytes=2000, tail_bytes=2000, echo=True):
+    """
+    Runs `command` through the shell, streaming stdout/stderr to the console while keeping
+    only a bounded head/tail of it. The command (and its process group) is killed when it
+    exceeds `timeout` seconds or `max_output_bytes` of output.
+    """
+    buffer = OutputBuffer(head_bytes, tail_bytes)
+    limit_event = threading.Event()
+    popen_kwargs = {}
+    if os.name == "nt":
+        popen_kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        popen_kwargs["start_new_session"] = True
+
+    started = time.monotonic()
+    process = subprocess.Popen(
+        command,
+        shell=True,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **popen_kwargs,
+    )
+    # Each reader runs in a copy of the caller's context, so a background job's echo stays in its log.
+    readers = [
+        threading.Thread(target=contextvars.copy_context().run,
+                         args=(_pump, pipe, buffer, limit_event, max_output_bytes, echo), daemon=True)
+        for pipe in (process.stdout, process.stderr)
+    ]
+    for reader in readers:
+        reader.start()
+
+    timed_out = False
+    deadline = started + timeout if timeout else None
+    while True:
+        try:
+            process.wait(timeout=0.05)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        if limit_event.is_set():
+            kill_process_group(process)
+            break
+        if deadline and time.monotonic() > deadline:
+            timed_out = True
+            kill_process_group(process)
+            break
+
+    exit_code = process.wait()
+    for reader in readers:
+        reader.join(timeout=1)
+    duration = time.monotonic() - started
+
+    return CommandResult(
+        exit_code,
+        buffer.summary(),
+        buffer.total_bytes,
+        duration,
+        timed_out=timed_out,
+        output_limited=limit_event.is_set(),
+    )
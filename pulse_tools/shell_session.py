@@ -0,0 +1,189 @@
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from pulse_tools.shell_engine import CommandResult, OutputBuffer, kill_process_group
+
+class ShellSession:
+    """
+    One long-lived bash process for the duration of an agent task.
+
+    Commands are written to the shell's stdin and evaluated in the shell itself, so `cd`,
+    exported variables and activated virtualenvs carry over between steps, and there is no
+    fork/exec of a new shell per command. Each command is followed by a unique sentinel line
+    carrying its exit status and the working directory. If a command times out, floods
+    output or the shell dies, the shell is restarted in the last known directory.
+    """
+
+    def __init__(self, shell=None, echo=True):
+        self.shell = shell or shutil.which("bash")
+        if not self.shell:
+            raise RuntimeError("bash is required for a persistent shell session.")
+        self.echo = echo
+        self.cwd = os.getcwd()
+        self.restarts = 0
+        self.process = None
+        self._chunks = None
+        self._start()
+
+    def _start(self):
+        self.process = subprocess.Popen(
+            [self.shell, "--noprofile", "--norc"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=self.cwd if os.path.isdir(self.cwd) else None,
+            start_new_session=True,
+            bufsize=0,
+        )
+        self._chunks = queue.Queue()
+        threading.Thread(target=self._read, args=(self.process.stdout, self._chunks), daemon=True).start()
+
+    @staticmethod
+    def _read(stream, chunks):
+        while True:
+            data = stream.read(4096)
+            if not data:
+                chunks.put(None)
+                return
+            chunks.put(data)
+
+    def _restart(self):
+        kill_process_group(self.process)
+        self.process.wait()
+        self.restarts += 1
+        self._start()
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _emit(self, data, buffer):
+        buffer.write(data)
+        if self.echo:
+            sys.stdout.write(data.decode("utf-8", errors="replace"))
+            sys.stdout.flush()
+
+    def run(self, command, timeout=60, max_output_bytes=1_000_000, head_bytes=2000, tail_bytes=2000):
+        """Runs `command` in the session and returns a CommandResult."""
+        if not self.alive():
+            self._restart()
+
+        token = uuid.uuid4().hex
+        marker = f"__PULSE_DONE_{token}__".encode()
+        eof = f"__PULSE_EOF_{token}__"
+        # Reading the command through a quoted heredoc and eval-ing it means a syntax error
+        # fails that one command instead of leaving the shell waiting for more input.
+        script = (
+            f"IFS= read -r -d '' __pulse_cmd <<'{eof}'\n{command}\n{eof}\n"
+            f"eval \"$__pulse_cmd\" < /dev/null\n"
+            f"printf '\\n%s:%s:%s\\n' '{marker.decode()}' \"$?\" \"$PWD\"\n"
+        )
+
+        buffer = OutputBuffer(head_bytes, tail_bytes)
+        started = time.monotonic()
+        deadline = started + timeout if timeout else None
+        try:
+            self.process.stdin.write(script.encode())
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self._restart()
+            self.process.stdin.write(script.encode())
+            self.process.stdin.flush()
+
+        pending = bytearray()
+        exit_code = None
+        timed_out = output_limited = shell_exited = False
+        while exit_code is None:
+            remaining = deadline - time.monotonic() if deadline else None
+            if remaining is not None and remaining <= 0:
+                timed_out = True
+                break
+            try:
+                data = self._chunks.get(timeout=remaining)
+            except queue.Empty:
+                timed_out = True
+                break
+            if data is None:
+                shell_exited = True
+                break
+
+            pending += data
+            index = pending.find(marker)
+            if index >= 0:
+                line_end = pending.find(b"\n", index + len(marker))
+                if line_end < 0:
+                    continue  # status line not complete yet
+                output = pending[:index]
+                if output.endswith(b"\n"):
+                    output = output[:-1]
+                self._emit(bytes(output), buffer)
+                status_line = bytes(pending[index + len(marker):line_end]).decode(errors="replace")
+                status, _, cwd = status_line.lstrip(":").partition(":")
+                exit_code = int(status) if status.isdigit() else -1
+                if cwd:
+                    self.cwd = cwd
+                break
+
+            # Hold back enough bytes that a marker split across reads is still found.
+            safe = len(pending) - len(marker) - 1
+            if safe > 0:
+                self._emit(bytes(pending[:safe]), buffer)
+                del pending[:safe]
+            if max_output_bytes and buffer.total_bytes > max_output_bytes:
+                output_limited = True
+                break
+
+        notes = []
+        if exit_code is None:
+            if pending and not shell_exited:
+                self._emit(bytes(pending), buffer)
+            if shell_exited:
+                self.process.wait()
+                exit_code = self.process.returncode
+                notes.append("The shell exited.")
+            else:
+                exit_code = -9
+            self._restart()
+            notes.append(f"Started a new shell session in {self.cwd}; environment changes were reset.")
+
+        return CommandResult(
+            exit_code,
+            buffer.summary(),
+            buffer.total_bytes,
+            time.monotonic() - started,
+            timed_out=timed_out,
+            output_limited=output_limited,
+            notes=notes,
+        )
+
+    def interrupt(self):
+        """Kills the running command (from another thread); the session restarts for the next one."""
+        process = self.process
+        if process is not None and process.poll() is None:
+            kill_process_group(process)
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        kill_process_group(self.process)
+        self.process.wait()
+        self.process = None
+
+def open_shell_session(echo=True):
+    """Returns a persistent ShellSession, or None where one is not supported (e.g. Windows, no bash)."""
+    if os.name == "nt":
+        return None
+    try:
+        return ShellSession(echo=echo)
+    except (RuntimeError, OSError) as e:
+        print(f"Persistent shell unavailable ({e}); running each command in a new shell.")
+        return None